@@ -11,6 +11,9 @@ from elasticsearch import Elasticsearch
 import operator
 import numpy as np
 import pickle
+import itertools
+
+from common.utils import iter_json_file
 
 # PUNCT_TO_SPACE = dict(zip(list(string.punctuation), list(' ' * len(string.punctuation))))
 PUNCT_TO_SPACE = str.maketrans(string.punctuation,
@@ -57,20 +60,18 @@ class ESSearcher():
 
 
 def load_multi_files(files: List[str], max_counts: List[int] = None):
+    '''
+    iterate over the codes of the files, which are read while the codes are consumed
+    '''
     if type(files) is not list:
         files = [files]
-    dataset = []
     max_counts = max_counts or [None] * len(files)
     for file, max_count in zip(files, max_counts):
-        try:
-            td = json.load(open(file, 'r'))
-        except Exception:
-            td = [json.loads(line) for line in open(file, 'r')]
-        if max_count:
-            td = td[:max_count]
-        print('load {} from {}'.format(len(td), file))
-        dataset.extend(td)
-    return dataset
+        count = 0
+        for code in itertools.islice(iter_json_file(file), max_count or None):
+            count += 1
+            yield code
+        print('load {} from {}'.format(count, file))
 
 
 def aug_iter(ess, dataset, field, topk, rewritten=True):
@@ -1,10 +1,19 @@
 # coding=utf-8
+import hashlib
+import os
+import pickle
 import sys
 from collections import OrderedDict, Counter
 from itertools import chain
 
+import numpy as np
+
 from asdl.utils.utils import remove_comment
 
+# version of the tables built by `ASDLGrammar._compile`, to increment when they change so that
+# the grammars pickled before, e.g. in the cache of `ASDLGrammar.from_file`, are recompiled
+GRAMMAR_CACHE_VERSION = 1
+
 
 class ASDLGrammar(object):
     """
@@ -28,6 +37,8 @@ class ASDLGrammar(object):
             self.root_type = productions[0].type
         # number of constructors
         self.size = sum(len(head) for head in self._productions.values())
+        self._sorted_productions = sorted(chain.from_iterable(self._productions.values()),
+                                          key=lambda x: repr(x))
 
         # get entities to their ids map
         self.prod2id = {prod: i for i, prod in enumerate(self.productions)}
@@ -38,13 +49,54 @@ class ASDLGrammar(object):
         self.id2type = {i: type for i, type in enumerate(self.types)}
         self.id2field = {i: field for i, field in enumerate(self.fields)}
 
+        self._compile()
+
+    def _compile(self):
+        """
+        build the tables used in decoding and batching, indexed by the ids of
+        the types, fields and productions
+        """
+        if not hasattr(self, '_sorted_productions'):
+            self._sorted_productions = sorted(chain.from_iterable(self._productions.values()),
+                                              key=lambda x: repr(x))
+
+        self._primitive_types = [type for type in self.types if isinstance(type, ASDLPrimitiveType)]
+        self._composite_types = [type for type in self.types if isinstance(type, ASDLCompositeType)]
+        self._composite_type_set = set(self._composite_types)
+        self._primitive_type_set = set(self._primitive_types)
+
+        # (type_num,) whether each type is composite
+        self.composite_type_mask = np.array([isinstance(type, ASDLCompositeType) for type in self.types],
+                                            dtype=bool)
+        # (production_num,) the type id of each production
+        self.production_type_ids = np.array([self.type2id[prod.type] for prod in self.productions],
+                                            dtype=np.int64)
+        # (type_num, production_num) the productions of each type
+        self.type_production_mask = np.zeros((len(self.types), self.size), dtype=bool)
+        self.type_production_mask[self.production_type_ids, np.arange(self.size)] = True
+        # ids of the productions of each type, in the order of `grammar[type]`
+        self.type_production_ids = [[self.prod2id[prod] for prod in self._productions.get(type, [])]
+                                    for type in self.types]
+        # ids of the fields of each production
+        self.production_field_ids = [[self.field2id[field] for field in prod.fields]
+                                     for prod in self.productions]
+        # (field_num,) the type id of each field
+        self.field_type_ids = np.array([self.type2id[field.type] for field in self.fields],
+                                       dtype=np.int64)
+        self._compiled_version = GRAMMAR_CACHE_VERSION
+
+    def __setstate__(self, state):
+        # grammars pickled before the tables existed, or with older tables
+        self.__dict__.update(state)
+        if state.get('_compiled_version') != GRAMMAR_CACHE_VERSION:
+            self._compile()
+
     def __len__(self):
         return self.size
 
     @property
     def productions(self):
-        return sorted(chain.from_iterable(self._productions.values()),
-                      key=lambda x: repr(x))
+        return self._sorted_productions
 
     def __getitem__(self, datum):
         if isinstance(datum, str):
@@ -88,17 +140,90 @@ class ASDLGrammar(object):
 
     @property
     def primitive_types(self):
-        return filter(lambda x: isinstance(x, ASDLPrimitiveType), self.types)
+        return self._primitive_types
 
     @property
     def composite_types(self):
-        return filter(lambda x: isinstance(x, ASDLCompositeType), self.types)
+        return self._composite_types
 
     def is_composite_type(self, asdl_type):
-        return asdl_type in self.composite_types
+        return asdl_type in self._composite_type_set
 
     def is_primitive_type(self, asdl_type):
-        return asdl_type in self.primitive_types
+        return asdl_type in self._primitive_type_set
+
+    def check_ids(self, other):
+        """
+        check that the ids of the productions, types and fields are the same as the ones
+        of `other`, e.g. the grammar saved with a model
+        """
+        for entity, attr in (('production', 'id2prod'), ('type', 'id2type'), ('field', 'id2field')):
+            ids = getattr(self, attr)
+            other_ids = getattr(other, attr)
+            if len(ids) != len(other_ids):
+                raise ValueError(f'the grammars have a different number of {entity}s: '
+                                 f'{len(ids)} vs. {len(other_ids)}')
+            for i in range(len(ids)):
+                if repr(ids[i]) != repr(other_ids[i]):
+                    raise ValueError(f'{entity} #{i} differs between the grammars: '
+                                     f'{ids[i]} vs. {other_ids[i]}')
+
+        if self.root_type != other.root_type:
+            raise ValueError(f'the grammars have different root types: '
+                             f'{self.root_type} vs. {other.root_type}')
+
+    @property
+    def id_digest(self):
+        """
+        digest of the ids of the productions, types and fields and of the root type, the
+        same for the grammars which pass `check_ids`, e.g. to key data computed from the ids
+        """
+        digest = self.__dict__.get('_id_digest')
+        if digest is None:
+            tables = [[repr(ids[i]) for i in range(len(ids))] for ids in (self.id2prod, self.id2type, self.id2field)]
+            digest = self._id_digest = hashlib.sha1(repr((tables, repr(self.root_type))).encode('utf-8')).hexdigest()
+
+        return digest
+
+    @staticmethod
+    def from_file(asdl_file, root_production=None, cache_dir=None):
+        """
+        load the grammar specified in an ASDL file. The compiled grammar is pickled in
+        `cache_dir` (`__grammar_cache__` next to the ASDL file by default), keyed on the
+        content of the file, the root production and `GRAMMAR_CACHE_VERSION`, and later
+        loads read it from there.
+        """
+        asdl_text = open(asdl_file).read()
+        if root_production is not None:
+            root_production = tuple(root_production)
+
+        key = hashlib.sha1(repr((GRAMMAR_CACHE_VERSION, asdl_text, root_production)).encode('utf-8')).hexdigest()
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(asdl_file)), '__grammar_cache__')
+        cache_file = os.path.join(cache_dir, f'{os.path.basename(asdl_file)}.{key[:16]}.pkl')
+
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as f:
+                    cached_key, grammar = pickle.load(f)
+                if cached_key == key:
+                    return grammar
+            except Exception as e:
+                print(f'Warning: ignoring the invalid grammar cache [{cache_file}]: {e}', file=sys.stderr)
+
+        grammar = ASDLGrammar.from_text(asdl_text, root_production)
+
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # write to a temporary file first, so that concurrent jobs never read a partial cache
+            tmp_cache_file = f'{cache_file}.{os.getpid()}.tmp'
+            with open(tmp_cache_file, 'wb') as f:
+                pickle.dump((key, grammar), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_cache_file, cache_file)
+        except OSError as e:
+            print(f'Warning: cannot write the grammar cache [{cache_file}]: {e}', file=sys.stderr)
+
+        return grammar
 
     @staticmethod
     def from_text(text, root_production=None):
@@ -198,10 +323,30 @@ class ASDLProduction(object):
         return self.constructor[field_name]
 
     def __hash__(self):
-        h = hash(self.type) ^ hash(self.constructor)
+        # productions are looked up for each action, cache their hash
+        h = self.__dict__.get('_hash')
+        if h is None:
+            h = self._hash = hash(self.type) ^ hash(self.constructor)
 
         return h
 
+    @property
+    def fingerprint(self):
+        """8 bytes digest of the production, the same in all processes, see
+        `AbstractSyntaxTree.fingerprint`"""
+        fingerprint = self.__dict__.get('_fingerprint')
+        if fingerprint is None:
+            fingerprint = self._fingerprint = hashlib.blake2b(repr(self).encode(), digest_size=8).digest()
+
+        return fingerprint
+
+    def __getstate__(self):
+        # string hashes are salted per process
+        state = dict(self.__dict__)
+        state.pop('_hash', None)
+
+        return state
+
     def __eq__(self, other):
         return isinstance(other, ASDLProduction) and \
                self.type == other.type and \
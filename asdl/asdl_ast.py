@@ -1,5 +1,7 @@
 # coding=utf-8
 
+import hashlib
+
 try:
     from cStringIO import StringIO
 except Exception:
@@ -9,6 +11,10 @@ from .asdl import *
 
 
 class AbstractSyntaxTree(object):
+    # cached content hash, see `fingerprint`, also the default of the trees
+    # saved before it was added
+    _fingerprint = None
+
     def __init__(self, production, realized_fields=None):
         self.production = production
 
@@ -64,9 +70,57 @@ class AbstractSyntaxTree(object):
             else:
                 for value in old_field.as_value_list:
                     new_field.add_value(value)
+        new_tree._fingerprint = self._fingerprint
+
+        return new_tree
+
+    def shallow_copy(self):
+        """copy this node and its fields, the child nodes are shared with the original node"""
+        new_tree = AbstractSyntaxTree(self.production)
+        new_tree.created_time = self.created_time
+        for old_field, new_field in zip(self.fields, new_tree.fields):
+            new_field._not_single_cardinality_finished = old_field._not_single_cardinality_finished
+            if old_field.cardinality == 'multiple' and old_field.value is not None:
+                new_field.value = list(old_field.value)
+            else:
+                new_field.value = old_field.value
+        new_tree._fingerprint = self._fingerprint
 
         return new_tree
 
+    def copy_path(self, node):
+        """
+        copy the nodes on the path from this (root) node to `node`, all the other subtrees
+        are shared with the original tree. Only the nodes on that path may be modified in the copy.
+
+        Returns:
+            the copied nodes on the path, from the root to `node`
+        """
+        new_child = node.shallow_copy()
+        new_path = [new_child]
+        child = node
+        while child is not self:
+            parent_field = child.parent_field
+            parent = parent_field.parent_node
+            new_parent = parent.shallow_copy()
+
+            field_idx = next(i for i, field in enumerate(parent.fields) if field is parent_field)
+            new_parent_field = new_parent.fields[field_idx]
+            if new_parent_field.cardinality == 'multiple':
+                value_idx = next(i for i in reversed(range(len(parent_field.value)))
+                                 if parent_field.value[i] is child)
+                new_parent_field.value[value_idx] = new_child
+            else:
+                new_parent_field.value = new_child
+            new_child.parent_field = new_parent_field
+
+            new_path.append(new_parent)
+            child, new_child = parent, new_parent
+
+        new_path.reverse()
+
+        return new_path
+
     def to_string(self, sb=None):
         is_root = False
         if sb is None:
@@ -102,12 +156,54 @@ class AbstractSyntaxTree(object):
         if is_root:
             return sb.getvalue()
 
-    def __hash__(self):
-        code = hash(self.production)
-        for field in self.fields:
-            code = code + 37 * hash(field)
+    @property
+    def fingerprint(self):
+        """
+        64-bit content hash of this tree, the same for the trees built by the same actions
+        whatever their creation times, and in all processes. The fingerprint of a node is
+        computed from those of its child nodes (Merkle-style) and cached, adding a value to
+        a field clears the cached fingerprints of the node and of its ancestors.
+        """
+        if self._fingerprint is None:
+            # post-order walk of the nodes without fingerprint, deep trees would exceed
+            # the recursion limit
+            stack = [self]
+            while stack:
+                node = stack[-1]
+                children = [child for field in node.fields for child in field.as_value_list
+                            if isinstance(child, AbstractSyntaxTree) and child._fingerprint is None]
+                if children:
+                    stack.extend(children)
+                    continue
+
+                stack.pop()
+                digest = hashlib.blake2b(node.production.fingerprint, digest_size=8)
+                for field in node.fields:
+                    value = field.value
+                    if field.cardinality == 'multiple':
+                        # no value and an empty list are built by the same actions
+                        digest.update(b'L%d:' % len(value or ()))
+                        for child in value or ():
+                            digest.update(_value_bytes(child))
+                    elif value is None:
+                        digest.update(b'N')
+                    else:
+                        digest.update(b'V' + _value_bytes(value))
+                node._fingerprint = int.from_bytes(digest.digest(), 'little')
 
-        return code
+        return self._fingerprint
+
+    def clear_fingerprint(self):
+        """clear the cached fingerprints of this node and of its ancestors"""
+        node = self
+        # a node has a fingerprint only if its child nodes have one, so the
+        # ancestors of a node without fingerprint have none
+        while node is not None and node._fingerprint is not None:
+            node._fingerprint = None
+            node = node.parent_field.parent_node if node.parent_field is not None else None
+
+    def __hash__(self):
+        return self.fingerprint
 
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
@@ -148,6 +244,16 @@ class AbstractSyntaxTree(object):
         return node_num
 
 
+def _value_bytes(value):
+    """the bytes of a field value in the fingerprint of its node"""
+    if isinstance(value, AbstractSyntaxTree):
+        return b'T' + value._fingerprint.to_bytes(8, 'little')
+    # the type name keeps e.g. 1 and '1' apart
+    value_type = type(value).__name__.encode('utf-8')
+    value = str(value).encode('utf-8')
+    return b'P%s:%d:' % (value_type, len(value)) + value
+
+
 class RealizedField(Field):
     """wrapper of field realized with values"""
     def __init__(self, field, value=None, parent=None):
@@ -180,6 +286,8 @@ class RealizedField(Field):
     def add_value(self, value):
         if isinstance(value, AbstractSyntaxTree):
             value.parent_field = self
+        if self.parent_node is not None:
+            self.parent_node.clear_fingerprint()
 
         if self.cardinality == 'multiple':
             if self.value is None:
@@ -192,6 +300,8 @@ class RealizedField(Field):
 
         if self.cardinality == 'multiple' and self.value is None:
             self.value = []
+            if self.parent_node is not None:
+                self.parent_node.clear_fingerprint()
 
     @property
     def as_value_list(self):
@@ -14,6 +14,10 @@ class Hypothesis(object):
         self.frontier_field = None
         self._value_buffer = []
 
+        # stack of the (node, field index) frames of the nodes being generated, from the root
+        # to the frontier node. The fields of a node before its field index are finished.
+        self._frontier_stack = []
+
         # record the current time step
         self.t = 0
 
@@ -24,6 +28,7 @@ class Hypothesis(object):
               f'at the beginning of decoding')
 
             self.tree = AbstractSyntaxTree(action.production)
+            self._frontier_stack.append((self.tree, 0))
             self.update_frontier_info()
         elif self.frontier_node:
             if isinstance(self.frontier_field.type, ASDLCompositeType):
@@ -31,6 +36,7 @@ class Hypothesis(object):
                     field_value = AbstractSyntaxTree(action.production)
                     field_value.created_time = self.t
                     self.frontier_field.add_value(field_value)
+                    self._frontier_stack.append((field_value, 0))
                     self.update_frontier_info()
                 elif isinstance(action, ReduceAction):
                     assert self.frontier_field.cardinality in ('optional',
@@ -81,33 +87,21 @@ class Hypothesis(object):
         self.actions.append(action)
 
     def update_frontier_info(self):
-        def _find_frontier_node_and_field(tree_node):
-            if tree_node:
-                for field in tree_node.fields:
-                    # if it's an intermediate node, check its children
-                    if isinstance(field.type,
-                                  ASDLCompositeType) and field.value:
-                        if field.cardinality in ('single', 'optional'):
-                            iter_values = [field.value]
-                        else:
-                            iter_values = field.value
-
-                        for child_node in iter_values:
-                            result = _find_frontier_node_and_field(child_node)
-                            if result: return result
+        # pop the frames of the finished nodes, the frontier is the first
+        # unfinished field of the node on top of the stack
+        while self._frontier_stack:
+            tree_node, field_idx = self._frontier_stack[-1]
+            while field_idx < len(tree_node.fields) and tree_node.fields[field_idx].finished:
+                field_idx += 1
 
-                    # now all its possible children are checked
-                    if not field.finished:
-                        return tree_node, field
+            if field_idx < len(tree_node.fields):
+                self._frontier_stack[-1] = (tree_node, field_idx)
+                self.frontier_node, self.frontier_field = tree_node, tree_node.fields[field_idx]
+                return
 
-                return None
-            else: return None
+            self._frontier_stack.pop()
 
-        frontier_info = _find_frontier_node_and_field(self.tree)
-        if frontier_info:
-            self.frontier_node, self.frontier_field = frontier_info
-        else:
-            self.frontier_node, self.frontier_field = None, None
+        self.frontier_node, self.frontier_field = None, None
 
     def clone_and_apply_action(self, action):
         new_hyp = self.copy()
@@ -115,20 +109,41 @@ class Hypothesis(object):
 
         return new_hyp
 
+    def copy_tree(self):
+        """
+        copy the tree for a new hypothesis. Only the nodes on the frontier stack can be
+        modified by later actions, so only they are copied and the finished subtrees are shared.
+
+        Returns:
+            the copied tree and frontier stack
+        """
+        if not self._frontier_stack:
+            # no action can be applied on an empty or completed tree
+            return self.tree, []
+
+        new_path = self.tree.copy_path(self.frontier_node)
+        assert len(new_path) == len(self._frontier_stack)
+        new_frontier_stack = [(new_node, field_idx)
+                              for new_node, (_, field_idx) in zip(new_path, self._frontier_stack)]
+
+        return new_path[0], new_frontier_stack
+
     def copy(self):
         new_hyp = Hypothesis()
-        if self.tree:
-            new_hyp.tree = self.tree.copy()
+        new_hyp.tree, new_hyp._frontier_stack = self.copy_tree()
+        new_hyp.update_frontier_info()
 
         new_hyp.actions = list(self.actions)
         new_hyp.score = self.score
         new_hyp._value_buffer = list(self._value_buffer)
         new_hyp.t = self.t
 
-        new_hyp.update_frontier_info()
-
         return new_hyp
 
+    @property
+    def last_action(self):
+        return self.actions[-1] if self.actions else None
+
     @property
     def completed(self):
         return self.tree and self.frontier_field is None
@@ -16,8 +16,7 @@ from asdl.hypothesis import *
 
 
 # read in the grammar specification of Cpp SE8, defined in ASDL
-asdl_text = open('cpp_asdl.simplified.txt').read()
-grammar = ASDLGrammar.from_text(asdl_text)
+grammar = ASDLGrammar.from_file('cpp_asdl.simplified.txt')
 # print(grammar, file=sys.stderr)
 
 # initialize the Cpp transition parser
@@ -15,8 +15,7 @@ from asdl.hypothesis import *
 
 
 # read in the grammar specification of Java SE8, defined in ASDL
-asdl_text = open('java_asdl.simplified.txt').read()
-grammar = ASDLGrammar.from_text(asdl_text)
+grammar = ASDLGrammar.from_file('java_asdl.simplified.txt')
 # print(grammar, file=sys.stderr)
 
 # initialize the Java transition parser
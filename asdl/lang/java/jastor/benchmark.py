@@ -0,0 +1,84 @@
+"""
+Benchmark of the code generator on the trees of Java files and of the snippets of a
+Concode corpus, possibly against another version of jastor whose output must be the same
+
+    python -m asdl.lang.java.jastor.benchmark [--concode concode_dev.json]
+        [--reference path/to/other/jastor] [java files or directories...]
+
+The reference jastor directory can be taken from another commit with
+`git worktree add /tmp/reference <commit>`, its path being then
+/tmp/reference/asdl/lang/java/jastor.
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+
+from javalang import parse, tokenizer
+from javalang.benchmark import load_concode_snippets, load_java_files, time_function
+from javalang.parser import JavaSyntaxError
+
+from . import to_source
+
+
+def load_jastor(path):
+    """ the jastor package in the directory `path`, imported apart from this one
+    """
+    spec = importlib.util.spec_from_file_location('reference_jastor', os.path.join(path, '__init__.py'),
+                                                  submodule_search_locations=[path])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def parse_trees(sources, parse_function):
+    trees = []
+    for source in sources:
+        try:
+            trees.append(parse_function(source))
+        except (JavaSyntaxError, tokenizer.LexerError):
+            pass
+
+    return trees
+
+
+def benchmark_code_generator(name, trees, repeat, reference=None):
+    sources = [to_source(tree) for tree in trees]
+    size = sum(len(source) for source in sources)
+    elapsed = time_function(to_source, trees, repeat)
+    print(f'{name}: {len(trees)} trees, {size / 1e6:.2f}M characters', file=sys.stderr)
+    print(f'  to_source  {elapsed:.3f}s  {len(trees) / elapsed:.0f} trees/s', file=sys.stderr)
+
+    if reference is not None:
+        reference_sources = [reference.to_source(tree) for tree in trees]
+        different = sum(source != reference_source
+                        for source, reference_source in zip(sources, reference_sources))
+        reference_time = time_function(reference.to_source, trees, repeat)
+        print(f'  reference  {reference_time:.3f}s  {len(trees) / reference_time:.0f} trees/s  '
+              f'speedup x{reference_time / elapsed:.2f}  {different} different outputs', file=sys.stderr)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='benchmark of the Java code generator')
+    arg_parser.add_argument('paths', type=str, nargs='*',
+                            default=[os.path.join(os.path.dirname(__file__), '..', 'test')],
+                            help='Java files or directories of Java files')
+    arg_parser.add_argument('--concode', type=str, help='Concode corpus (JSON or JSONL)')
+    arg_parser.add_argument('--reference', type=str, help='Directory of the jastor package to compare with')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='Number of runs, the best one is reported')
+    args = arg_parser.parse_args()
+
+    reference = load_jastor(args.reference) if args.reference else None
+
+    trees = parse_trees(load_java_files(args.paths), parse.parse)
+    benchmark_code_generator('java files', trees, args.repeat, reference)
+    if args.concode:
+        trees = parse_trees(load_concode_snippets(args.concode), parse.parse_member_declaration)
+        benchmark_code_generator('concode', trees, args.repeat, reference)
+
+
+if __name__ == '__main__':
+    main()
@@ -50,13 +50,27 @@ def to_source(node, indent_with=" " * 4, add_line_information=False,
     number information of statement nodes.
 
     """
-    generator = SourceGenerator(indent_with, add_line_information,
-                                pretty_string)
-    generator.visit(node)
-    generator.result.append("\n")
-    if set(generator.result[0]) == set("\n"):
-        generator.result[0] = ""
-    return pretty_source(generator.result)
+    # The generators are reused, creating one takes a noticeable part of the
+    # conversion of a method
+    idle = _idle_generators.get((indent_with, add_line_information, pretty_string))
+    if idle is None:
+        idle = _idle_generators[indent_with, add_line_information, pretty_string] = []
+    generator = idle.pop() if idle else SourceGenerator(
+        indent_with, add_line_information, pretty_string)
+    try:
+        generator.visit(node)
+        result = generator.result
+        result.append("\n")
+        if not result[0].strip("\n"):
+            result[0] = ""
+        return pretty_source(result)
+    finally:
+        generator.reset()
+        idle.append(generator)
+
+
+# The generators of to_source not in use, by settings
+_idle_generators = dict()
 
 
 def precedence_setter(AST=Node, get_op_precedence=get_op_precedence,
@@ -84,6 +98,56 @@ def precedence_setter(AST=Node, get_op_precedence=get_op_precedence,
 
 set_precedence = precedence_setter()
 
+_char_re = re.compile(r"^'(.)'$")
+
+
+def comma_separated(items):
+    """ The parameters of a single write of the comma separated `items`.
+        Unlike `comma_list`, this writes nothing before the first item, so
+        it should follow a string in the same write.
+    """
+    if not items:
+        return []
+    if len(items) == 1:
+        return items
+    params = [", "] * (2 * len(items) - 1)
+    params[::2] = items
+    return params
+
+
+def comma_list_items(items, trailing=False):
+    """ The items written by `SourceGenerator.comma_list`.
+    """
+    if not items:
+        return ()
+    return ("", *comma_separated(items), "," if trailing else "")
+
+
+def selector_items(selectors):
+    """ The items to write for the selectors of a primary expression.
+    """
+    items = []
+    for selector in selectors:
+        if type(selector) == tree.ArraySelector:
+            items.append(selector)
+        else:
+            items += (".", selector)
+    return items
+
+
+def modifier_items(node):
+    """ The items to write for the annotations and the modifiers of a
+        declaration, each one followed by a space.
+    """
+    items = []
+    if node.annotations:
+        for annotation in node.annotations:
+            items += (annotation, " ")
+    if node.modifiers:
+        for modifier in node.modifiers:
+            items += (modifier, " ")
+    return items
+
 
 class Delimit(object):
     """A context manager that can add enclosing
@@ -143,45 +207,119 @@ class SourceGenerator(ExplicitNodeVisitor):
 
     using_unicode_literals = False
 
+    # The visitors of the node classes already met by this generator class,
+    # shared by all its instances
+    visitors = dict()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.visitors = dict()
+
     def __init__(self, indent_with, add_line_information=False,
                  pretty_string=pretty_string,
                  # constants
-                 len=len, isinstance=isinstance, callable=callable):
+                 len=len, isinstance=isinstance, callable=callable,
+                 type=type, str=str, iter=iter, Node=Node):
         self.result = []
         self.indent_with = indent_with
         self.add_line_information = add_line_information
         self.indentation = 0  # Current indentation level
-        self.new_lines = 0  # Number of lines to insert before next code
-        self.colinfo = 0, 0  # index in result of string containing linefeed, and
-                             # position of last linefeed in that string
         self.pretty_string = pretty_string
 
-        visit = self.visit
-        newline = self.newline
+        get_visitor = self.visitors.get
         result = self.result
         append = result.append
+        new_lines = 0  # Number of lines to insert before next code
 
         def write(*params):
             """ self.write is a closure for performance (to reduce the number
                 of attribute lookups).
+
+                A visitor may return the items to write for its node (a
+                string, or a sequence of items) instead of writing them, which
+                saves a call of write for the most common nodes. As writing
+                None or "" only flushes the pending lines, visitors return ""
+                for an attribute which is None.
             """
-            for item in params:
-                if isinstance(item, Node):
-                    visit(item)
-                elif callable(item):
-                    item()
-                elif item == "\n":
-                    newline()
-                else:
-                    if self.new_lines:
-                        append("\n" * self.new_lines)
-                        self.colinfo = len(result), 0
-                        append(self.indent_with * self.indentation)
-                        self.new_lines = 0
+            nonlocal new_lines
+            items = iter(params)
+            # the items left to write of the nodes whose items are written
+            suspended = []
+            while True:
+                for item in items:
+                    if type(item) is not str:
+                        visitor = get_visitor(type(item))
+                        if visitor is not None:
+                            item = visitor(self, item)
+                            if item is None:
+                                continue
+                            elif type(item) is not str:
+                                suspended.append(items)
+                                items = iter(item)
+                                break
+                        elif isinstance(item, Node):
+                            self.visit(item)
+                            continue
+                        elif callable(item):
+                            item()
+                            continue
+                    elif not new_lines:
+                        # most items are written on the current line
+                        if item == "\n":
+                            new_lines = 1
+                        elif item:
+                            append(item)
+                        continue
+                    if item == "\n":
+                        # same as newline()
+                        if new_lines < 1:
+                            new_lines = 1
+                        continue
+                    if new_lines:
+                        append("\n" * new_lines)
+                        if self.indentation:
+                            append(self.indent_with * self.indentation)
+                        new_lines = 0
                     if item:
                         append(item)
+                else:
+                    if not suspended:
+                        return
+                    items = suspended.pop()
+
+        def newline(node=None, extra=0):
+            nonlocal new_lines
+            new_lines = max(new_lines, 1 + extra)
+            if node is not None and self.add_line_information:
+                write(f"// line: {node.lineno}")
+                new_lines = 1
+
+        def reset():
+            """ Discard the written code, to convert another node.
+            """
+            nonlocal new_lines
+            result.clear()
+            self.indentation = 0
+            new_lines = 0
 
         self.write = write
+        self.newline = newline
+        self.reset = reset
+
+    def visit(self, node, abort=ExplicitNodeVisitor.abort_visit):
+        """Visit a node, and add its visitor to the visitors of this class."""
+        visitor = self.visitors.get(type(node))
+        if visitor is None:
+            method = 'visit_' + node.__class__.__name__
+            visitor = getattr(type(self), method, None)
+            if visitor is None:
+                return abort(node)
+            self.visitors[type(node)] = visitor
+        items = visitor(self, node)
+        if type(items) is str:
+            self.write(items)
+        elif items is not None:
+            self.write(*items)
 
     def __getattr__(self, name, defaults=dict(keywords=(),
                     _pp=Precedence.highest).get):
@@ -209,12 +347,6 @@ class SourceGenerator(ExplicitNodeVisitor):
             # Inform the caller that we wrote
             return True
 
-    def newline(self, node=None, extra=0):
-        self.new_lines = max(self.new_lines, 1 + extra)
-        if node is not None and self.add_line_information:
-            self.write(f"// line: {node.lineno}")
-            self.new_lines = 1
-
     def visit_arguments(self, node):
         want_comma = []
 
@@ -253,24 +385,20 @@ class SourceGenerator(ExplicitNodeVisitor):
     def comma_list(self, items, trailing=False):
         # set_precedence(Precedence.Comma, *items)
         if items:
-            for idx, item in enumerate(items):
-                self.write(", " if idx else "", item)
-            self.write("," if trailing else "")
+            self.write(*comma_list_items(items, trailing))
 
     # Statements
 
     def visit_CompilationUnit(self, node):
-        if node.package:
-            self.write(node.package)
+        items = [node.package] if node.package else []
         if node.imports:
-            for imp in node.imports:
-                self.write(imp)
+            items += node.imports
         if node.types:
-            for type in node.types:
-                self.write(type)
+            items += node.types
+        return items
 
     def visit_Annotation(self, node: tree.Annotation):
-        raise Exception("Annotation is an abstract class. It should not have instances")
+        raise TypeError("Annotation is an abstract class. It should not have instances")
 
     def visit_NormalAnnotation(self, node: tree.NormalAnnotation):
         self.write("@", node.name)
@@ -279,14 +407,12 @@ class SourceGenerator(ExplicitNodeVisitor):
         self.write(")")
 
     def visit_MarkerAnnotation(self, node: tree.MarkerAnnotation):
-        self.write("@", node.name)
+        return "@" + (node.name or "")
 
     def visit_SingleElementAnnotation(self, node: tree.SingleElementAnnotation):
-        self.write("@", node.name)
-        self.write("(")
         if node.element is not None:
-            self.write(node.element)
-        self.write(")")
+            return "@", node.name, "(", node.element, ")"
+        return "@", node.name, "(", ")"
 
     #### Declarations
 
@@ -310,64 +436,42 @@ class SourceGenerator(ExplicitNodeVisitor):
     def visit_PackageDeclaration(self, node):
         #if node.documentation:
             #self.write(node.documentation, "\n")
-        if node.annotations:
-            for annotation in node.annotations:
-                self.write(annotation)
+        items = list(node.annotations) if node.annotations else []
         if node.modifiers:
             for modifier in node.modifiers:
-                self.write(modifier, " ")
-        self.write("package ", node.name, ";", "\n")
+                items += (modifier, " ")
+        return (*items, "package ", node.name, ";", "\n")
 
     def visit_InterfaceDeclaration(self, node):
         #if node.documentation:
             #self.write(node.documentation, "\n")
-        if node.annotations:
-            for annotation in node.annotations:
-                self.write(annotation, " ")
-        if node.modifiers:
-            for modifier in node.modifiers:
-                self.write(modifier, " ")
-        self.write("interface ")
-        self.write(node.name)
+        items = modifier_items(node)
+        items += ("interface ", node.name)
         if node.type_parameters is not None:
-            self.write("< ")
-            self.comma_list(node.type_parameters)
-            self.write(" >")
+            items += ("< ", *comma_list_items(node.type_parameters), " >")
         if node.extends:
-            self.write(" extends ")
-            self.comma_list(node.extends)
-        self.write("{", "\n")
+            items += (" extends ", *comma_list_items(node.extends))
+        items += ("{", "\n")
         if node.body:
-            for element in node.body:
-                self.write(element)
-        self.write("}")
+            items += node.body
+        items.append("}")
+        return items
 
     def visit_ClassDeclaration(self, node):
         #if node.documentation:
             #self.write(node.documentation, "\n")
-        if node.annotations:
-            for annotation in node.annotations:
-                self.write(annotation, " ")
-        if node.modifiers:
-            for modifier in node.modifiers:
-                self.write(modifier, " ")
-        self.write("class ")
-        self.write(node.name)
+        items = modifier_items(node)
+        items += ("class ", node.name)
         if node.type_parameters is not None:
-            self.write("< ")
-            self.comma_list(node.type_parameters)
-            self.write(" >")
+            items += ("< ", *comma_list_items(node.type_parameters), " >")
         if node.extends:
-            self.write(" extends ")
-            self.write(node.extends)
+            items += (" extends ", node.extends)
         if node.implements:
-            self.write(" implements ")
-            self.comma_list(node.implements)
-        self.write(" {", "\n")
+            items += (" implements ", *comma_list_items(node.implements))
+        items += (" {", "\n")
         if node.body:
-            for element in node.body:
-                self.write(element)
-        self.write("}")
+            items += node.body
+        self.write(*items, "}")
         self.newline(extra=1)
 
     def visit_EmptyDeclaration(self, node: tree.EmptyDeclaration):
@@ -432,68 +536,39 @@ class SourceGenerator(ExplicitNodeVisitor):
         pass
 
     def visit_Identifier(self, node):
-        self.write(node.id)
+        return node.id or ""
 
     def visit_MethodDeclaration(self, node):
         #if node.documentation:
             #self.write(node.documentation, "\n")
-        if node.annotations:
-            for annotation in node.annotations:
-                self.write(annotation, " ")
-        if node.modifiers:
-            for modifier in node.modifiers:
-                self.write(modifier, " ")
+        items = modifier_items(node)
         if node.type_parameters is not None:
-            self.write("< ")
-            self.comma_list(node.type_parameters)
-            self.write(" >")
-        if node.return_type:
-            self.write(node.return_type, " ")
-        else:
-            self.write("void ")
-        self.write(node.name)
-        self.write("(")
-        if node.parameters:
-            self.comma_list(node.parameters)
-        self.write(")")
+            items += ("< ", *comma_separated(node.type_parameters), " >")
+        items += (node.return_type or "void", " " + (node.name or "") + "(",
+                  *comma_separated(node.parameters))
+        closing = ")"
         if node.dimensions:
-            for _ in node.dimensions:
-                self.write("[]")
+            closing += "[]" * len(node.dimensions)
         if node.throws:
-            self.write(" throws ")
-            self.comma_list(node.throws)
-        self.write(" ")
-        if node.body:
-            self.write(node.body)
-        else:
-            self.write(";")
+            items += (closing + " throws ", *comma_separated(node.throws))
+            closing = ""
+        self.write(*items, closing + " ", node.body or ";")
         self.newline(extra=1)
 
     # ConstructorDeclaration(fieldmodifier* modifiers, annotation* annotations, string? documentation, type_parameter* type_parameters, identifier name, parameter* parameters, identifier* throws, statement* body)
     def visit_ConstructorDeclaration(self, node):
         #if node.documentation:
             #self.write(node.documentation, "\n")
-        if node.annotations:
-            for annotation in node.annotations:
-                self.write(annotation, " ")
-        if node.modifiers:
-            for modifier in node.modifiers:
-                self.write(modifier, " ")
+        items = modifier_items(node)
         if node.type_parameters is not None:
-            self.write("< ")
-            self.comma_list(node.type_parameters)
-            self.write(" >")
-        self.write(node.name)
-        self.write("(")
-        if node.parameters:
-            self.comma_list(node.parameters)
-        self.write(")")
+            items += ("< ", *comma_list_items(node.type_parameters), " >")
+        items += (node.name, "(", *comma_list_items(node.parameters), ")")
         if node.throws:
-            self.write(" throws ")
-            self.comma_list(node.throws)
-        self.write(" ")
+            items += (" throws ", *comma_list_items(node.throws))
+        items.append(" ")
         if node.body:
-            self.write(node.body)
+            items.append(node.body)
+        self.write(*items)
         self.newline(extra=1)
 
     # FieldDeclaration(string? documentation, fieldmodifier* modifiers,
@@ -501,32 +576,16 @@ class SourceGenerator(ExplicitNodeVisitor):
     def visit_FieldDeclaration(self, node):
         #if node.documentation:
             #self.write(node.documentation, "\n")
-        if node.annotations:
-            for annotation in node.annotations:
-                self.write(annotation, " ")
-        if node.modifiers:
-            for modifier in node.modifiers:
-                self.write(modifier, " ")
-        self.write(node.type, " ")
-        if node.declarators:
-            self.comma_list(node.declarators)
-        self.write(";", "\n")
+        return (*modifier_items(node), node.type, " ",
+                *comma_list_items(node.declarators), ";", "\n")
 
     # ConstantDeclaration(string? documentation, fieldmodifier* modifiers,
     # annotation* annotations, type type, declarator* declarators)
     def visit_ConstantDeclaration(self, node):
         #if node.documentation:
             #self.write(node.documentation, "\n")
-        if node.annotations:
-            for annotation in node.annotations:
-                self.write(annotation, " ")
-        if node.modifiers:
-            for modifier in node.modifiers:
-                self.write(modifier, " ")
-        self.write(node.type, " ")
-        if node.declarators:
-            self.comma_list(node.declarators)
-        self.write(";", "\n")
+        return (*modifier_items(node), node.type, " ",
+                *comma_list_items(node.declarators), ";", "\n")
 
     def visit_TypeDeclarationStatement(self, node):
         self.write(node.declaration)
@@ -537,28 +596,15 @@ class SourceGenerator(ExplicitNodeVisitor):
     def visit_VariableDeclaration(self, node):
         #if node.documentation:
             #self.write(node.documentation, "\n")
-        if node.annotations:
-            for annotation in node.annotations:
-                self.write(annotation, " ")
-        if node.modifiers:
-            for modifier in node.modifiers:
-                self.write(modifier, " ")
-        self.write(node.type, " ")
-        self.comma_list(node.declarators)
+        return (*modifier_items(node), node.type, " ",
+                *comma_list_items(node.declarators))
 
     def visit_LocalVariableDeclarationStatement(self, node):
-        self.write(node.variable)
+        return node.variable,
 
     def visit_LocalVariableDeclaration(self, node):
-        if node.annotations:
-            for annotation in node.annotations:
-                self.write(annotation, " ")
-        if node.modifiers:
-            for modifier in node.modifiers:
-                self.write(modifier, " ")
-        self.write(node.type, " ")
-        self.comma_list(node.declarators)
-        self.write(";", "\n")
+        return (*modifier_items(node), node.type, " ",
+                *comma_separated(node.declarators), ";", "\n")
 
     # ### Declarators
 
@@ -572,33 +618,35 @@ class SourceGenerator(ExplicitNodeVisitor):
                 self.write(dim)
 
     def visit_ReferenceType(self, node):
-        self.write(node.name)
+        if node.arguments is None and node.sub_type is None and not node.dimensions:
+            return node.name or ""
         if node.arguments is not None:
-            #print(" bépo ", file=sys.stderr)
-            self.write("<")
-            self.comma_list(node.arguments)
-            self.write(">")
+            items = [(node.name or "") + "<", *comma_separated(node.arguments), ">"]
+        else:
+            items = [node.name]
         if node.sub_type is not None:
-            self.write(".", node.sub_type)
+            items += (".", node.sub_type)
         if node.dimensions:
-            for dim in node.dimensions:
-                self.write(dim)
+            items += node.dimensions
+        return items
 
     def visit_VariableDeclarator(self, node):
-        self.write(" ", node.name)
-        if node.dimensions:
-            for dim in node.dimensions:
-                self.write(dim)
+        if not node.dimensions:
+            if node.initializer:
+                return " " + (node.name or "") + " = ", node.initializer
+            return " " + (node.name or "")
+        items = [" " + (node.name or ""), *node.dimensions]
         if node.initializer:
-            self.write(" = ", node.initializer)
+            items += (" = ", node.initializer)
+        return items
 
     def visit_VariableInitializer(self, node):
         if node.array and node.expression is None:
-            self.write(node.array)
+            return node.array,
         elif node.expression and node.array is None:
-            self.write(node.expression)
+            return node.expression,
         else:
-            raise Exception("VariableInitializer must have exactly one of its "
+            raise ValueError("VariableInitializer must have exactly one of its "
                             "attributes not none.")
 
     def visit_ArrayInitializer(self, node):
@@ -610,41 +658,36 @@ class SourceGenerator(ExplicitNodeVisitor):
         self.write("}")
 
     def visit_Literal(self, node):
-        if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op)
-        if node.qualifier:
-            self.write(node.qualifier, ".")
-        char_re = re.compile(r"^'(.)'$")
-        matches = char_re.findall(node.value)
+        # only the character literals are escaped
+        matches = node.value[:1] == "'" and _char_re.findall(node.value)
         if matches:
-            self.write("'", matches[0].encode("unicode_escape").decode('ASCII'), "'")
+            value = "'" + matches[0].encode("unicode_escape").decode('ASCII') + "'"
         else:
-            self.write(node.value)
+            value = node.value
+        if not (node.prefix_operators or node.qualifier or node.selectors
+                or node.postfix_operators):
+            return value
+        items = []
+        if node.prefix_operators:
+            items += node.prefix_operators
+        if node.qualifier:
+            items += (node.qualifier, ".")
+        items.append(value)
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
+            items += selector_items(node.selectors)
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op)
+            items += node.postfix_operators
+        return items
 
     def visit_FormalParameter(self, node):
-        if node.annotations:
-            for annotation in node.annotations:
-                self.write(annotation, " ")
-        if node.modifiers:
-            for modifier in node.modifiers:
-                self.write(modifier, " ")
-        self.write(node.type)
+        items = modifier_items(node)
         if node.varargs:
-            self.write("...")
-        self.write(" ", node.name)
-        if node.dimensions is not None:
-            for _ in node.dimensions:
-                self.write("[]")
+            items += (node.type, "... " + (node.name or ""))
+        else:
+            items += (node.type, " " + (node.name or ""))
+        if node.dimensions:
+            items.append("[]" * len(node.dimensions))
+        return items
 
 
     ### Statements
@@ -657,8 +700,7 @@ class SourceGenerator(ExplicitNodeVisitor):
     def visit_ExpressionStatement(self, node):
         if node.label:
             self.write(node.label, ": ", "\n")
-        self.write(node.expression)
-        self.write(";", "\n")
+        return node.expression, ";", "\n"
 
     def visit_BlockExpression(self, node):
         self.write(node.block)
@@ -677,43 +719,44 @@ class SourceGenerator(ExplicitNodeVisitor):
                 self.write(op)
 
     def visit_MethodInvocation(self, node):
+        if not (node.prefix_operators or node.type_arguments or node.selectors
+                or node.postfix_operators):
+            # most invocations, with their constant parts joined
+            call = (node.member or "") + "("
+            qualifier = node.qualifier
+            if qualifier and type(qualifier) is str:
+                call = qualifier + "." + call
+                qualifier = None
+            if node.arguments:
+                items = (call, *comma_separated(node.arguments), ")")
+            elif qualifier:
+                items = call + ")",
+            else:
+                return call + ")"
+            return (qualifier, ".", *items) if qualifier else items
+        items = []
         if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op)
+            items += node.prefix_operators
         if node.qualifier:
-            self.write(node.qualifier, ".")
+            items += (node.qualifier, ".")
         if node.type_arguments:
-            self.write('<')
-            self.comma_list(node.type_arguments)
-            self.write('>')
-        self.write(node.member)
-        self.write("(")
-        self.comma_list(node.arguments)
-        self.write(")")
+            items += ('<', *comma_separated(node.type_arguments), '>')
+        items += (node.member, "(", *comma_separated(node.arguments), ")")
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
+            items += selector_items(node.selectors)
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op)
+            items += node.postfix_operators
+        return items
 
     def visit_ForStatement(self, node):
         if node.label:
             self.write(node.label, ":", "\n")
-        self.write("for (")
-        self.write(node.control)
-        self.write(") ", "\n")
-        self.write(node.body)
+        return "for (", node.control, ") ", "\n", node.body
 
     def visit_WhileStatement(self, node):
         if node.label:
             self.write(node.label, ":", "\n")
-        self.write("while")
-        self.write(node.condition)
-        self.write(node.body)
+        return "while", node.condition, node.body
 
     def visit_DoStatement(self, node):
         if node.label:
@@ -741,78 +784,71 @@ class SourceGenerator(ExplicitNodeVisitor):
         self.write("synchronized", node.lock, node.block)
 
     def visit_ForControl(self, node):
-        if node.init:
-            self.comma_list(node.init)
-        self.write("; ")
+        items = [*comma_list_items(node.init), "; "]
         if node.condition:
-            self.write(node.condition)
-        self.write("; ")
-        if node.update:
-            self.comma_list(node.update)
+            items.append(node.condition)
+        items += ("; ", *comma_list_items(node.update))
+        return items
 
     def visit_StatementExpressionList(self, node):
         self.comma_list(node.statement)
 
     def visit_BinaryOperation(self, node):
-        if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op.operator)
-        if node.prefix_operators or node.postfix_operators:
-            self.write("(")
-        self.write(node.operandl)
-        self.write(" ", node.operator, " ")
-        self.write(node.operandr)
-        if node.prefix_operators or node.postfix_operators:
-            self.write(")")
-        if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op.operator)
+        if not (node.prefix_operators or node.postfix_operators):
+            return node.operandl, " ", node.operator, " ", node.operandr
+        items = [op.operator for op in node.prefix_operators or ()]
+        items += ("(", node.operandl, " ", node.operator, " ", node.operandr, ")")
+        items += [op.operator for op in node.postfix_operators or ()]
+        return items
 
     def visit_MemberReference(self, node):
+        if not (node.prefix_operators or node.qualifier or node.selectors
+                or node.postfix_operators):
+            return node.member or ""
+        items = []
         if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op.operator)
-        if node.qualifier:
-            self.write(node.qualifier, ".")
-        self.write(node.member)
+            items += [op.operator for op in node.prefix_operators]
+        if not node.qualifier:
+            items.append(node.member)
+        elif type(node.qualifier) is str:
+            items.append(node.qualifier + "." + (node.member or ""))
+        else:
+            items += (node.qualifier, ".", node.member)
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
+            items += selector_items(node.selectors)
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op.operator)
+            items += [op.operator for op in node.postfix_operators]
+        return items
 
     def visit_FieldReference(self, node):
+        if not (node.prefix_operators or node.qualifier or node.selectors
+                or node.postfix_operators):
+            return node.field or ""
+        items = []
         if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op.operator)
-        if node.qualifier:
-            self.write(node.qualifier, ".")
-        self.write(node.field)
+            items += [op.operator for op in node.prefix_operators]
+        if not node.qualifier:
+            items.append(node.field)
+        elif type(node.qualifier) is str:
+            items.append(node.qualifier + "." + (node.field or ""))
+        else:
+            items += (node.qualifier, ".", node.field)
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
+            items += selector_items(node.selectors)
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op.operator)
+            items += [op.operator for op in node.postfix_operators]
+        return items
 
     def visit_BasicType(self, node):
-        self.write(node.name)
         if node.dimensions:
-            for _ in node.dimensions:
-                self.write("[]")
+            return node.name, "[]" * len(node.dimensions)
+        return node.name or ""
 
     #def visit_Void(self, node):
         #self.write("void")
 
     def visit_ArraySelector(self, node):
-        self.write("[", node.index, "]")
+        return "[", node.index, "]"
 
     def visit_ArrayDimension(self, node):
         self.write("[")
@@ -821,117 +857,95 @@ class SourceGenerator(ExplicitNodeVisitor):
         self.write("]")
 
     def visit_Modifier(self, node):
-        self.write(node.value)
+        return node.value or ""
 
     def visit_Operator(self, node):
-        self.write(node.operator)
+        return node.operator or ""
 
     # Import(identifier path, identifier static, identifier wildcard)
     def visit_Import(self, node):
-        self.write("import ")
-        if node.static:
-            self.write("static ")
-        self.write(node.path)
-        if node.wildcard:
-            self.write(".*",)
-        self.write(";", "\n")
+        return ("import static " if node.static else "import ", node.path,
+                ".*;" if node.wildcard else ";", "\n")
 
     # Assignment(expression expressionl, expression value,
     # assign_operator type)
     def visit_Assignment(self, node):
         if node.selectors:
-            self.write("(")
-        self.write(node.expressionl, node.type, node.value)
-        if node.selectors:
-            self.write(")")
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
+            return ("(", node.expressionl, node.type, node.value, ")",
+                    *selector_items(node.selectors))
+        return node.expressionl, node.type, node.value
 
     # This(prefix_operator* prefix_operators,
     # postfix_operator* postfix_operators, identifier? qualifier,
     # selector* selectors)
     def visit_This(self, node):
+        items = []
         if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op.operator)
+            items += [op.operator for op in node.prefix_operators]
         if node.qualifier:
-            self.write(node.qualifier, ".")
-        self.write("this")
+            items += (node.qualifier, ".")
+        items.append("this")
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
+            items += selector_items(node.selectors)
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op.operator)
+            items += [op.operator for op in node.postfix_operators]
+        return items
 
     # ReturnStatement(identifier* label, expression expression)
     def visit_ReturnStatement(self, node):
         if node.label:
             self.write(node.label, ": ", "\n")
-        self.write("return ", node.expression, ";", "\n")
+        return "return ", node.expression, ";", "\n"
 
     # IfStatement(identifier? label, expression condition, statement then_statement, statement else_statement)
     def visit_IfStatement(self, node):
         if node.label:
             self.write(node.label, ": ", "\n")
-        self.write("if", node.condition, "\n")
-        self.write(node.then_statement)
         if node.else_statement:
-            self.write("else ", node.else_statement)
+            return ("if", node.condition, "\n", node.then_statement,
+                    "else ", node.else_statement)
+        return "if", node.condition, "\n", node.then_statement
 
     # BlockStatement(identifier? label, statement* statements)
     def visit_BlockStatement(self, node):
         if node.label:
             self.write(node.label, ": ", "\n")
-        self.write("{", "\n")
         if node.statements:
-          for statement in node.statements:
-              self.write(statement)
-        self.write("}", "\n")
+            return ("{", "\n", *node.statements, "}", "\n")
+        return "{", "\n", "}", "\n"
 
     # EnhancedForControl(expression var, statement iterable)
     def visit_EnhancedForControl(self, node):
-        self.write(node.var, " : ", node.iterable)
+        return node.var, " : ", node.iterable
 
     # Cast(type type, expression expression)
     def visit_Cast(self, node):
+        items = []
         if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op)
-        self.write("(", node.type, ") ")
-        self.write(node.expression)
+            items += node.prefix_operators
+        items += ("(", node.type, ") ", node.expression)
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
+            items += selector_items(node.selectors)
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op)
+            items += node.postfix_operators
+        return items
 
     # TryStatement(identifier? label, identifier? resources, statement* block, catch* catches, statement? finally_block)
     def visit_TryStatement(self, node):
         if node.label:
             self.write(node.label, ": ", "\n")
-        self.write("try")
+        items = ["try"]
         if node.resources:
-            self.write("(")
+            items.append("(")
             for idx, item in enumerate(node.resources):
-                self.write("; " if idx else "", item)
-            self.write(")")
-        self.write(node.block)
+                items += ("; " if idx else "", item)
+            items.append(")")
+        items.append(node.block)
         if node.catches:
-            for clause in node.catches:
-                self.write(clause)
+            items += node.catches
         if node.finally_block:
-            self.write("finally", node.finally_block)
+            items += ("finally", node.finally_block)
+        return items
 
     def visit_TryResource(self,  node):
         if node.annotations:
@@ -947,7 +961,7 @@ class SourceGenerator(ExplicitNodeVisitor):
     def visit_CatchClause(self, node):
         if node.label:
             self.write(node.label, ": ", "\n")
-        self.write("catch (", node.parameter, ") ", node.block)
+        return "catch (", node.parameter, ") ", node.block
 
     # CatchClauseParameter(fieldmodifier* modifiers, annotation* annotations, identifier* types, identifier name)
     def visit_CatchClauseParameter(self, node):
@@ -963,93 +977,67 @@ class SourceGenerator(ExplicitNodeVisitor):
     def visit_ThrowStatement(self, node):
         if node.label:
             self.write(node.label, ": ", "\n")
-        self.write("throw ", node.expression, ";", "\n")
+        return "throw ", node.expression, ";", "\n"
 
     # SuperConstructorInvocation(prefix_operator* prefix_operators, postfix_operator* postfix_operators, identifier? qualifier, selector* selectors, type_argument* type_arguments, argument* arguments)
     def visit_SuperConstructorInvocation(self, node):
-        if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op)
+        items = list(node.prefix_operators) if node.prefix_operators else []
         if node.qualifier:
-            self.write(node.qualifier, ".")
+            items += (node.qualifier, ".")
         if node.type_arguments:
-            self.write("<")
-            self.comma_list(node.type_arguments)
-            self.write(">")
+            items += ("<", *comma_list_items(node.type_arguments), ">")
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
-        self.write("super(")
-        self.comma_list(node.arguments)
-        self.write(")")
+            items += selector_items(node.selectors)
+        items += ("super(", *comma_list_items(node.arguments), ")")
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op)
+            items += node.postfix_operators
+        return items
 
     # ClassCreator(prefix_operator* prefix_operators, postfix_operator* postfix_operators, identifier? qualifier, selector* selectors, type type, identifier* constructor_type_arguments, argument* arguments, statement* body)
     def visit_ClassCreator(self, node):
+        items = []
         if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op)
-        self.write("new ")
+            items += node.prefix_operators
+        items.append("new ")
         if node.qualifier:
-            self.write(node.qualifier, ".")
+            items += (node.qualifier, ".")
         if node.constructor_type_arguments is not None:
-            self.write(" < ")
-            self.comma_list(node.constructor_type_arguments)
-            self.write(" > ")
-        self.write(node.type)
-        self.write("(")
-        if node.arguments:
-            self.comma_list(node.arguments)
-        self.write(")")
+            items += (" < ", *comma_separated(node.constructor_type_arguments), " > ")
+        items += (node.type, "(", *comma_separated(node.arguments), ")")
         if node.body is not None:
-            self.write(node.body)
+            items.append(node.body)
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
-
+            items += selector_items(node.selectors)
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op)
+            items += node.postfix_operators
+        return items
 
     # LambdaExpression(parameter* parameters, statement body)
     def visit_LambdaExpression(self, node):
         if node.parameter is not None:
-            self.write(node.parameter)
-        else:
-            self.write("(")
-            self.comma_list(node.parameters)
-            self.write(")")
-        self.write(" -> ", node.body)
+            return node.parameter, " -> ", node.body
+        return "(", *comma_list_items(node.parameters), ")", " -> ", node.body
 
     def visit_InferredFormalParameter(self, node):
-        self.write(node.expression)
+        return node.expression,
 
     def visit_SwitchStatement(self, node):
         if node.label:
             self.write(node.label, ": ", "\n")
-        self.write("switch", node.expression, "{", "\n")
         if node.cases is not None:
-            for case in node.cases:
-                self.write(case)
-        self.write("}")
+            return ("switch", node.expression, "{", "\n", *node.cases, "}")
+        return "switch", node.expression, "{", "\n", "}"
 
     def visit_SwitchStatementCase(self, node):
+        items = []
         if node.case:
             for case in node.case:
-                self.write("case ", case, ":", "\n")
+                items += ("case ", case, ":", "\n")
         else:
-            self.write("default:", "\n")
+            items += ("default:", "\n")
         if node.statements:
-            for statement in node.statements:
-                self.write(statement)
+            items += node.statements
+        return items
 
     def visit_StaticInitializer(self, node):
         self.write("static", node.block)
@@ -1060,78 +1048,63 @@ class SourceGenerator(ExplicitNodeVisitor):
     # ClassReference(prefix_operator* prefix_operators, postfix_operator* postfix_operators, identifier? qualifier, selector* selectors, type type)
     def visit_ClassReference(self, node):
         # TypeExtractor.class.getCanonicalName()
+        items = []
         if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op)
+            items += node.prefix_operators
         if node.qualifier:
-            self.write(node.qualifier, ".")
-        self.write(node.type, ".class")
+            items += (node.qualifier, ".")
+        items += (node.type, ".class")
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
+            items += selector_items(node.selectors)
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op)
+            items += node.postfix_operators
+        return items
 
     # MethodReference(expression expression, identifier method, type_argument* type_arguments)
     def visit_MethodReference(self, node):
         self.write(node.expression, "::", node.method)
         if node.type_arguments:
-            raise Exception("TODO MethodReference type_arguments")
+            raise NotImplementedError("TODO MethodReference type_arguments")
 
     def visit_TypeParameter(self, node):
-        self.write(node.name)
+        items = [node.name]
         if node.extends:
-            self.write(" extends ")
+            items.append(" extends ")
             for idx, item in enumerate(node.extends):
-                self.write(" & " if idx else "", item)
+                items += (" & " if idx else "", item)
+        return items
 
     def visit_TypeArgument(self, node):
-        self.write(node.pattern_type, " ", node.type)
+        return node.pattern_type, " ", node.type
 
     def visit_SuperMethodInvocation(self, node):
-        if node.prefix_operators:
-          for op in node.prefix_operators:
-              self.write(op)
-        self.write("super.")
+        items = list(node.prefix_operators) if node.prefix_operators else []
+        items.append("super.")
         if node.qualifier:
-            self.write(node.qualifier, ".")
+            items += (node.qualifier, ".")
         if node.type_arguments:
-            self.write("<")
-            self.comma_list(node.type_arguments)
-            self.write(">")
-        self.write(node.member)
+            items += ("<", *comma_list_items(node.type_arguments), ">")
+        items.append(node.member)
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
-        self.write("(")
-        self.comma_list(node.arguments)
-        self.write(")")
+            items += selector_items(node.selectors)
+        items += ("(", *comma_list_items(node.arguments), ")")
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op)
+            items += node.postfix_operators
+        return items
 
     def visit_BreakStatement(self, node):
         if node.label:
             self.write(node.label, ": ", "\n")
-        self.write("break")
         if node.goto:
-            self.write(" ", node.goto)
-        self.write(";", "\n")
+            return "break", " ", node.goto, ";", "\n"
+        return "break", ";", "\n"
 
     def visit_ContinueStatement(self, node):
         if node.label:
             self.write(node.label, ": ", "\n")
-        self.write("continue")
         if node.goto:
-            self.write(" ", node.goto)
-        self.write(";", "\n")
+            return "continue", " ", node.goto, ";", "\n"
+        return "continue", ";", "\n"
 
     # AnnotationMethod(fieldmodifier* modifiers, annotation* annotations, identifier name", type return_type, int* dimensions, identifier? default)
     def visit_AnnotationMethod(self, node):
@@ -1247,10 +1220,7 @@ class SourceGenerator(ExplicitNodeVisitor):
 
     def visit_ClassBody(self, node):
         if node.declarations is not None:
-            self.write("{", "\n")
-            for declaration in node.declarations:
-                self.write(declaration)
-            self.write("}", "\n")
+            return ("{", "\n", *node.declarations, "}", "\n")
 
     def visit_EmptyClassBody(self, node):
         self.write("{", "}", "\n")
@@ -1260,19 +1230,15 @@ class SourceGenerator(ExplicitNodeVisitor):
 
     # prefix_operators, "postfix_operators", "qualifier", "selectors
     def visit_ParenthesizedExpression(self, node):
+        items = []
         if node.prefix_operators:
-            for op in node.prefix_operators:
-                self.write(op)
+            items += node.prefix_operators
         if node.qualifier:
-            self.write(node.qualifier, ".")
-        self.write("(", node.expression, ")")
+            items += (node.qualifier, ".")
+        items += ("(", node.expression, ")")
         if node.selectors:
-            for selector in node.selectors:
-                if type(selector) == tree.ArraySelector:
-                    self.write(selector)
-                else:
-                    self.write(".", selector)
+            items += selector_items(node.selectors)
         if node.postfix_operators:
-            for op in node.postfix_operators:
-                self.write(op)
+            items += node.postfix_operators
+        return items
 
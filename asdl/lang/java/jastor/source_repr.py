@@ -35,31 +35,15 @@ def split_lines(source, maxline=79):
     """Split inputs according to lines.
        If a line is short enough, just yield it.
        Otherwise, fix it.
+
+       As long lines are not wrapped anymore (see wrap_line), this keeps
+       the items up to the last line break, which is the last one starting
+       with a linefeed.
     """
-    result = []
-    extend = result.extend
-    append = result.append
-    line = []
-    multiline = False
-    count = 0
-    find = str.find
-    for item in source:
-        index = find(item, '\n')
-        if index:
-            line.append(item)
-            multiline = index > 0
-            count += len(item)
-        else:
-            if line:
-                #if count <= maxline or multiline:
-                extend(line)
-                #else:
-                    #wrap_line(line, maxline, result)
-                count = 0
-                multiline = False
-                line = []
-            append(item)
-    return result
+    for index in range(len(source) - 1, -1, -1):
+        if source[index][:1] == '\n':
+            return source[:index + 1]
+    return []
 
 
 def count(group, slen=str.__len__):
@@ -1,8 +1,11 @@
 # coding=utf-8
 
 import sys
+import weakref
 
 from asdl.asdl_ast import RealizedField, AbstractSyntaxTree
+from asdl.transition_system import ApplyRuleAction, GenTokenAction, ReduceAction
+from components.action_info import ActionInfo
 
 
 # from https://stackoverflow.com/questions/15357422/python-determine-if-a-string-should-be-converted-into-int-or-float
@@ -66,6 +69,100 @@ def java_ast_to_asdl_ast(java_ast_node, grammar):
     return asdl_node
 
 
+# for each grammar, the production of each javalang node type and the fields to
+# convert, see `java_ast_to_action_infos`
+_production_tables = weakref.WeakKeyDictionary()
+
+
+def _get_production_table(grammar, java_node_name):
+    tables = _production_tables.get(grammar)
+    if tables is None:
+        tables = _production_tables[grammar] = dict()
+
+    table = tables.get(java_node_name)
+    if table is None:
+        production = grammar.get_prod_by_ctr_name(java_node_name)
+        fields = [(field, field.name, grammar.is_composite_type(field.type),
+                   field.cardinality, field.type.name == 'string')
+                  for field in production.fields]
+        table = tables[java_node_name] = (production, fields)
+
+    return table
+
+
+def java_ast_to_action_infos(java_ast_node, grammar, src_query=None, force_copy=False):
+    """
+    the action infos of the actions building `java_ast_node`, computed directly from the
+    javalang tree. This is the same as
+    `get_action_infos(src_query, transition_system.get_actions(java_ast_to_asdl_ast(java_ast_node, grammar)))`
+    without building the ASDL AST, nor replaying the actions to get their frontier
+    """
+    action_infos = []
+
+    src_token_positions = dict()
+    for position, token in enumerate(src_query or []):
+        src_token_positions.setdefault(token, position)
+
+    def add_action(action, parent_t, frontier_prod, frontier_field):
+        action_info = ActionInfo(action)
+        action_info.t = len(action_infos)
+        action_info.parent_t = parent_t
+        action_info.frontier_prod = frontier_prod
+        action_info.frontier_field = frontier_field
+
+        if isinstance(action, GenTokenAction):
+            position = src_token_positions.get(action.token)
+            if position is not None:
+                action_info.copy_from_src = True
+                action_info.src_token_position = position
+            elif force_copy:
+                raise ValueError('cannot copy primitive token %s from source' % action.token)
+
+        action_infos.append(action_info)
+
+    def add_node_actions(node, parent_t, frontier_prod, frontier_field):
+        production, fields = _get_production_table(grammar, type(node).__name__)
+        t = len(action_infos)
+        add_action(ApplyRuleAction(production), parent_t, frontier_prod, frontier_field)
+
+        for field, field_name, is_composite, cardinality, is_string in fields:
+            field_value = getattr(node, field_name)
+            if is_composite:
+                if cardinality == 'multiple':
+                    for value in field_value or []:
+                        add_node_actions(value, t, production, field)
+                elif field_value is not None:
+                    add_node_actions(field_value, t, production, field)
+                    continue
+                elif cardinality == 'single':
+                    raise ValueError(f'no value for the field {field} of {production}')
+            else:
+                if field_value is None:
+                    field_values = []
+                elif cardinality == 'multiple':
+                    field_values = [str(value) for value in field_value]
+                else:
+                    field_values = [field_value]
+
+                for value in field_values:
+                    if is_string:
+                        for token in value.split(' ') + ['</primitive>']:
+                            add_action(GenTokenAction(token), t, production, field)
+                    else:
+                        add_action(GenTokenAction(value), t, production, field)
+
+                if cardinality == 'single' and not field_values:
+                    raise ValueError(f'no value for the field {field} of {production}')
+                elif cardinality == 'single' or (cardinality == 'optional' and field_values):
+                    continue
+
+            add_action(ReduceAction(), t, production, field)
+
+    add_node_actions(java_ast_node, -1, None, None)
+
+    return action_infos
+
+
 def asdl_ast_to_java_ast(asdl_ast_node, grammar):
     java_node_type = getattr(sys.modules['javalang.tree'],
                              asdl_ast_node.production.constructor.name)
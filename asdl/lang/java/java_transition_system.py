@@ -1,7 +1,8 @@
 # coding=utf-8
 
+import re
+
 import javalang.parse
-from javalang.parser import JavaSyntaxError
 from javalang import tree
 
 from asdl.lang.java import jastor
@@ -13,16 +14,17 @@ from asdl.transition_system import TransitionSystem, GenTokenAction
 from common.registerable import Registrable
 
 
+# the values of identifier fields: qualified names, and the wildcards of type arguments
+_identifier_re = re.compile(r'(?:[^\W\d]|\$)[\w$]*(?:\.(?:[^\W\d]|\$)[\w$]*)*|\?(?: extends| super)?')
+
+
 @Registrable.register('java')
 class JavaTransitionSystem(TransitionSystem):
     def tokenize_code(self, code, mode=None):
         return tokenize_code(code, mode)
 
     def surface_code_to_ast(self, code):
-        try:
-            java_ast = javalang.parse.parse(code)
-        except JavaSyntaxError as e:
-            java_ast = javalang.parse.parse_member_declaration(code)
+        java_ast = javalang.parse.parse_snippet(code)
         return java_ast_to_asdl_ast(java_ast, self.grammar)
 
     def ast_to_surface_code(self, asdl_ast):
@@ -32,11 +34,9 @@ class JavaTransitionSystem(TransitionSystem):
         return code
 
     def compare_ast(self, hyp_ast, ref_ast):
-        hyp_code = self.ast_to_surface_code(hyp_ast)
-        ref_reformatted_code = self.ast_to_surface_code(ref_ast)
-
-        ref_code_tokens = tokenize_code(ref_reformatted_code)
-        hyp_code_tokens = tokenize_code(hyp_code)
+        # the same reference is compared to all the hypotheses of an example
+        _, ref_code_tokens = self.surface_code_cache.get(ref_ast)
+        hyp_code_tokens = self.tokenize_code(self.ast_to_surface_code(hyp_ast), None)
 
         return ref_code_tokens == hyp_code_tokens
 
@@ -69,13 +69,16 @@ class JavaTransitionSystem(TransitionSystem):
             pass
         return actions
 
+    def is_valid_primitive_token(self, primitive_type, token):
+        if primitive_type.name == 'identifier' and not _identifier_re.fullmatch(token):
+            return False
+
+        return super(JavaTransitionSystem, self).is_valid_primitive_token(primitive_type, token)
+
     def is_valid_hypothesis(self, hyp, **kwargs):
         try:
             hyp_code = self.ast_to_surface_code(hyp.tree)
-            try:
-                java_ast = javalang.parse.parse(hyp_code)
-            except JavaSyntaxError as e:
-                java_ast = javalang.parse.parse_member_declaration(hyp_code)
+            java_ast = javalang.parse.parse_snippet(hyp_code)
             self.tokenize_code(hyp_code)
         except Exception:
             return False
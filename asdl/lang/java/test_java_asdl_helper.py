@@ -0,0 +1,89 @@
+# coding=utf-8
+
+import glob
+import os
+
+import javalang.parse
+from asdl.asdl import ASDLGrammar
+from asdl.asdl_ast import AbstractSyntaxTree
+from asdl.hypothesis import Hypothesis
+from asdl.lang.java.java_asdl_helper import java_ast_to_action_infos, java_ast_to_asdl_ast
+from asdl.lang.java.java_transition_system import JavaTransitionSystem
+from components.action_info import get_action_infos
+
+java_dir = os.path.dirname(__file__)
+grammar = ASDLGrammar.from_file(os.path.join(java_dir, 'java_asdl.simplified.txt'))
+transition_system = JavaTransitionSystem(grammar)
+
+
+def action_info_values(action_info):
+    return (repr(action_info.action), action_info.t, action_info.parent_t,
+            action_info.frontier_prod, action_info.frontier_field,
+            action_info.copy_from_src, action_info.src_token_position)
+
+
+def check_action_infos(java_ast, src_query):
+    asdl_ast = java_ast_to_asdl_ast(java_ast, grammar)
+    expected = get_action_infos(src_query, transition_system.get_actions(asdl_ast))
+    action_infos = java_ast_to_action_infos(java_ast, grammar, src_query)
+    assert [action_info_values(action_info) for action_info in action_infos] == \
+        [action_info_values(action_info) for action_info in expected]
+
+
+def test_java_ast_to_action_infos():
+    files = sorted(glob.glob(os.path.join(java_dir, 'test', '**', '*.java'), recursive=True))
+    assert files
+    for file in files:
+        # replaying the actions of the largest files takes too long
+        if os.path.getsize(file) > 10000:
+            continue
+        with open(file) as f:
+            code = f.read()
+        try:
+            java_ast = javalang.parse.parse(code)
+        except javalang.parser.JavaSyntaxError:
+            continue
+        src_query = [token.value for token in javalang.tokenizer.tokenize(code)][::7]
+        check_action_infos(java_ast, src_query)
+
+
+def test_java_member_to_action_infos():
+    code = 'public static int add(int a, int[] b) { return a + b[0] * 2; }'
+    java_ast = javalang.parse.parse_member_declaration(code)
+    check_action_infos(java_ast, ['return', 'a', 'b', '2', 'add'])
+
+
+def test_fingerprint():
+    def fingerprint(code):
+        return java_ast_to_asdl_ast(javalang.parse.parse_member_declaration(code), grammar).fingerprint
+
+    code = 'public static int add(int a, int[] b) { return a + b[0] * 2; }'
+    assert fingerprint(code) == fingerprint(code)
+    assert fingerprint(code) != fingerprint(code.replace('a +', 'b +'))
+    assert fingerprint('void f() { g("a b"); }') != fingerprint('void f() { g("a-SPACE-b"); }')
+
+    def literal_fingerprint(value):
+        literal = AbstractSyntaxTree(grammar.get_prod_by_ctr_name('Literal'))
+        literal['value'].add_value(value)
+        return literal.fingerprint
+
+    assert literal_fingerprint(1) == literal_fingerprint(1)
+    assert literal_fingerprint(1) != literal_fingerprint('1')
+
+    # the fingerprints of the hypotheses built action by action, sharing their
+    # finished subtrees, are updated with the trees
+    asdl_ast = java_ast_to_asdl_ast(javalang.parse.parse_member_declaration(code), grammar)
+    actions = transition_system.get_actions(asdl_ast)
+    hyp = Hypothesis()
+    for t, action in enumerate(actions):
+        previous_fingerprint = hyp.tree.fingerprint if hyp.tree else None
+        new_hyp = hyp.clone_and_apply_action(action)
+        assert hyp.tree is None or hyp.tree.fingerprint == previous_fingerprint
+
+        replayed_hyp = Hypothesis()
+        for replayed_action in actions[:t + 1]:
+            replayed_hyp.apply_action(replayed_action)
+        assert new_hyp.tree.fingerprint == replayed_hyp.tree.fingerprint
+        assert hash(new_hyp.tree) == hash(replayed_hyp.tree)
+        hyp = new_hyp
+    assert hyp.tree.fingerprint == asdl_ast.fingerprint
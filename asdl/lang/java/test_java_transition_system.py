@@ -0,0 +1,71 @@
+# coding=utf-8
+
+import os
+import pickle
+
+import javalang.parse
+from asdl.asdl import ASDLGrammar
+from asdl.lang.java.java_asdl_helper import java_ast_to_asdl_ast
+from asdl.lang.java.java_transition_system import JavaTransitionSystem
+
+java_dir = os.path.dirname(__file__)
+grammar = ASDLGrammar.from_file(os.path.join(java_dir, 'java_asdl.simplified.txt'))
+
+
+def member_ast(code):
+    return java_ast_to_asdl_ast(javalang.parse.parse_member_declaration(code), grammar)
+
+
+def test_compare_ast_renders_reference_once():
+    transition_system = JavaTransitionSystem(grammar)
+    cache = transition_system.surface_code_cache
+    ref_ast = member_ast('int add(int a, int b) { return a + b; }')
+    hyp_asts = [member_ast('int add(int a, int b) { return a + b; }'),
+                member_ast('int add(int a, int b) { return a - b; }'),
+                member_ast('int add(int a, int b) { return a + b; }')]
+
+    assert [transition_system.compare_ast(hyp_ast, ref_ast) for hyp_ast in hyp_asts] == [True, False, True]
+    # only the reference is cached
+    assert list(cache.entries) == [ref_ast.fingerprint]
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert cache.hit_rate == 2 / 3
+    code, tokens = cache.get(ref_ast)
+    assert code == transition_system.ast_to_surface_code(ref_ast)
+    assert tokens == transition_system.tokenize_code(code)
+
+    cache.clear()
+    assert not cache.entries and cache.hit_rate == 0.
+
+
+def test_surface_code_cache_evicts_least_recently_used():
+    transition_system = JavaTransitionSystem(grammar)
+    cache = transition_system.surface_code_cache
+    cache.max_size = 2
+    ref_asts = [member_ast('int f() { return %d; }' % i) for i in range(3)]
+    for ref_ast in [ref_asts[0], ref_asts[1], ref_asts[0], ref_asts[2]]:
+        cache.get(ref_ast)
+    assert list(cache.entries) == [ref_asts[0].fingerprint, ref_asts[2].fingerprint]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_surface_code_cache_is_not_saved():
+    transition_system = JavaTransitionSystem(grammar)
+    ast = member_ast('void f() { g("a b"); }')
+    transition_system.compare_ast(ast, ast)
+    loaded = pickle.loads(pickle.dumps(transition_system))
+    assert not loaded.surface_code_cache.entries
+    # the spaces of the strings are part of the fingerprint, unlike in to_string()
+    assert not loaded.compare_ast(member_ast('void f() { g("a-SPACE-b"); }'), ast)
+
+
+def test_is_valid_primitive_token():
+    transition_system = JavaTransitionSystem(grammar)
+    types = {primitive_type.name: primitive_type for primitive_type in grammar.primitive_types}
+    for token in ['a', 'java.util.List', '$x_1', 'été', '?', '? extends']:
+        assert transition_system.is_valid_primitive_token(types['identifier'], token)
+    for token in ['(', '1a', 'a.', 'a b', '</primitive>', '<pad>']:
+        assert not transition_system.is_valid_primitive_token(types['identifier'], token)
+    assert transition_system.is_valid_primitive_token(types['constant'], '+=')
+    assert not transition_system.is_valid_primitive_token(types['constant'], '</primitive>')
+    assert transition_system.is_valid_primitive_token(types['string'], '"a')
+    assert transition_system.is_valid_primitive_token(types['string'], '</primitive>')
@@ -25,6 +25,19 @@ def isint(x):
         return a == b
 
 
+def is_valid_primitive_value(type_name, value):
+    """whether `asdl_ast_to_python_ast` converts `value` for a field of type `type_name`"""
+    try:
+        if type_name == 'object':
+            return isfloat(value) if '.' in value or 'e' in value else isint(value)
+        elif type_name == 'int':
+            int(value)
+    except (ValueError, OverflowError):
+        return False
+
+    return True
+
+
 def python_ast_to_asdl_ast(py_ast_node, grammar):
     # node should be composite
     py_node_name = type(py_ast_node).__name__
@@ -4,7 +4,7 @@ import ast
 
 import astor
 
-from asdl.lang.py.py_asdl_helper import asdl_ast_to_python_ast, python_ast_to_asdl_ast
+from asdl.lang.py.py_asdl_helper import asdl_ast_to_python_ast, is_valid_primitive_value, python_ast_to_asdl_ast
 from asdl.lang.py.py_utils import tokenize_code
 from asdl.transition_system import TransitionSystem, GenTokenAction
 
@@ -67,6 +67,10 @@ class Python3TransitionSystem(TransitionSystem):
 
         return actions
 
+    def is_valid_primitive_token(self, primitive_type, token):
+        return (super(Python3TransitionSystem, self).is_valid_primitive_token(primitive_type, token)
+                and is_valid_primitive_value(primitive_type.name, token))
+
     def is_valid_hypothesis(self, hyp, **kwargs):
         try:
             hyp_code = self.ast_to_surface_code(hyp.tree)
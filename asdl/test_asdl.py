@@ -0,0 +1,26 @@
+# coding=utf-8
+
+import os
+import pickle
+
+import asdl.asdl
+from asdl.asdl import ASDLGrammar
+
+asdl_file = os.path.join(os.path.dirname(__file__), 'lang', 'java', 'java_asdl.simplified.txt')
+
+
+def test_grammars_of_older_versions_are_recompiled(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    grammar = ASDLGrammar.from_file(asdl_file, cache_dir=cache_dir)
+    state = pickle.dumps(grammar)
+
+    monkeypatch.setattr(asdl.asdl, 'GRAMMAR_CACHE_VERSION', asdl.asdl.GRAMMAR_CACHE_VERSION + 1)
+    # the grammar pickled with the previous tables is recompiled
+    old_grammar = pickle.loads(state)
+    assert old_grammar._compiled_version == asdl.asdl.GRAMMAR_CACHE_VERSION
+    # and the cache of the previous version is not read
+    assert len(os.listdir(cache_dir)) == 1
+    new_grammar = ASDLGrammar.from_file(asdl_file, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+    assert new_grammar._compiled_version == asdl.asdl.GRAMMAR_CACHE_VERSION
+    new_grammar.check_ids(grammar)
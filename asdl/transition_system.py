@@ -1,5 +1,7 @@
 # coding=utf-8
 
+from collections import OrderedDict
+
 
 class Action(object):
     pass
@@ -40,10 +42,70 @@ class ReduceAction(Action):
         return 'Reduce'
 
 
+class SurfaceCodeCache(object):
+    """
+    surface code and code tokens of the reference ASTs rendered by a transition
+    system, keyed on the fingerprints of the ASTs, so that a reference compared
+    to many hypotheses is rendered and tokenized only once. The hypotheses are
+    rendered once each and are not cached; the least recently used references
+    are evicted past `max_size` entries
+    """
+    def __init__(self, transition_system, max_size=10000):
+        self.transition_system = transition_system
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, asdl_ast):
+        """the surface code of `asdl_ast` and its tokens"""
+        key = asdl_ast.fingerprint
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            code = self.transition_system.ast_to_surface_code(asdl_ast)
+            entry = self.entries[key] = (code, self.transition_system.tokenize_code(code, None))
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+    def __repr__(self):
+        return 'SurfaceCodeCache(%d entries, %d hits, %d misses, hit rate %.1f%%)' % (
+            len(self.entries), self.hits, self.misses, 100 * self.hit_rate)
+
+
 class TransitionSystem(object):
     def __init__(self, grammar):
         self.grammar = grammar
 
+    @property
+    def surface_code_cache(self):
+        """the rendered code of the compared reference ASTs, see `compare_ast`"""
+        # created lazily, as transition systems are saved with the models
+        cache = self.__dict__.get('_surface_code_cache')
+        if cache is None:
+            cache = self._surface_code_cache = SurfaceCodeCache(self)
+        return cache
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop('_surface_code_cache', None)
+        return state
+
     def get_actions(self, asdl_ast):
         """
         generate action sequence given the ASDL Syntax Tree
@@ -110,8 +172,19 @@ class TransitionSystem(object):
     def get_primitive_field_actions(self, realized_field):
         raise NotImplementedError
 
+    def is_valid_primitive_token(self, primitive_type, token):
+        """
+        whether the GenToken action of `token` is valid on a field of the primitive type
+        `primitive_type`, used to mask the invalid tokens in beam search. The stop signal
+        only ends the values of the string fields, it would be the value of other fields
+        """
+        if token == '</primitive>':
+            return primitive_type.name == 'string'
+
+        return True
+
     def get_valid_continuation_types(self, hyp):
-        if hyp.tree:
+        if hyp.frontier_field:
             if self.grammar.is_composite_type(hyp.frontier_field.type):
                 if hyp.frontier_field.cardinality == 'single':
                     return ApplyRuleAction,
@@ -131,7 +204,7 @@ class TransitionSystem(object):
             return ApplyRuleAction,
 
     def get_valid_continuating_productions(self, hyp):
-        if hyp.tree:
+        if hyp.frontier_field:
             if self.grammar.is_composite_type(hyp.frontier_field.type):
                 return self.grammar[hyp.frontier_field.type]
             else:
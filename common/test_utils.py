@@ -0,0 +1,40 @@
+# coding=utf-8
+
+import json
+
+import pytest
+
+from common.utils import iter_json_file
+
+objects = [{'snippet': 'int f() { return %d; }' % i, 'intent': 'x' * (i * 7 % 50), 'n': [i, 1.5, None, True]}
+           for i in range(40)]
+
+
+def write(tmp_path, text):
+    path = tmp_path / 'data.json'
+    path.write_text(text)
+    return str(path)
+
+
+@pytest.mark.parametrize('buffer_size', [1, 7, 64, 1 << 16])
+def test_json_array(tmp_path, buffer_size):
+    # small buffers make the objects and the numbers span buffer boundaries
+    for text in [json.dumps(objects), json.dumps(objects, indent=2), '\n  ' + json.dumps(objects) + '\n\n']:
+        assert list(iter_json_file(write(tmp_path, text), buffer_size)) == objects
+    assert list(iter_json_file(write(tmp_path, '[12345, 6789]'), buffer_size)) == [12345, 6789]
+    assert list(iter_json_file(write(tmp_path, ' [ ] '), buffer_size)) == []
+
+
+@pytest.mark.parametrize('buffer_size', [1, 64])
+def test_json_lines(tmp_path, buffer_size):
+    text = '\n'.join(json.dumps(obj) for obj in objects) + '\n\n'
+    assert list(iter_json_file(write(tmp_path, text), buffer_size)) == objects
+    assert list(iter_json_file(write(tmp_path, ''), buffer_size)) == []
+
+
+@pytest.mark.parametrize('buffer_size', [1, 64])
+@pytest.mark.parametrize('text', ['[1 2]', '[,1]', '[1,,2]', '[1,]', '[1] x', '[1]]', '[1, 2', '[1, {"a": ',
+                                  '{\n  "a": 1\n}', '{"a": 1}\n{"a": \n'])
+def test_malformed_json(tmp_path, buffer_size, text):
+    with pytest.raises(ValueError):
+        list(iter_json_file(write(tmp_path, text), buffer_size))
@@ -1,5 +1,6 @@
 # coding=utf-8
 import argparse
+import json
 
 
 class cached_property(object):
@@ -21,6 +22,91 @@ class cached_property(object):
         return value
 
 
+def iter_json_file(file_path, buffer_size=1 << 16):
+    """
+    iterate over the objects of a file holding either a JSON array or one JSON object per
+    line (JSONL), without loading the whole file: only the object being decoded is in memory.
+    Raises a ValueError if the file is neither.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r') as f:
+        buffer = ''
+        while not buffer:
+            chunk = f.read(buffer_size)
+            if not chunk:
+                return
+            buffer = chunk.lstrip()
+        if not buffer.startswith('['):
+            f.seek(0)
+            yield from _iter_json_lines(file_path, f)
+            return
+
+        pos = 1
+        eof = False
+        read_size = buffer_size
+        # what comes next in the array: 'first' value or ']', 'value' after a ',', or
+        # 'separator' after a value, ',' or ']'
+        expected = 'first'
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+
+            if pos < len(buffer):
+                char = buffer[pos]
+                if expected == 'separator' or (expected == 'first' and char == ']'):
+                    if char == ',':
+                        pos += 1
+                        expected = 'value'
+                        continue
+                    elif char == ']':
+                        _check_json_end(file_path, f, buffer[pos + 1:], buffer_size)
+                        return
+                    raise ValueError(f"{file_path}: expected ',' or ']' in the JSON array, found {char!r}")
+                elif char in ',]':
+                    raise ValueError(f'{file_path}: expected a value in the JSON array, found {char!r}')
+
+                try:
+                    obj, end = decoder.raw_decode(buffer, pos)
+                    # a number at the end of the buffer may be cut
+                    if end < len(buffer) or eof:
+                        yield obj
+                        pos = end
+                        read_size = buffer_size
+                        expected = 'separator'
+                        continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                raise ValueError(f'{file_path}: the JSON array is not closed')
+
+            # the object is not complete, read more of the file
+            chunk = f.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            # read objects larger than the buffer in a linear time
+            read_size *= 2
+
+
+def _iter_json_lines(file_path, f):
+    for line_num, line in enumerate(f, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'{file_path}:{line_num}: invalid JSON line, the file must hold a JSON array '
+                                 f'or one JSON object per line: {e}') from e
+
+
+def _check_json_end(file_path, f, rest, buffer_size):
+    """check that only whitespace follows the JSON array, `rest` then the rest of `f`"""
+    while rest:
+        if not rest.isspace():
+            raise ValueError(f'{file_path}: unexpected data after the JSON array')
+        rest = f.read(buffer_size)
+
+
 def init_arg_parser():
     arg_parser = argparse.ArgumentParser()
 
@@ -113,6 +199,12 @@ def init_arg_parser():
     arg_parser.add_argument('--pretrain', type=str, help='path to the pretrained model file')
 
     arg_parser.add_argument('--batch_size', default=10, type=int, help='Batch size')
+    arg_parser.add_argument('--bucket_size', default=1, type=int,
+                            help='Number of batches whose shuffled examples are sorted by length together, '
+                                 'to reduce the padding in each batch. 1 disables the length bucketing')
+    arg_parser.add_argument('--num_loader_workers', default=0, type=int,
+                            help='Number of worker processes preparing the training batches, '
+                                 '0 prepares them in the main process')
     arg_parser.add_argument('--dropout', default=0., type=float, help='Dropout rate')
     arg_parser.add_argument('--word_dropout', default=0., type=float, help='Word dropout rate')
     arg_parser.add_argument('--decoder_word_dropout', default=0.3, type=float, help='Word dropout rate on decoder')
@@ -152,6 +244,15 @@ def init_arg_parser():
     #### decoding/validation/testing ####
     arg_parser.add_argument('--load_model', default=None, type=str, help='Load a pre-trained model')
     arg_parser.add_argument('--beam_size', default=5, type=int, help='Beam size for beam search')
+    arg_parser.add_argument('--decode_batch_size', default=16, type=int,
+                            help='Number of utterances decoded together in one batched beam search')
+    arg_parser.add_argument('--compact_decode_hypothesis', default=False, action='store_true',
+                            help='Only keep the actions and the frontier of the hypotheses during beam search, '
+                                 'and build the ASTs of the completed ones')
+    arg_parser.add_argument('--beam_recombination', default=None, choices=['max', 'logsumexp'],
+                            help='Merge the hypotheses which built the same partial tree during beam search, '
+                                 'keeping the max or the log-sum-exp of their scores, and the completed ones '
+                                 'with the same code')
     arg_parser.add_argument('--decode_max_time_step', default=100, type=int, help='Maximum number of time steps used '
                                                                                   'in decoding and sampling')
     arg_parser.add_argument('--sample_size', default=5, type=int, help='Sample size')
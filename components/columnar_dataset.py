@@ -0,0 +1,328 @@
+# coding=utf-8
+"""
+Columnar on-disk format of datasets, memory-mapped with NumPy so that opening a
+dataset takes constant time and its memory is shared by all the processes
+reading it (DDP ranks, data loader workers).
+
+A dataset is a directory of `.npy` columns:
+    strings_data, strings_offsets: utf-8 table of all the source and target tokens
+    src_tokens, src_offsets: string ids of the source tokens of each example
+    action_type, action_value, frontier_prod, frontier_field, parent_t, src_token_position,
+    action_offsets: the target actions of each example. `action_value` is the production id of
+        ApplyRule actions and the string id of the token of GenToken actions
+    info_data, info_offsets: pickled `idx`, `tgt_code` and non-string tokens of each example
+    meta_data, meta_offsets: pickled `tgt_ast` and `meta` of each example, decoded lazily
+and of the pickled grammar giving the ids of the productions and fields.
+
+Convert a pickled dataset with
+    python -m components.columnar_dataset --asdl_file <grammar> [--root_production <type,constructor>]
+        <dataset.bin> <output_dir>
+with the root production of the grammar used for training.
+"""
+
+import argparse
+import os
+import pickle
+import sys
+
+import numpy as np
+
+from asdl.asdl import ASDLGrammar
+from asdl.transition_system import ApplyRuleAction, ReduceAction, GenTokenAction
+from common.utils import cached_property
+from components.action_info import ActionInfo
+from components.dataset import Example, ACTION_APPLY_RULE, ACTION_REDUCE, ACTION_GEN_TOKEN
+
+ACTION_COLUMNS = ('action_type', 'action_value', 'frontier_prod', 'frontier_field', 'parent_t',
+                  'src_token_position')
+
+
+def _write_blob(path, name, chunks):
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(chunk) for chunk in chunks])
+    np.save(os.path.join(path, f'{name}_data.npy'), np.frombuffer(b''.join(chunks), dtype=np.uint8))
+    np.save(os.path.join(path, f'{name}_offsets.npy'), offsets)
+
+
+def write_columnar_dataset(examples, grammar, path):
+    """write the examples into the columnar dataset directory `path`"""
+    os.makedirs(path, exist_ok=True)
+
+    string_ids = dict()
+
+    def _string_id(string):
+        if string not in string_ids:
+            string_ids[string] = len(string_ids)
+        return string_ids[string]
+
+    src_tokens = []
+    src_offsets = [0]
+    columns = {name: [] for name in ACTION_COLUMNS}
+    action_offsets = [0]
+    infos = []
+    metas = []
+
+    for e in examples:
+        src_tokens.extend(_string_id(token) for token in e.src_sent)
+        src_offsets.append(len(src_tokens))
+
+        non_str_tokens = dict()
+        for t, action_info in enumerate(e.tgt_actions):
+            action = action_info.action
+            if isinstance(action, ApplyRuleAction):
+                columns['action_type'].append(ACTION_APPLY_RULE)
+                columns['action_value'].append(grammar.prod2id[action.production])
+            elif isinstance(action, ReduceAction):
+                columns['action_type'].append(ACTION_REDUCE)
+                columns['action_value'].append(-1)
+            else:
+                columns['action_type'].append(ACTION_GEN_TOKEN)
+                if isinstance(action.token, str):
+                    columns['action_value'].append(_string_id(action.token))
+                else:
+                    columns['action_value'].append(-1)
+                    non_str_tokens[t] = action.token
+
+            has_frontier = action_info.frontier_prod is not None
+            columns['frontier_prod'].append(grammar.prod2id[action_info.frontier_prod] if has_frontier else -1)
+            columns['frontier_field'].append(grammar.field2id[action_info.frontier_field] if has_frontier else -1)
+            columns['parent_t'].append(action_info.parent_t)
+            columns['src_token_position'].append(action_info.src_token_position
+                                                 if action_info.copy_from_src else -1)
+        action_offsets.append(len(columns['action_type']))
+
+        infos.append(pickle.dumps((e.idx, e.tgt_code, non_str_tokens), protocol=pickle.HIGHEST_PROTOCOL))
+        metas.append(pickle.dumps((e.tgt_ast, e.meta), protocol=pickle.HIGHEST_PROTOCOL))
+
+    strings = sorted(string_ids, key=string_ids.get)
+    _write_blob(path, 'strings', [string.encode('utf-8') for string in strings])
+    _write_blob(path, 'info', infos)
+    _write_blob(path, 'meta', metas)
+
+    np.save(os.path.join(path, 'src_tokens.npy'), np.array(src_tokens, dtype=np.int64))
+    np.save(os.path.join(path, 'src_offsets.npy'), np.array(src_offsets, dtype=np.int64))
+    np.save(os.path.join(path, 'action_type.npy'), np.array(columns.pop('action_type'), dtype=np.int8))
+    for name, column in columns.items():
+        np.save(os.path.join(path, f'{name}.npy'), np.array(column, dtype=np.int64))
+    np.save(os.path.join(path, 'action_offsets.npy'), np.array(action_offsets, dtype=np.int64))
+
+    with open(os.path.join(path, 'grammar.pkl'), 'wb') as f:
+        pickle.dump(grammar, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class ColumnarExamples(object):
+    """
+    read-only sequence of the examples of a columnar dataset, each `Example` is built on access
+    """
+
+    # opened datasets of this process, by path
+    _opened = dict()
+
+    def __init__(self, path):
+        self.path = path
+
+        def _load(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+
+        self.strings_data = _load('strings_data')
+        self.strings_offsets = _load('strings_offsets')
+        self.src_tokens = _load('src_tokens')
+        self.src_offsets = _load('src_offsets')
+        self.action_columns = {name: _load(name) for name in ACTION_COLUMNS}
+        self.action_offsets = _load('action_offsets')
+        self.info_data = _load('info_data')
+        self.info_offsets = _load('info_offsets')
+        self.meta_data = _load('meta_data')
+        self.meta_offsets = _load('meta_offsets')
+
+        with open(os.path.join(path, 'grammar.pkl'), 'rb') as f:
+            self.grammar = pickle.load(f)
+
+        # grammars checked to have the same ids as `self.grammar`
+        self._checked_grammars = []
+
+    @staticmethod
+    def open(path):
+        path = os.path.abspath(path)
+        if path not in ColumnarExamples._opened:
+            ColumnarExamples._opened[path] = ColumnarExamples(path)
+
+        return ColumnarExamples._opened[path]
+
+    def __reduce__(self):
+        # processes receiving examples map the files again instead of copying the columns
+        return ColumnarExamples.open, (self.path,)
+
+    def __len__(self):
+        return len(self.src_offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+
+        return ColumnarExample(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield ColumnarExample(self, i)
+
+    def get_lengths(self, i):
+        """numbers of target actions and source tokens of the i-th example"""
+        return (int(self.action_offsets[i + 1] - self.action_offsets[i]),
+                int(self.src_offsets[i + 1] - self.src_offsets[i]))
+
+    def get_string(self, string_id):
+        return self.strings_data[self.strings_offsets[string_id]: self.strings_offsets[string_id + 1]] \
+            .tobytes().decode('utf-8')
+
+    def get_src_token_ids(self, i):
+        return self.src_tokens[self.src_offsets[i]: self.src_offsets[i + 1]]
+
+    def get_action_columns(self, i):
+        begin, end = self.action_offsets[i], self.action_offsets[i + 1]
+        return {name: np.asarray(column[begin: end]) for name, column in self.action_columns.items()}
+
+    def get_info(self, i):
+        return pickle.loads(self.info_data[self.info_offsets[i]: self.info_offsets[i + 1]].tobytes())
+
+    def get_meta(self, i):
+        return pickle.loads(self.meta_data[self.meta_offsets[i]: self.meta_offsets[i + 1]].tobytes())
+
+    def check_grammar(self, grammar):
+        if grammar is self.grammar or any(grammar is checked for checked in self._checked_grammars):
+            return
+        grammar.check_ids(self.grammar)
+        self._checked_grammars.append(grammar)
+
+
+class ColumnarExample(Example):
+    """an example of a columnar dataset, its fields are decoded on access"""
+
+    def __init__(self, examples, i):
+        self.examples = examples
+        self.i = i
+
+    @cached_property
+    def src_sent(self):
+        return [self.examples.get_string(string_id) for string_id in self.examples.get_src_token_ids(self.i)]
+
+    @cached_property
+    def _info(self):
+        return self.examples.get_info(self.i)
+
+    @cached_property
+    def idx(self):
+        return self._info[0]
+
+    @cached_property
+    def tgt_code(self):
+        return self._info[1]
+
+    @cached_property
+    def tgt_ast(self):
+        self.tgt_ast, self.meta = self.examples.get_meta(self.i)
+        return self.tgt_ast
+
+    @cached_property
+    def meta(self):
+        self.tgt_ast, self.meta = self.examples.get_meta(self.i)
+        return self.meta
+
+    def _get_token(self, t, token_id):
+        return self.examples.get_string(token_id) if token_id >= 0 else self._info[2][t]
+
+    @cached_property
+    def tgt_actions(self):
+        grammar = self.examples.grammar
+        columns = self.examples.get_action_columns(self.i)
+        action_infos = []
+        for t, (action_type, action_value, frontier_prod, frontier_field, parent_t, src_token_position) \
+                in enumerate(zip(*(columns[name].tolist() for name in ACTION_COLUMNS))):
+            if action_type == ACTION_APPLY_RULE:
+                action = ApplyRuleAction(grammar.id2prod[action_value])
+            elif action_type == ACTION_REDUCE:
+                action = ReduceAction()
+            else:
+                action = GenTokenAction(self._get_token(t, action_value))
+
+            action_info = ActionInfo(action)
+            action_info.t = t
+            action_info.parent_t = parent_t
+            if frontier_prod >= 0:
+                action_info.frontier_prod = grammar.id2prod[frontier_prod]
+                action_info.frontier_field = grammar.id2field[frontier_field]
+            if src_token_position >= 0:
+                action_info.copy_from_src = True
+                action_info.src_token_position = src_token_position
+            action_infos.append(action_info)
+
+        return action_infos
+
+    def get_index_arrays(self, grammar):
+        index_arrays = getattr(self, 'index_arrays', None)
+        if index_arrays is not None:
+            return index_arrays
+
+        # built from the columns, without decoding the actions
+        self.examples.check_grammar(grammar)
+        columns = self.examples.get_action_columns(self.i)
+        action_type = columns['action_type']
+        action_value = columns['action_value']
+        has_frontier = columns['frontier_prod'] >= 0
+        gen_token = action_type == ACTION_GEN_TOKEN
+
+        rule_idx = np.where(action_type == ACTION_APPLY_RULE, action_value, 0)
+        rule_idx[action_type == ACTION_REDUCE] = len(grammar)
+        frontier_field_idx = np.where(has_frontier, columns['frontier_field'], 0)
+
+        tokens = [None] * len(action_type)
+        copy_pos = []
+        src_token_ids = np.asarray(self.examples.get_src_token_ids(self.i))
+        for t in np.nonzero(gen_token)[0].tolist():
+            token_id = int(action_value[t])
+            tokens[t] = self._get_token(t, token_id)
+            if token_id >= 0:
+                token_pos_list = np.nonzero(src_token_ids == token_id)[0].tolist()
+            else:
+                token_pos_list = [pos for pos, token in enumerate(self.src_sent) if token == str(tokens[t])]
+            copy_pos.extend((t, pos) for pos in token_pos_list)
+
+        self.index_arrays = dict(grammar_digest=grammar.id_digest,
+                                 action_type=action_type,
+                                 rule_idx=rule_idx,
+                                 frontier_prod_idx=np.where(has_frontier, columns['frontier_prod'], 0),
+                                 frontier_field_idx=frontier_field_idx,
+                                 frontier_field_type_idx=np.where(has_frontier,
+                                                                  grammar.field_type_ids[frontier_field_idx], 0),
+                                 parent_t=np.where(has_frontier, columns['parent_t'], 0),
+                                 tokens=tokens,
+                                 copy_pos=np.array(copy_pos, dtype=np.int64).reshape(-1, 2))
+
+        return self.index_arrays
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='convert a pickled dataset into the columnar format')
+    arg_parser.add_argument('--asdl_file', type=str, required=True, help='Path to ASDL grammar specification')
+    arg_parser.add_argument('--root_production', type=str, default=None,
+                            help='comma concatenation of root production type and constructor, '
+                                 'the same as for training. Example: typedeclaration,MethodDeclaration')
+    arg_parser.add_argument('bin_file', type=str, help='Pickled dataset (.bin)')
+    arg_parser.add_argument('output_dir', type=str, help='Directory of the columnar dataset')
+    args = arg_parser.parse_args(argv)
+
+    root_production = None
+    if args.root_production:
+        root_production = args.root_production.split(',')
+    grammar = ASDLGrammar.from_file(args.asdl_file, root_production)
+    examples = pickle.load(open(args.bin_file, 'rb'))
+    write_columnar_dataset(examples, grammar, args.output_dir)
+    print(f'wrote {len(examples)} examples to [{args.output_dir}]', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
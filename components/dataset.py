@@ -1,5 +1,6 @@
 # coding=utf-8
 from collections import OrderedDict
+import os
 
 import torch
 import numpy as np
@@ -9,8 +10,10 @@ except:
     import pickle
 
 from torch.autograd import Variable
+from torch.utils.data import DataLoader, Sampler
 
 from asdl.transition_system import ApplyRuleAction, ReduceAction
+from components.action_info import ActionInfo
 from common.utils import cached_property
 
 from model import nn_utils
@@ -30,22 +33,71 @@ class Dataset(object):
 
     @staticmethod
     def from_bin_file(file_path):
+        if os.path.isdir(file_path):
+            # columnar dataset, see components/columnar_dataset.py
+            from components.columnar_dataset import ColumnarExamples
+            return Dataset(ColumnarExamples.open(file_path))
+
         examples = pickle.load(open(file_path, 'rb'))
         return Dataset(examples)
 
-    def batch_iter(self, batch_size, shuffle=False):
-        index_arr = np.arange(len(self.examples))
-        if shuffle:
-            np.random.shuffle(index_arr)
-
-        batch_num = int(np.ceil(len(self.examples) / float(batch_size)))
-        for batch_id in range(batch_num):
-            batch_ids = index_arr[batch_size * batch_id: batch_size * (batch_id + 1)]
+    def batch_iter(self, batch_size, shuffle=False, bucket_size=1):
+        for batch_ids in Dataset.batch_ids(self.examples, batch_size, shuffle=shuffle, bucket_size=bucket_size):
             batch_examples = [self.examples[i] for i in batch_ids]
             batch_examples.sort(key=lambda e: -len(e.src_sent))
 
             yield batch_examples
 
+    @staticmethod
+    def batch_ids(examples, batch_size, shuffle=False, bucket_size=1):
+        """
+        split the ids of the examples into batches. When shuffling with `bucket_size` > 1, the
+        shuffled examples are split into pools of `bucket_size` batches, each pool is sorted by
+        target and source lengths before being cut into batches, and the order of all the
+        batches is shuffled again. A batch then groups examples of similar lengths, which
+        reduces the padding, while the batches stay random across the epochs.
+        """
+        index_arr = np.arange(len(examples))
+        if shuffle:
+            np.random.shuffle(index_arr)
+
+        if not shuffle or bucket_size <= 1:
+            batch_num = int(np.ceil(len(examples) / float(batch_size)))
+            for batch_id in range(batch_num):
+                yield index_arr[batch_size * batch_id: batch_size * (batch_id + 1)].tolist()
+            return
+
+        def _length(idx):
+            e = examples[idx]
+            return len(e.tgt_actions) if e.tgt_actions is not None else 0, len(e.src_sent)
+
+        if hasattr(examples, 'get_lengths'):
+            # lengths read without building the examples
+            _length = examples.get_lengths
+
+        pool_size = batch_size * bucket_size
+        batches = []
+        for i in range(0, len(index_arr), pool_size):
+            pool = sorted(index_arr[i: i + pool_size].tolist(), key=_length)
+            batches.extend(pool[j: j + batch_size] for j in range(0, len(pool), batch_size))
+
+        for batch_id in np.random.permutation(len(batches)):
+            yield batches[batch_id]
+
+    def data_loader(self, batch_size, shuffle=False, collate_fn=None, num_workers=0, bucket_size=1):
+        """
+        a `torch.utils.data.DataLoader` over the batches of the dataset. Each batch is made by
+        `collate_fn` (an `ExampleCollator` by default). With `num_workers` > 0, the batches are
+        made in worker processes and prefetched while the model runs on the previous ones.
+        See `Dataset.batch_ids` for `bucket_size`.
+        """
+        return DataLoader(self.examples,
+                          batch_sampler=BucketBatchSampler(self.examples, batch_size, shuffle=shuffle,
+                                                           bucket_size=bucket_size),
+                          collate_fn=collate_fn or ExampleCollator(),
+                          num_workers=num_workers,
+                          persistent_workers=num_workers > 0)
+
     def __len__(self):
         return len(self.examples)
 
@@ -53,6 +105,83 @@ class Dataset(object):
         return iter(self.examples)
 
 
+class BucketBatchSampler(Sampler):
+    """sample the example ids of each batch, see `Dataset.batch_ids`"""
+    def __init__(self, examples, batch_size, shuffle=False, bucket_size=1):
+        self.examples = examples
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size = bucket_size
+
+    def __iter__(self):
+        return Dataset.batch_ids(self.examples, self.batch_size, shuffle=self.shuffle, bucket_size=self.bucket_size)
+
+    def __len__(self):
+        return int(np.ceil(len(self.examples) / float(self.batch_size)))
+
+
+class PaddingCounter(object):
+    """
+    counts the target actions of batches of examples and their padded number as the batches
+    come, so that the examples need not be kept to compute the padding ratio of an epoch
+    """
+    def __init__(self):
+        self.action_num = 0
+        self.padded_action_num = 0
+
+    def add(self, batch_examples):
+        action_nums = [len(e.tgt_actions) for e in batch_examples]
+        self.action_num += sum(action_nums)
+        self.padded_action_num += len(action_nums) * max(action_nums, default=0)
+
+    @property
+    def ratio(self):
+        """ratio of the padded target actions, i.e. of the wasted decoder steps"""
+        return 1. - self.action_num / self.padded_action_num if self.padded_action_num else 0.
+
+
+class ExampleCollator(object):
+    """
+    collate function of `Dataset.data_loader`, returns the examples of a batch sorted by
+    decreasing source length, without the ones with more than `max_action_num` target actions
+    """
+    def __init__(self, max_action_num=None):
+        self.max_action_num = max_action_num
+
+    def __call__(self, examples):
+        if self.max_action_num is not None:
+            examples = [e for e in examples if len(e.tgt_actions) <= self.max_action_num]
+        examples.sort(key=lambda e: -len(e.src_sent))
+
+        return examples
+
+
+class BatchCollator(ExampleCollator):
+    """
+    collate function of `Dataset.data_loader` which also builds the `Batch` of the examples.
+    The batch is built on CPU, `Batch.to_cuda` moves it to the GPU.
+    """
+    def __init__(self, grammar, vocab, copy=True, max_action_num=None):
+        super(BatchCollator, self).__init__(max_action_num)
+        self.grammar = grammar
+        self.vocab = vocab
+        self.copy = copy
+
+    def __call__(self, examples):
+        examples = super(BatchCollator, self).__call__(examples)
+        batch = Batch(examples, self.grammar, self.vocab, copy=self.copy)
+        # also build the source tensors in the loader
+        batch.init_source_tensors()
+
+        return batch
+
+
+# types of the target actions, in `Example.get_index_arrays`
+ACTION_APPLY_RULE = 0
+ACTION_REDUCE = 1
+ACTION_GEN_TOKEN = 2
+
+
 class Example(object):
     def __init__(self, src_sent, tgt_actions, tgt_code, tgt_ast, idx=0, meta=None):
         self.src_sent = src_sent
@@ -63,6 +192,89 @@ class Example(object):
         self.idx = idx
         self.meta = meta
 
+    def get_index_arrays(self, grammar):
+        """
+        integer arrays describing the target actions, indexed by time step. They only depend
+        on the ids of the grammar, so they are computed once (at preprocessing time if possible)
+        and stored with the example, keyed on `ASDLGrammar.id_digest`:
+            action_type: ACTION_APPLY_RULE, ACTION_REDUCE or ACTION_GEN_TOKEN
+            rule_idx: id of the production for ApplyRule actions, len(grammar) for Reduce actions
+            frontier_prod_idx, frontier_field_idx, frontier_field_type_idx: ids of the frontier
+                production, field and field type (0 at the first time step)
+            parent_t: time step of the parent action
+            tokens: token of each GenToken action, None for the other actions
+            copy_pos: (time step, source position) pairs of the source tokens equal to the
+                generated tokens
+        """
+        index_arrays = getattr(self, 'index_arrays', None)
+        if index_arrays is None or index_arrays.get('grammar_digest') != grammar.id_digest:
+            index_arrays = self.index_arrays = Example.build_index_arrays(self.src_sent, self.tgt_actions, grammar)
+
+        return index_arrays
+
+    @staticmethod
+    def build_index_arrays(src_sent, tgt_actions, grammar):
+        action_num = len(tgt_actions)
+        action_type = np.zeros(action_num, dtype=np.int8)
+        rule_idx = np.zeros(action_num, dtype=np.int64)
+        frontier_prod_idx = np.zeros(action_num, dtype=np.int64)
+        frontier_field_idx = np.zeros(action_num, dtype=np.int64)
+        parent_t = np.zeros(action_num, dtype=np.int64)
+        tokens = [None] * action_num
+        copy_pos = []
+
+        src_token_pos = dict()
+        for pos, token in enumerate(src_sent):
+            src_token_pos.setdefault(token, []).append(pos)
+
+        for t, action_info in enumerate(tgt_actions):
+            action = action_info.action
+            if isinstance(action, ApplyRuleAction):
+                action_type[t] = ACTION_APPLY_RULE
+                rule_idx[t] = grammar.prod2id[action.production]
+            elif isinstance(action, ReduceAction):
+                action_type[t] = ACTION_REDUCE
+                rule_idx[t] = len(grammar)
+            else:
+                action_type[t] = ACTION_GEN_TOKEN
+                tokens[t] = action.token
+                token_pos_list = src_token_pos.get(str(action.token), [])
+                if token_pos_list:
+                    assert action_info.copy_from_src
+                    assert action_info.src_token_position in token_pos_list
+                copy_pos.extend((t, pos) for pos in token_pos_list)
+
+            if t > 0:
+                frontier_prod_idx[t] = grammar.prod2id[action_info.frontier_prod]
+                frontier_field_idx[t] = grammar.field2id[action_info.frontier_field]
+                parent_t[t] = action_info.parent_t
+
+        return dict(grammar_digest=grammar.id_digest,
+                    action_type=action_type,
+                    rule_idx=rule_idx,
+                    frontier_prod_idx=frontier_prod_idx,
+                    frontier_field_idx=frontier_field_idx,
+                    frontier_field_type_idx=grammar.field_type_ids[frontier_field_idx] * (np.arange(action_num) > 0),
+                    parent_t=parent_t,
+                    tokens=tokens,
+                    copy_pos=np.array(copy_pos, dtype=np.int64).reshape(-1, 2))
+
+
+class BatchExample(object):
+    """
+    the fields of an example used once its batch is built, which a `Batch` sends instead
+    of the example, without its AST, code and meta data, and with only the actions of
+    its action infos
+    """
+    def __init__(self, example):
+        self.idx = example.idx
+        self.src_sent = example.src_sent
+        self.actions = [a.action for a in example.tgt_actions]
+
+    @property
+    def tgt_actions(self):
+        return [ActionInfo(action) for action in self.actions]
+
 
 class Batch(object):
     def __init__(self, examples, grammar, vocab, copy=True, cuda=False):
@@ -82,138 +294,116 @@ class Batch(object):
     def __len__(self):
         return len(self.examples)
 
-    def get_frontier_field_idx(self, t):
-        ids = []
-        for e in self.examples:
-            if t < len(e.tgt_actions):
-                ids.append(self.grammar.field2id[e.tgt_actions[t].frontier_field])
-                # assert self.grammar.id2field[ids[-1]] == e.tgt_actions[t].frontier_field
-            else:
-                ids.append(0)
+    def __getstate__(self):
+        # sent by the data loader workers: the tensors and the light fields of the examples,
+        # `attach` gives the grammar and the vocabulary back to the batch
+        state = dict(self.__dict__)
+        state['examples'] = [BatchExample(e) for e in self.examples]
+        state['grammar'] = state['vocab'] = None
+        return state
 
-        return Variable(torch.cuda.LongTensor(ids)) if self.cuda else Variable(torch.LongTensor(ids))
+    def attach(self, grammar, vocab):
+        """set the grammar and the vocabulary of a batch received from a data loader worker"""
+        self.grammar = grammar
+        self.vocab = vocab
 
-    def get_frontier_prod_idx(self, t):
-        ids = []
-        for e in self.examples:
-            if t < len(e.tgt_actions):
-                ids.append(self.grammar.prod2id[e.tgt_actions[t].frontier_prod])
-                # assert self.grammar.id2prod[ids[-1]] == e.tgt_actions[t].frontier_prod
-            else:
-                ids.append(0)
+        return self
 
-        return Variable(torch.cuda.LongTensor(ids)) if self.cuda else Variable(torch.LongTensor(ids))
+    def to_cuda(self):
+        """move the tensors of the batch to the GPU"""
+        for name, value in list(self.__dict__.items()):
+            if isinstance(value, torch.Tensor):
+                setattr(self, name, value.cuda())
+        self.cuda = True
 
-    def get_frontier_field_type_idx(self, t):
-        ids = []
-        for e in self.examples:
-            if t < len(e.tgt_actions):
-                ids.append(self.grammar.type2id[e.tgt_actions[t].frontier_field.type])
-                # assert self.grammar.id2type[ids[-1]] == e.tgt_actions[t].frontier_field.type
-            else:
-                ids.append(0)
+        return self
 
-        return Variable(torch.cuda.LongTensor(ids)) if self.cuda else Variable(torch.LongTensor(ids))
+    def get_frontier_field_idx(self, t):
+        return self.frontier_field_idx_matrix[t]
+
+    def get_frontier_prod_idx(self, t):
+        return self.frontier_prod_idx_matrix[t]
+
+    def get_frontier_field_type_idx(self, t):
+        return self.frontier_field_type_idx_matrix[t]
 
     def init_index_tensors(self):
-        self.apply_rule_idx_matrix = []
-        self.apply_rule_mask = []
-        self.primitive_idx_matrix = []
-        self.gen_token_mask = []
-        self.primitive_copy_mask = []
-        self.primitive_copy_token_idx_mask = np.zeros((self.max_action_num, len(self), max(self.src_sents_len)), dtype='float32')
-
-        for t in range(self.max_action_num):
-            app_rule_idx_row = []
-            app_rule_mask_row = []
-            token_row = []
-            gen_token_mask_row = []
-            copy_mask_row = []
-
-            for e_id, e in enumerate(self.examples):
-                app_rule_idx = app_rule_mask = token_idx = gen_token_mask = copy_mask = 0
-                if t < len(e.tgt_actions):
-                    action = e.tgt_actions[t].action
-                    action_info = e.tgt_actions[t]
-
-                    if isinstance(action, ApplyRuleAction):
-                        app_rule_idx = self.grammar.prod2id[action.production]
-                        # assert self.grammar.id2prod[app_rule_idx] == action.production
-                        app_rule_mask = 1
-                    elif isinstance(action, ReduceAction):
-                        app_rule_idx = len(self.grammar)
-                        app_rule_mask = 1
-                    else:
-                        src_sent = self.src_sents[e_id]
-                        token = str(action.token)
-                        token_idx = self.vocab.primitive[action.token]
-
-                        token_can_copy = False
-
-                        if self.copy and token in src_sent:
-                            token_pos_list = [idx for idx, _token in enumerate(src_sent) if _token == token]
-                            self.primitive_copy_token_idx_mask[t, e_id, token_pos_list] = 1.
-                            copy_mask = 1
-                            token_can_copy = True
-
-                        if token_can_copy is False or token_idx != self.vocab.primitive.unk_id:
-                            # if the token is not copied, we can only generate this token from the vocabulary,
-                            # even if it is a <unk>.
-                            # otherwise, we can still generate it from the vocabulary
-                            gen_token_mask = 1
-
-                        if token_can_copy:
-                            assert action_info.copy_from_src
-                            assert action_info.src_token_position in token_pos_list
-
-                        # # cannot copy, only generation
-                        # # could be unk!
-                        # if not action_info.copy_from_src:
-                        #     gen_token_mask = 1
-                        # else:  # copy
-                        #     copy_mask = 1
-                        #     copy_pos = action_info.src_token_position
-                        #     if token_idx != self.vocab.primitive.unk_id:
-                        #         # both copy and generate from vocabulary
-                        #         gen_token_mask = 1
-
-                app_rule_idx_row.append(app_rule_idx)
-                app_rule_mask_row.append(app_rule_mask)
-
-                token_row.append(token_idx)
-                gen_token_mask_row.append(gen_token_mask)
-                copy_mask_row.append(copy_mask)
-
-            self.apply_rule_idx_matrix.append(app_rule_idx_row)
-            self.apply_rule_mask.append(app_rule_mask_row)
-
-            self.primitive_idx_matrix.append(token_row)
-            self.gen_token_mask.append(gen_token_mask_row)
-
-            self.primitive_copy_mask.append(copy_mask_row)
+        max_action_num = self.max_action_num
+        batch_size = len(self)
+        primitive_vocab = self.vocab.primitive
+
+        def _stack(key, dtype=np.int64):
+            # (max_action_num, batch_size), padded with zeros
+            matrix = np.zeros((max_action_num, batch_size), dtype=dtype)
+            for e_id, index_arrays in enumerate(examples_index_arrays):
+                matrix[:len(index_arrays[key]), e_id] = index_arrays[key]
+            return matrix
+
+        examples_index_arrays = [e.get_index_arrays(self.grammar) for e in self.examples]
+
+        # (max_action_num, batch_size)
+        action_mask = np.zeros((max_action_num, batch_size), dtype=bool)
+        for e_id, e in enumerate(self.examples):
+            action_mask[:len(e.tgt_actions), e_id] = True
+        action_type = _stack('action_type', dtype=np.int8)
+
+        apply_rule_mask = action_mask & (action_type != ACTION_GEN_TOKEN)
+        gen_token = action_mask & (action_type == ACTION_GEN_TOKEN)
+
+        primitive_idx_matrix = np.zeros((max_action_num, batch_size), dtype=np.int64)
+        self.primitive_copy_token_idx_mask = np.zeros((max_action_num, batch_size, max(self.src_sents_len)),
+                                                      dtype='float32')
+        for e_id, index_arrays in enumerate(examples_index_arrays):
+            for t, token in enumerate(index_arrays['tokens']):
+                if token is not None:
+                    primitive_idx_matrix[t, e_id] = primitive_vocab[token]
+
+            if self.copy and len(index_arrays['copy_pos']):
+                copy_pos = index_arrays['copy_pos']
+                self.primitive_copy_token_idx_mask[copy_pos[:, 0], e_id, copy_pos[:, 1]] = 1.
+
+        primitive_copy_mask = self.primitive_copy_token_idx_mask.any(axis=-1)
+        # if the token is not copied, we can only generate this token from the vocabulary,
+        # even if it is a <unk>.
+        # otherwise, we can still generate it from the vocabulary
+        gen_token_mask = gen_token & (~primitive_copy_mask | (primitive_idx_matrix != primitive_vocab.unk_id))
+
+        self.parent_t_matrix = _stack('parent_t')
 
         T = torch.cuda if self.cuda else torch
-        self.apply_rule_idx_matrix = Variable(T.LongTensor(self.apply_rule_idx_matrix))
-        self.apply_rule_mask = Variable(T.FloatTensor(self.apply_rule_mask))
-        self.primitive_idx_matrix = Variable(T.LongTensor(self.primitive_idx_matrix))
-        self.gen_token_mask = Variable(T.FloatTensor(self.gen_token_mask))
-        self.primitive_copy_mask = Variable(T.FloatTensor(self.primitive_copy_mask))
+        self.action_mask = Variable(T.FloatTensor(action_mask.astype('float32')))
+        self.apply_rule_idx_matrix = Variable(T.LongTensor(_stack('rule_idx')))
+        self.apply_rule_mask = Variable(T.FloatTensor(apply_rule_mask.astype('float32')))
+        self.primitive_idx_matrix = Variable(T.LongTensor(primitive_idx_matrix))
+        self.gen_token_mask = Variable(T.FloatTensor(gen_token_mask.astype('float32')))
+        self.primitive_copy_mask = Variable(T.FloatTensor(primitive_copy_mask.astype('float32')))
         self.primitive_copy_token_idx_mask = Variable(torch.from_numpy(self.primitive_copy_token_idx_mask))
         if self.cuda: self.primitive_copy_token_idx_mask = self.primitive_copy_token_idx_mask.cuda()
 
+        self.frontier_prod_idx_matrix = Variable(T.LongTensor(_stack('frontier_prod_idx')))
+        self.frontier_field_idx_matrix = Variable(T.LongTensor(_stack('frontier_field_idx')))
+        self.frontier_field_type_idx_matrix = Variable(T.LongTensor(_stack('frontier_field_type_idx')))
+
     @property
     def primitive_mask(self):
         return 1. - torch.eq(self.gen_token_mask + self.primitive_copy_mask, 0).float()
 
+    def init_source_tensors(self):
+        """build the source tensors now instead of on first use, e.g. in a data loader worker"""
+        self.src_sents_var = nn_utils.to_input_variable(self.src_sents, self.vocab.source,
+                                                        cuda=self.cuda)
+        self.src_token_mask = nn_utils.length_array_to_mask_tensor(self.src_sents_len,
+                                                                   cuda=self.cuda)
+
     @cached_property
     def src_sents_var(self):
-        return nn_utils.to_input_variable(self.src_sents, self.vocab.source,
-                                          cuda=self.cuda)
+        self.init_source_tensors()
+        return self.src_sents_var
 
     @cached_property
     def src_token_mask(self):
-        return nn_utils.length_array_to_mask_tensor(self.src_sents_len,
-                                                    cuda=self.cuda)
+        self.init_source_tensors()
+        return self.src_token_mask
 
     @cached_property
     def token_pos_list(self):
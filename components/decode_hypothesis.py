@@ -1,6 +1,7 @@
 # coding=utf-8
 
 from asdl.asdl import *
+from asdl.asdl_ast import RealizedField
 from asdl.hypothesis import Hypothesis
 from asdl.transition_system import *
 
@@ -22,8 +23,8 @@ class DecodeHypothesis(Hypothesis):
 
     def copy(self):
         new_hyp = DecodeHypothesis()
-        if self.tree:
-            new_hyp.tree = self.tree.copy()
+        new_hyp.tree, new_hyp._frontier_stack = self.copy_tree()
+        new_hyp.update_frontier_info()
 
         new_hyp.actions = list(self.actions)
         new_hyp.action_infos = list(self.action_infos)
@@ -32,6 +33,162 @@ class DecodeHypothesis(Hypothesis):
         new_hyp.t = self.t
         new_hyp.code = self.code
 
-        new_hyp.update_frontier_info()
+        return new_hyp
+
+    @property
+    def recombination_key(self):
+        """
+        the hypotheses with the same key have built the same (partial) tree and are at the
+        same position in it, so that they have the same continuations, see `Parser.parse`
+        """
+        return (self.tree.fingerprint, tuple(field_idx for _, field_idx in self._frontier_stack),
+                tuple(self._value_buffer))
+
+
+class FrontierFrame(object):
+    """an immutable frame of the frontier stack of a `CompactDecodeHypothesis`,
+    i.e. a node being generated and the index of its field being generated"""
+
+    __slots__ = ('production', 'created_time', 'field_idx', 'parent')
+
+    # unfinished fields of each production, shared by all the frames
+    _field_templates = dict()
+
+    def __init__(self, production, created_time, field_idx=0, parent=None):
+        self.production = production
+        self.created_time = created_time
+        self.field_idx = field_idx
+        self.parent = parent
+
+    @property
+    def field(self):
+        fields = FrontierFrame._field_templates.get(self.production)
+        if fields is None:
+            fields = FrontierFrame._field_templates[self.production] = \
+                [RealizedField(field) for field in self.production.fields]
+
+        return fields[self.field_idx]
+
+    def next_field(self):
+        return FrontierFrame(self.production, self.created_time, self.field_idx + 1, self.parent)
+
+
+class CompactDecodeHypothesis(object):
+    """
+    A hypothesis used during beam search which does not build its AST. It only keeps
+    its last action, the hypothesis it was expanded from and the frontier stack, which
+    is shared with its parent hypothesis. Cloning is therefore O(1) in the number of actions
+    and the size of the tree. A completed hypothesis is turned into a `DecodeHypothesis`
+    by replaying its actions with `to_decode_hypothesis`.
+    """
+
+    def __init__(self):
+        self.prev_hyp = None
+        self.action_info = None
+        self.score = 0.
+        self.t = 0
+
+        self._frontier = None
+        self._value_buffer = ()
+
+    @property
+    def frontier_node(self):
+        return self._frontier
+
+    @property
+    def frontier_field(self):
+        return self._frontier.field if self._frontier else None
+
+    @property
+    def last_action(self):
+        return self.action_info.action if self.action_info else None
+
+    @property
+    def action_infos(self):
+        action_infos = []
+        hyp = self
+        while hyp.action_info:
+            action_infos.append(hyp.action_info)
+            hyp = hyp.prev_hyp
+        action_infos.reverse()
+
+        return action_infos
+
+    @property
+    def actions(self):
+        return [action_info.action for action_info in self.action_infos]
+
+    @property
+    def completed(self):
+        return self.t > 0 and self._frontier is None
+
+    def clone_and_apply_action_info(self, action_info):
+        action = action_info.action
+        frontier = self._frontier
+        value_buffer = self._value_buffer
+
+        if self.t == 0:
+            assert isinstance(action, ApplyRuleAction), (
+              f'Invalid action [{action}], only ApplyRule action is valid '
+              f'at the beginning of decoding')
+
+            frontier = FrontierFrame(action.production, 0)
+        elif frontier:
+            field = frontier.field
+            if isinstance(field.type, ASDLCompositeType):
+                if isinstance(action, ApplyRuleAction):
+                    # a field with single or optional cardinality is finished by its value
+                    parent = frontier if field.cardinality == 'multiple' else frontier.next_field()
+                    frontier = FrontierFrame(action.production, self.t, parent=parent)
+                elif isinstance(action, ReduceAction):
+                    assert field.cardinality in ('optional', 'multiple'), (
+                        'Reduce action can only be applied on field with '
+                        'multiple cardinality')
+                    frontier = frontier.next_field()
+                else:
+                    raise ValueError(f'Invalid action [{action}] on field '
+                                     f'[{field}]')
+            else:  # fill in a primitive field
+                if isinstance(action, GenTokenAction):
+                    end_primitive = True
+                    if field.type.name == 'string':
+                        if action.is_stop_signal():
+                            value_buffer = ()
+                        else:
+                            value_buffer = value_buffer + (action.token,)
+                            end_primitive = False
+
+                    if end_primitive and field.cardinality in ('single', 'optional'):
+                        frontier = frontier.next_field()
+                elif isinstance(action, ReduceAction):
+                    assert field.cardinality in ('optional', 'multiple'), (
+                      'Reduce action can only be applied on field with '
+                      'multiple cardinality')
+                    frontier = frontier.next_field()
+                else:
+                    raise ValueError('Can only invoke GenToken or Reduce '
+                                     'actions on primitive fields')
+
+        # pop the frames of the finished nodes
+        while frontier and frontier.field_idx == len(frontier.production.fields):
+            frontier = frontier.parent
+
+        new_hyp = CompactDecodeHypothesis()
+        new_hyp.prev_hyp = self
+        new_hyp.action_info = action_info
+        new_hyp.score = self.score
+        new_hyp.t = self.t + 1
+        new_hyp._frontier = frontier
+        new_hyp._value_buffer = value_buffer
 
         return new_hyp
+
+    def to_decode_hypothesis(self):
+        """build the AST of the hypothesis by replaying its actions"""
+        hyp = DecodeHypothesis()
+        for action_info in self.action_infos:
+            hyp.apply_action(action_info.action)
+            hyp.action_infos.append(action_info)
+        hyp.score = self.score
+
+        return hyp
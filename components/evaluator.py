@@ -15,6 +15,8 @@ class Evaluator(object):
         return self.transition_system.compare_ast(hyp.tree, example.tgt_ast)
 
     def evaluate_dataset(self, examples, decode_results, fast_mode=False):
+        surface_code_cache = self.transition_system.surface_code_cache
+        surface_code_cache.clear()
         correct_array = []
         oracle_array = []
         for example, hyp_list in zip(examples, decode_results):
@@ -44,6 +46,9 @@ class Evaluator(object):
                 correct_array.append(False)
                 oracle_array.append(False)
 
+        if surface_code_cache.hits or surface_code_cache.misses:
+            print('Rendered references: %s' % surface_code_cache, file=sys.stderr)
+
         acc = np.average(correct_array)
 
         oracle_acc = np.average(oracle_array)
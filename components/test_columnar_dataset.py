@@ -0,0 +1,39 @@
+# coding=utf-8
+
+import os
+import pickle
+
+import javalang.parse
+from asdl.asdl import ASDLGrammar
+from asdl.lang.java.java_asdl_helper import java_ast_to_action_infos, java_ast_to_asdl_ast
+from components.columnar_dataset import main
+from components.dataset import Dataset, Example
+
+asdl_file = os.path.join(os.path.dirname(__file__), '..', 'asdl', 'lang', 'java', 'java_asdl.simplified.txt')
+root_production = ('typedeclaration', 'MethodDeclaration')
+
+
+def test_convert_with_root_production(tmp_path):
+    grammar = ASDLGrammar.from_file(asdl_file, root_production, cache_dir=str(tmp_path / 'cache'))
+    examples = []
+    for i, code in enumerate(['int f() { return 1; }', 'void g(int a) { h(a, "b"); }']):
+        java_ast = javalang.parse.parse_member_declaration(code)
+        src_sent = ['f', 'a', 'b']
+        examples.append(Example(src_sent, java_ast_to_action_infos(java_ast, grammar, src_sent), code,
+                                java_ast_to_asdl_ast(java_ast, grammar), idx=i))
+    bin_file = str(tmp_path / 'train.bin')
+    with open(bin_file, 'wb') as f:
+        pickle.dump(examples, f)
+
+    output_dir = str(tmp_path / 'train')
+    main(['--asdl_file', asdl_file, '--root_production', ','.join(root_production), bin_file, output_dir])
+
+    # the grammar of the training script, which roots the decoding at a method
+    training_grammar = ASDLGrammar.from_file(asdl_file, root_production)
+    dataset = Dataset.from_bin_file(output_dir)
+    dataset.examples.grammar.check_ids(training_grammar)
+    for example, converted in zip(examples, dataset.examples):
+        index_arrays = converted.get_index_arrays(training_grammar)
+        assert index_arrays['grammar_digest'] == training_grammar.id_digest
+        assert converted.src_sent == example.src_sent
+        assert [repr(a.action) for a in converted.tgt_actions] == [repr(a.action) for a in example.tgt_actions]
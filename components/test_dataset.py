@@ -0,0 +1,49 @@
+# coding=utf-8
+
+import os
+import pickle
+
+import torch
+
+import javalang.parse
+from asdl.asdl import ASDLGrammar
+from asdl.lang.java.java_asdl_helper import java_ast_to_action_infos, java_ast_to_asdl_ast
+from components.dataset import BatchCollator, BatchExample, Example, PaddingCounter
+from components.vocab import Vocab, VocabEntry
+
+asdl_file = os.path.join(os.path.dirname(__file__), '..', 'asdl', 'lang', 'java', 'java_asdl.simplified.txt')
+root_production = ('typedeclaration', 'MethodDeclaration')
+
+
+def test_pickled_batch_drops_grammar_and_vocab(tmp_path):
+    grammar = ASDLGrammar.from_file(asdl_file, root_production, cache_dir=str(tmp_path / 'cache'))
+    examples = []
+    for i, code in enumerate(['int f() { return 1; }', 'void g(int a) { h(a, "b"); }']):
+        java_ast = javalang.parse.parse_member_declaration(code)
+        src_sent = ['f', 'a', 'b']
+        examples.append(Example(src_sent, java_ast_to_action_infos(java_ast, grammar, src_sent), code,
+                                java_ast_to_asdl_ast(java_ast, grammar), idx=i))
+    source = VocabEntry.from_corpus([e.src_sent for e in examples], 100, 0)
+    primitive = VocabEntry.from_corpus([['h', 'a', 'b', 'f', 'g', '1']], 100, 0)
+    vocab = Vocab(source=source, primitive=primitive, code=primitive)
+
+    batch = BatchCollator(grammar, vocab)(examples)
+    received = pickle.loads(pickle.dumps(batch))
+
+    assert received.grammar is None and received.vocab is None
+    assert all(isinstance(e, BatchExample) for e in received.examples)
+    assert [e.idx for e in received.examples] == [e.idx for e in examples]
+    assert [e.src_sent for e in received.examples] == [e.src_sent for e in examples]
+    assert [[repr(a.action) for a in e.tgt_actions] for e in received.examples] == \
+           [[repr(a.action) for a in e.tgt_actions] for e in examples]
+    for name, value in batch.__dict__.items():
+        if isinstance(value, torch.Tensor):
+            assert torch.equal(getattr(received, name), value), name
+
+    counter, received_counter = PaddingCounter(), PaddingCounter()
+    counter.add(batch.examples)
+    received_counter.add(received.examples)
+    assert received_counter.ratio == counter.ratio
+
+    assert received.attach(grammar, vocab).grammar is grammar
+    assert received.vocab is vocab
@@ -2,8 +2,11 @@
 
 from __future__ import print_function
 
-from collections import Counter
-from itertools import chain
+from collections import Counter, deque
+from itertools import chain, islice
+import argparse
+import multiprocessing
+import pickle
 
 
 class VocabEntry(object):
@@ -52,10 +55,13 @@ class VocabEntry(object):
 
     @staticmethod
     def from_corpus(corpus, size, freq_cutoff=0):
+        return VocabEntry.from_word_freq(count_words(corpus), size, freq_cutoff=freq_cutoff)
+
+    @staticmethod
+    def from_word_freq(word_freq, size, freq_cutoff=0):
+        """build the vocabulary of the `size` most frequent words of a `count_words` table"""
         vocab_entry = VocabEntry()
 
-        a_chain = chain(*corpus)
-        word_freq = Counter(a_chain)
         non_singletons = [w for w in word_freq if word_freq[w] > 1]
         singletons = [w for w in word_freq if word_freq[w] == 1]
         print(f'number of word types: {len(word_freq)}, number of word types '
@@ -85,6 +91,64 @@ class VocabEntry(object):
         return vocab_entry
 
 
+# function tokenizing the items of a corpus in the counting workers, see `count_words`
+_tokenize_fn = None
+
+
+def _init_count_worker(tokenize_fn):
+    global _tokenize_fn
+    _tokenize_fn = tokenize_fn
+
+
+def _count_chunk(chunk):
+    if _tokenize_fn:
+        chunk = map(_tokenize_fn, chunk)
+    return Counter(chain.from_iterable(chunk))
+
+
+def count_words(corpus, tokenize_fn=None, num_workers=1, chunk_size=1000):
+    """
+    count the words of a corpus, an iterable of lists of words or of items turned into
+    lists of words by `tokenize_fn`. The corpus is read by chunks of `chunk_size` items,
+    counted (and tokenized) by `num_workers` processes.
+
+    The counts of the chunks are merged in the order of the corpus, so that the words of
+    the resulting `Counter` are in the order of their first occurrence, as with a single
+    `Counter`: the vocabularies built from it do not depend on the number of workers. The
+    same way, `merge_word_freqs` merges the counts of consecutive shards of a corpus.
+    """
+    corpus = iter(corpus)
+    chunks = iter(lambda: list(islice(corpus, chunk_size)), [])
+
+    word_freq = Counter()
+    if num_workers > 1:
+        with multiprocessing.Pool(processes=num_workers, initializer=_init_count_worker,
+                                  initargs=(tokenize_fn,)) as pool:
+            # at most 2 chunks per worker are pending, so that the corpus is read as it is counted
+            pending_counts = deque()
+            for chunk in chunks:
+                pending_counts.append(pool.apply_async(_count_chunk, (chunk,)))
+                if len(pending_counts) >= 2 * num_workers:
+                    word_freq.update(pending_counts.popleft().get())
+            while pending_counts:
+                word_freq.update(pending_counts.popleft().get())
+    else:
+        _init_count_worker(tokenize_fn)
+        for chunk in chunks:
+            word_freq.update(_count_chunk(chunk))
+
+    return word_freq
+
+
+def merge_word_freqs(word_freqs):
+    """merge the word counts of consecutive shards of a corpus"""
+    merged_word_freq = Counter()
+    for word_freq in word_freqs:
+        merged_word_freq.update(word_freq)
+
+    return merged_word_freq
+
+
 class Vocab(object):
     def __init__(self, **kwargs):
         self.entries = []
@@ -102,4 +166,23 @@ class Vocab(object):
 
 
 if __name__ == '__main__':
-    raise NotImplementedError
+    arg_parser = argparse.ArgumentParser(description='build a vocabulary from word frequency tables '
+                                                     'saved by the preprocessing scripts')
+    arg_parser.add_argument('word_freq_files', type=str, nargs='+',
+                            help='Word frequency tables, merged in this order if several')
+    arg_parser.add_argument('--src_freq', type=int, default=3, help='minimum frequency of source tokens')
+    arg_parser.add_argument('--code_freq', type=int, default=3, help='minimum frequency of code tokens')
+    arg_parser.add_argument('--vocab_size', type=int, default=20000, help='maximum size of each vocabulary')
+    arg_parser.add_argument('--out', type=str, required=True, help='Path of the vocabulary')
+    args = arg_parser.parse_args()
+
+    # pickle the vocabulary as `components.vocab.Vocab` rather than `__main__.Vocab`
+    from components.vocab import Vocab, VocabEntry
+
+    word_freqs = [pickle.load(open(word_freq_file, 'rb')) for word_freq_file in args.word_freq_files]
+    vocab = Vocab(**{key: VocabEntry.from_word_freq(merge_word_freqs(word_freq[key] for word_freq in word_freqs),
+                                                    size=args.vocab_size,
+                                                    freq_cutoff=args.src_freq if key == 'source' else args.code_freq)
+                     for key in word_freqs[0]})
+    print('generated vocabulary %s' % repr(vocab))
+    pickle.dump(vocab, open(args.out, 'wb'))
@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
 import json
+import textwrap
 
 import argparse
 
+from common.utils import iter_json_file
+
 # concode format:
 #[
     #{
@@ -84,30 +87,32 @@ if __name__ == '__main__':
 
     args = arg_parser.parse_args()
 
-    conala = []
     id = 0
-    with open(args.src, "r") as concode_file:
-        concode = json.load(concode_file)
-        with open(args.tgt, "w") as conala_file:
-            for concode_example in concode:
-                id += 1
-                conala_example = {}
-                intent = text_from_concode_nl(concode_example["nl"])
-                # "concode_field_sep","concode_elem_sep","concode_func_sep"
-                if args.fields and concode_example["varTypes"]:
-                    intent += " concode_field_sep " + " concode_field_sep ".join(
-                      [' concode_elem_sep '.join(el)
-                       for el in zip(concode_example["varTypes"],
-                                     concode_example["varNames"])])
-                if args.methods:
-                    intent += " concode_func_sep " + " concode_func_sep ".join(
-                      [' concode_elem_sep '.join(el)
-                       for el in zip(concode_example["methodReturns"],
-                                     concode_example["methodNames"])])
-
-                snippet = code_from_concode_nl(concode_example["code"])
-                conala_example["question_id"] = id
-                conala_example["intent"] = intent
-                conala_example["snippet"] = snippet
-                conala.append(conala_example)
-            conala_file.write(json.dumps(conala, indent=4))
+    with open(args.tgt, "w") as conala_file:
+        # write the conala examples as they are converted, in the format of
+        # json.dumps(conala, indent=4)
+        conala_file.write("[")
+        for concode_example in iter_json_file(args.src):
+            id += 1
+            conala_example = {}
+            intent = text_from_concode_nl(concode_example["nl"])
+            # "concode_field_sep","concode_elem_sep","concode_func_sep"
+            if args.fields and concode_example["varTypes"]:
+                intent += " concode_field_sep " + " concode_field_sep ".join(
+                  [' concode_elem_sep '.join(el)
+                   for el in zip(concode_example["varTypes"],
+                                 concode_example["varNames"])])
+            if args.methods:
+                intent += " concode_func_sep " + " concode_func_sep ".join(
+                  [' concode_elem_sep '.join(el)
+                   for el in zip(concode_example["methodReturns"],
+                                 concode_example["methodNames"])])
+
+            snippet = code_from_concode_nl(concode_example["code"])
+            conala_example["question_id"] = id
+            conala_example["intent"] = intent
+            conala_example["snippet"] = snippet
+            conala_file.write("," if id > 1 else "")
+            conala_file.write("\n" + textwrap.indent(
+              json.dumps(conala_example, indent=4), "    "))
+        conala_file.write("\n]" if id else "]")
@@ -52,9 +52,12 @@ class Node(object):
         return walk_tree(self)
 
     def filter(self, pattern):
+        if isinstance(pattern, type):
+            yield from walk_tree(self, pattern)
+            return
+
         for path, node in self:
-            if ((isinstance(pattern, type) and isinstance(node, pattern)) or
-                (node == pattern)):
+            if node == pattern:
                 yield path, node
 
     @property
@@ -66,19 +69,76 @@ class Node(object):
         if hasattr(self, "_position"):
             return self._position
 
-def walk_tree(root):
-    children = None
+def walk_tree(root, node_type=None):
+    """ Yields the (path, node) pairs of the nodes of the tree in depth first
+    order, path being the tuple of the nodes and lists from root to node.
+    With node_type, only the nodes of this type are yielded.
+
+    The tree is walked iteratively, and the nodes and lists with the same
+    parent share their path.
+
+    """
+
+    if isinstance(root, Node):
+        if node_type is None or isinstance(root, node_type):
+            yield (), root
+        children = root.children
+    else:
+        children = root
+
+    stack = [((root,), iter(children))]
+    while stack:
+        path, children = stack[-1]
+        for child in children:
+            if isinstance(child, Node):
+                if node_type is None or isinstance(child, node_type):
+                    yield path, child
+                stack.append((path + (child,), iter(child.children)))
+                break
+            elif isinstance(child, (list, tuple)):
+                stack.append((path + (child,), iter(child)))
+                break
+        else:
+            stack.pop()
+
+def iter_tree(root, node_type=None, path=None):
+    """ Yields the nodes of the tree in the order of walk_tree, without
+    building their paths. With node_type, only the nodes of this type are
+    yielded. A path list, if given, is kept up to date with the nodes and
+    lists from root to the last yielded node, which are the items of its path
+    in walk_tree; it is only valid until the next node is yielded.
+
+    """
+
+    if path is None:
+        path = list()
+    else:
+        del path[:]
 
     if isinstance(root, Node):
-        yield (), root
+        if node_type is None or isinstance(root, node_type):
+            yield root
         children = root.children
     else:
         children = root
 
-    for child in children:
-        if isinstance(child, (Node, list, tuple)):
-            for path, node in walk_tree(child):
-                yield (root,) + path, node
+    path.append(root)
+    stack = [iter(children)]
+    while stack:
+        for child in stack[-1]:
+            if isinstance(child, Node):
+                if node_type is None or isinstance(child, node_type):
+                    yield child
+                path.append(child)
+                stack.append(iter(child.children))
+                break
+            elif isinstance(child, (list, tuple)):
+                path.append(child)
+                stack.append(iter(child))
+                break
+        else:
+            stack.pop()
+            path.pop()
 
 def dump(ast, file):
     pickle.dump(ast, file)
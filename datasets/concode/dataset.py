@@ -1,6 +1,7 @@
 import argparse
 import errno
-import json
+import functools
+import itertools
 import os
 import pickle
 import sys
@@ -8,15 +9,17 @@ import sys
 import numpy as np
 
 from asdl.hypothesis import *
+from asdl.lang.java.java_asdl_helper import java_ast_to_action_infos
 from asdl.lang.java.java_transition_system import (java_ast_to_asdl_ast,
                                                    asdl_ast_to_java_ast,
                                                    JavaTransitionSystem)
 from asdl.transition_system import *
-from components.action_info import get_action_infos
+from common.utils import iter_json_file
 from components.dataset import Example
-from components.vocab import Vocab, VocabEntry
+from components.vocab import Vocab, VocabEntry, count_words
 from datasets.concode.evaluator import ConcodeEvaluator
 from datasets.concode.util import *
+from datasets.utils import process_examples
 from asdl.lang.java import jastor
 from javalang.parser import JavaSyntaxError
 from javalang import tree
@@ -39,7 +42,10 @@ def preprocess_concode_dataset(train_file,
                                num_dev=200,
                                debug=False,
                                rewritten=True,
-                               start_at=0):
+                               start_at=0,
+                               num_workers=1,
+                               chunk_size=100,
+                               cache_dir=None):
     np.random.seed(1234)
     try:
         os.makedirs(out_dir)
@@ -48,8 +54,7 @@ def preprocess_concode_dataset(train_file,
             raise
 
 
-    asdl_text = open(grammar_file).read()
-    grammar = ASDLGrammar.from_text(asdl_text,
+    grammar = ASDLGrammar.from_file(grammar_file,
                                     root_production=("typedeclaration",
                                                      "MethodDeclaration"))
     transition_system = JavaTransitionSystem(grammar)
@@ -61,7 +66,10 @@ def preprocess_concode_dataset(train_file,
                                         num_examples=num_examples,
                                         debug=debug,
                                         start_at=start_at,
-                                        rewritten=rewritten)
+                                        rewritten=rewritten,
+                                        num_workers=num_workers,
+                                        chunk_size=chunk_size,
+                                        cache_dir=cache_dir)
 
     full_train_examples = train_examples[:]
     np.random.shuffle(train_examples)
@@ -72,7 +80,10 @@ def preprocess_concode_dataset(train_file,
                                       num_examples=num_dev,
                                       debug=debug,
                                       start_at=start_at,
-                                      rewritten=rewritten)
+                                      rewritten=rewritten,
+                                      num_workers=num_workers,
+                                      chunk_size=chunk_size,
+                                      cache_dir=cache_dir)
     mined_examples = []
     api_examples = []
     if mined_data_file and num_mined > 0:
@@ -83,7 +94,10 @@ def preprocess_concode_dataset(train_file,
           name='mined',
           transition_system=transition_system,
           num_examples=num_mined,
-          start_at=start_at)
+          start_at=start_at,
+          num_workers=num_workers,
+          chunk_size=chunk_size,
+          cache_dir=cache_dir)
         pickle.dump(mined_examples,
                     open(os.path.join(out_dir,
                                       'mined_{}.bin'.format(num_mined)), 'wb'))
@@ -97,7 +111,10 @@ def preprocess_concode_dataset(train_file,
                                           num_examples=num_examples,
                                           debug=debug,
                                           start_at=start_at,
-                                          rewritten=rewritten)
+                                          rewritten=rewritten,
+                                          num_workers=num_workers,
+                                          chunk_size=chunk_size,
+                                          cache_dir=cache_dir)
         pickle.dump(api_examples,
                     open(os.path.join(out_dir, name + '.bin'), 'wb'))
 
@@ -118,12 +135,16 @@ def preprocess_concode_dataset(train_file,
                                        num_examples=num_examples,
                                        debug=debug,
                                        start_at=start_at,
-                                       rewritten=rewritten)
+                                       rewritten=rewritten,
+                                       num_workers=num_workers,
+                                       chunk_size=chunk_size,
+                                       cache_dir=cache_dir)
     print(f'{len(test_examples)} testing instances', file=sys.stderr)
 
-    src_vocab = VocabEntry.from_corpus([e.src_sent for e in train_examples],
-                                       size=vocab_size,
-                                       freq_cutoff=src_freq)
+    # the word counts are saved, `python -m components.vocab` builds
+    # vocabularies of other cutoffs from them
+    word_freqs = dict()
+    word_freqs['source'] = count_words(e.src_sent for e in train_examples)
     primitive_tokens = [map(lambda a: a.action.token,
                             filter(lambda a: isinstance(a.action,
                                                         GenTokenAction),
@@ -136,15 +157,23 @@ def preprocess_concode_dataset(train_file,
                 assert(not isinstance(t, tree.Node))
                 # continue
                 print(f"  t {i}: {t}")
-    primitive_vocab = VocabEntry.from_corpus(primitive_tokens, size=vocab_size,
-                                             freq_cutoff=code_freq)
-
+    word_freqs['primitive'] = count_words(primitive_tokens)
     # generate vocabulary for the code tokens!
-    code_tokens = [transition_system.tokenize_code(e.tgt_code, mode='decoder')
-                   for e in train_examples]
-
-    code_vocab = VocabEntry.from_corpus(code_tokens, size=vocab_size,
-                                        freq_cutoff=code_freq)
+    word_freqs['code'] = count_words(
+      (e.tgt_code for e in train_examples),
+      tokenize_fn=functools.partial(transition_system.tokenize_code,
+                                    mode='decoder'),
+      num_workers=num_workers)
+
+    src_vocab = VocabEntry.from_word_freq(word_freqs['source'],
+                                          size=vocab_size,
+                                          freq_cutoff=src_freq)
+    primitive_vocab = VocabEntry.from_word_freq(word_freqs['primitive'],
+                                                size=vocab_size,
+                                                freq_cutoff=code_freq)
+    code_vocab = VocabEntry.from_word_freq(word_freqs['code'],
+                                           size=vocab_size,
+                                           freq_cutoff=code_freq)
 
     vocab = Vocab(source=src_vocab, primitive=primitive_vocab, code=code_vocab)
     print('generated vocabulary %s' % repr(vocab), file=sys.stderr)
@@ -176,130 +205,51 @@ def preprocess_concode_dataset(train_file,
     else:
         vocab_name = f'vocab.src_freq{src_freq}.code_freq{code_freq}.bin'
     pickle.dump(vocab, open(os.path.join(out_dir, vocab_name), 'wb'))
+    word_freq_name = vocab_name.replace(
+      f'vocab.src_freq{src_freq}.code_freq{code_freq}', 'word_freq')
+    pickle.dump(word_freqs, open(os.path.join(out_dir, word_freq_name), 'wb'))
 
 
 def preprocess_dataset(file_path, transition_system, name='train',
                        num_examples=None, debug=False,
                        start_at=0,
-                       rewritten=True):
-    try:
-        dataset = json.load(open(file_path))
-    except Exception as e:
-        # TODO handle opening errors
-        dataset = [json.loads(jline) for jline in open(file_path).readlines()]
+                       rewritten=True,
+                       num_workers=1,
+                       chunk_size=100,
+                       cache_dir=None):
+    # the examples are read while they are processed
+    dataset = iter_json_file(file_path)
     if num_examples:
-        dataset = dataset[:num_examples]
-    print(f"preprocess_dataset {file_path}, json is loaded", file=sys.stderr)
+        dataset = itertools.islice(dataset, num_examples)
     examples = []
-    evaluator = ConcodeEvaluator(transition_system)
     f = open(file_path + '.debug', 'w')
     skipped_list = []
-    for i, example_json in enumerate(dataset):
-        if i < start_at:
-            continue
+    process_fn = functools.partial(process_example,
+                                   transition_system=transition_system,
+                                   rewritten=rewritten,
+                                   debug=debug)
+    # the examples also depend on the grammar and on the preprocessing options
+    cache_key = repr(('concode', rewritten, transition_system.grammar.root_type,
+                      [str(prod) for prod in transition_system.grammar.productions]))
+    if cache_dir:
+        cache_dir = os.path.join(cache_dir, name)
+    for i, example_json, example in process_examples(dataset, process_fn,
+                                                     num_workers=num_workers,
+                                                     chunk_size=chunk_size,
+                                                     cache_dir=cache_dir,
+                                                     cache_key=cache_key,
+                                                     start_at=start_at):
         if debug:
-            print(f"preprocess_dataset example n°{i+1}/{len(dataset)}",
+            print(f"preprocess_dataset example n°{i+1}",
                   end='\n', file=sys.stderr)
         else:
-            print(f">>>>>>>> preprocess_dataset example n°{i+1}/{len(dataset)}",
+            print(f">>>>>>>> preprocess_dataset example n°{i+1}",
                   end='\r', file=sys.stderr)
-        try:
-            example_dict = preprocess_example(example_json,
-                                              rewritten=rewritten)
-            snippet = example_dict['canonical_snippet']
-            if debug:
-                print(f"canonical_snippet:\n{snippet}", file=sys.stderr)
-            try:
-                lang_ast = javalang.parse.parse_member_declaration(snippet)
-            except JavaSyntaxError as e:
-                print(f"Syntax error in canonical snippet below. Will try original one.",
-                      file=sys.stderr)
-                print("------", file=sys.stderr)
-                print(snippet, file=sys.stderr)
-                print("------", file=sys.stderr)
-                snippet = example_dict['snippet']
-                if debug:
-                    print(f"snippet:\n{snippet}", file=sys.stderr)
-                lang_ast = javalang.parse.parse_member_declaration(snippet)
-            canonical_code = jastor.to_source(lang_ast).strip()
-            if debug:
-                print(f"canonical_code:\n{canonical_code}", file=sys.stderr)
-            tgt_ast = java_ast_to_asdl_ast(lang_ast, transition_system.grammar)
-            tgt_actions = transition_system.get_actions(tgt_ast)
-
-            # sanity check
-            hyp = Hypothesis()
-            for t, action in enumerate(tgt_actions):
-                valid_continuating_types = transition_system.get_valid_continuation_types(hyp)
-                if action.__class__ not in valid_continuating_types:
-                    print(f"Error: Valid continuation types are {valid_continuating_types} "
-                          f"but current action class is {action.__class__}",
-                          file=sys.stderr)
-                    assert action.__class__ in valid_continuating_types
-                if isinstance(action, ApplyRuleAction):
-                    valid_continuating_productions = transition_system.get_valid_continuating_productions(hyp)
-                    if action.production not in valid_continuating_productions and hyp.frontier_node:
-                        raise Exception(f"{bcolors.BLUE}{action.production}"
-                                        f"{bcolors.ENDC} should be in {bcolors.GREEN}"
-                                        f"{grammar[hyp.frontier_field.type] if hyp.frontier_field else ''}"
-                                        f"{bcolors.ENDC}")
-                        assert action.production in valid_continuating_productions
-                p_t = -1
-                f_t = None
-                if hyp.frontier_node:
-                    p_t = hyp.frontier_node.created_time
-                    f_t = hyp.frontier_field.field.__repr__(plain=True)
-                if debug:
-                    print(f'\t[{t}] {action}, frontier field: {f_t}, '
-                          f'parent: {p_t}')
-                hyp = hyp.clone_and_apply_action(action)
-
-            assert hyp.frontier_node is None and hyp.frontier_field is None
-            lang_ast = asdl_ast_to_java_ast(hyp.tree, transition_system.grammar)
-            code_from_hyp = jastor.to_source(lang_ast).strip()
-
-            hyp.code = code_from_hyp
-            if debug:
-                print(f"code_from_hyp:\n{code_from_hyp}", file=sys.stderr)
-            assert code_from_hyp == canonical_code
-
-            parsed_snippet_ast = javalang.parse.parse_member_declaration(
-                example_json['snippet'])
-            surface_snippet_ast = transition_system.surface_code_to_ast(
-                example_json['snippet'])
-
-            decanonicalized_code_from_hyp = decanonicalize_code(
-              code_from_hyp, example_dict['slot_map'])
-            parsed_decanon_ast = javalang.parse.parse_member_declaration(
-                decanonicalized_code_from_hyp)
-            surface_decanon_ast = transition_system.surface_code_to_ast(
-                decanonicalized_code_from_hyp)
-
-            if debug:
-                print(f"example_json['snippet']:\n{example_json['snippet']}\n==========")
-                print(f"decanonicalized_code_from_hyp:\n{decanonicalized_code_from_hyp}\n==========")
-            assert compare_ast(parsed_snippet_ast, parsed_decanon_ast)
-            assert transition_system.compare_ast(surface_snippet_ast,
-                                                 surface_decanon_ast)
-
-            tgt_action_infos = get_action_infos(example_dict['intent_tokens'],
-                                                tgt_actions)
-        # except (AssertionError, JavaSyntaxError, ValueError, OverflowError)
-        # as e:
-        except () as e:
-            print(f"Intercepting exception: {e} in:\n{snippet}",
-                  file=sys.stderr)
+        if example is None:
             skipped_list.append(example_json['question_id'])
             continue
-        example = Example(idx=f'{i}-{example_json["question_id"]}',
-                          src_sent=example_dict['intent_tokens'],
-                          tgt_actions=tgt_action_infos,
-                          tgt_code=canonical_code,
-                          tgt_ast=tgt_ast,
-                          meta=dict(example_dict=example_json,
-                                    slot_map=example_dict['slot_map']))
-        # assert evaluator.is_hyp_correct(example, hyp)
 
+        example.idx = f'{i}-{example_json["question_id"]}'
         examples.append(example)
 
         # log!
@@ -323,6 +273,114 @@ def preprocess_dataset(file_path, transition_system, name='train',
     return examples
 
 
+def process_example(example_json, transition_system, rewritten=True, debug=False):
+    """
+    build the `Example` of a json example of a dataset and check that its actions give
+    back its code, returns None if the example has to be skipped. The example does not
+    depend on its position in the dataset, its `idx` is set by `preprocess_dataset`
+    """
+    try:
+        example_dict = preprocess_example(example_json,
+                                          rewritten=rewritten)
+        snippet = example_dict['canonical_snippet']
+        if debug:
+            print(f"canonical_snippet:\n{snippet}", file=sys.stderr)
+        try:
+            lang_ast = javalang.parse.parse_member_declaration(snippet)
+        except JavaSyntaxError as e:
+            print(f"Syntax error in canonical snippet below. Will try original one.",
+                  file=sys.stderr)
+            print("------", file=sys.stderr)
+            print(snippet, file=sys.stderr)
+            print("------", file=sys.stderr)
+            snippet = example_dict['snippet']
+            if debug:
+                print(f"snippet:\n{snippet}", file=sys.stderr)
+            lang_ast = javalang.parse.parse_member_declaration(snippet)
+        canonical_code = jastor.to_source(lang_ast).strip()
+        if debug:
+            print(f"canonical_code:\n{canonical_code}", file=sys.stderr)
+        tgt_ast = java_ast_to_asdl_ast(lang_ast, transition_system.grammar)
+        tgt_action_infos = java_ast_to_action_infos(lang_ast, transition_system.grammar,
+                                                    example_dict['intent_tokens'])
+        tgt_actions = [action_info.action for action_info in tgt_action_infos]
+
+        # sanity check
+        hyp = Hypothesis()
+        for t, action in enumerate(tgt_actions):
+            valid_continuating_types = transition_system.get_valid_continuation_types(hyp)
+            if action.__class__ not in valid_continuating_types:
+                print(f"Error: Valid continuation types are {valid_continuating_types} "
+                      f"but current action class is {action.__class__}",
+                      file=sys.stderr)
+                assert action.__class__ in valid_continuating_types
+            if isinstance(action, ApplyRuleAction):
+                valid_continuating_productions = transition_system.get_valid_continuating_productions(hyp)
+                if action.production not in valid_continuating_productions and hyp.frontier_node:
+                    raise Exception(f"{bcolors.BLUE}{action.production}"
+                                    f"{bcolors.ENDC} should be in {bcolors.GREEN}"
+                                    f"{grammar[hyp.frontier_field.type] if hyp.frontier_field else ''}"
+                                    f"{bcolors.ENDC}")
+                    assert action.production in valid_continuating_productions
+            p_t = -1
+            f_t = None
+            if hyp.frontier_node:
+                p_t = hyp.frontier_node.created_time
+                f_t = hyp.frontier_field.field.__repr__(plain=True)
+            if debug:
+                print(f'\t[{t}] {action}, frontier field: {f_t}, '
+                      f'parent: {p_t}')
+            hyp = hyp.clone_and_apply_action(action)
+
+        assert hyp.frontier_node is None and hyp.frontier_field is None
+        lang_ast = asdl_ast_to_java_ast(hyp.tree, transition_system.grammar)
+        code_from_hyp = jastor.to_source(lang_ast).strip()
+
+        hyp.code = code_from_hyp
+        if debug:
+            print(f"code_from_hyp:\n{code_from_hyp}", file=sys.stderr)
+        assert code_from_hyp == canonical_code
+
+        parsed_snippet_ast = javalang.parse.parse_member_declaration(
+            example_json['snippet'])
+        surface_snippet_ast = transition_system.surface_code_to_ast(
+            example_json['snippet'])
+
+        decanonicalized_code_from_hyp = decanonicalize_code(
+          code_from_hyp, example_dict['slot_map'])
+        parsed_decanon_ast = javalang.parse.parse_member_declaration(
+            decanonicalized_code_from_hyp)
+        surface_decanon_ast = transition_system.surface_code_to_ast(
+            decanonicalized_code_from_hyp)
+
+        if debug:
+            print(f"example_json['snippet']:\n{example_json['snippet']}\n==========")
+            print(f"decanonicalized_code_from_hyp:\n{decanonicalized_code_from_hyp}\n==========")
+        assert compare_ast(parsed_snippet_ast, parsed_decanon_ast)
+        assert transition_system.compare_ast(surface_snippet_ast,
+                                             surface_decanon_ast)
+
+    # except (AssertionError, JavaSyntaxError, ValueError, OverflowError)
+    # as e:
+    except () as e:
+        print(f"Intercepting exception: {e} in:\n{snippet}",
+              file=sys.stderr)
+        return None
+    example = Example(src_sent=example_dict['intent_tokens'],
+                      tgt_actions=tgt_action_infos,
+                      tgt_code=canonical_code,
+                      tgt_ast=tgt_ast,
+                      meta=dict(example_dict=example_json,
+                                slot_map=example_dict['slot_map']))
+    # evaluator = ConcodeEvaluator(transition_system)
+    # assert evaluator.is_hyp_correct(example, hyp)
+
+    # precompute the index arrays used to build training batches
+    example.get_index_arrays(transition_system.grammar)
+
+    return example
+
+
 def preprocess_example(example_json, rewritten=True):
     """
     In Conala, this method allowed to replace occurrences of python code names
@@ -428,6 +486,16 @@ if __name__ == '__main__':
                             default='data/concode/concode_valid.json')
     arg_parser.add_argument('--vocabsize', type=int, default=20000,
                             help='First k number from pretrain file')
+    arg_parser.add_argument('--num_workers', type=int, default=1,
+                            help='Number of processes preprocessing the examples')
+    arg_parser.add_argument('--chunk_size', type=int, default=100,
+                            help='Number of examples given at once to a '
+                                 'preprocessing process')
+    arg_parser.add_argument('--cache_dir', type=str,
+                            help='If set, directory of the checkpoints of the '
+                                 'preprocessed examples, used to resume an '
+                                 'interrupted run and to skip the unchanged '
+                                 'examples')
     args = arg_parser.parse_args()
 
     print(f"args.train: {args.train}", file=sys.stderr)
@@ -448,4 +516,7 @@ if __name__ == '__main__':
       num_examples=args.num_examples,
       num_dev=args.num_dev,
       debug=args.debug,
-      start_at=args.start_at)
+      start_at=args.start_at,
+      num_workers=args.num_workers,
+      chunk_size=args.chunk_size,
+      cache_dir=args.cache_dir)
@@ -9,9 +9,6 @@ from datasets.conala.conala_eval import tokenize_for_bleu_eval
 from datasets.conala.bleu_score import compute_bleu
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 import numpy as np
-import javalang.parse
-from javalang.parser import JavaSyntaxError
-from asdl.lang.java import jastor
 
 
 @Registrable.register('concode_evaluator')
@@ -22,18 +19,10 @@ class ConcodeEvaluator(Evaluator):
         self.default_metric = 'corpus_bleu'
 
     def is_hyp_correct(self, example, hyp):
-        ref_code = example.tgt_code
-        try:
-            java_ast = javalang.parse.parse_member_declaration(ref_code)
-        except JavaSyntaxError as e:
-            print(f"Java syntax error: {e.description}, at {e.at} "
-                  f"in:\n{snippet}",
-                  file=sys.stderr)
-            raise
-        ref_reformatted_code = jastor.to_source(java_ast).strip()
-
-        ref_code_tokens = self.transition_system.tokenize_code(
-          ref_reformatted_code)
+        # the reference is rendered once for all its hypotheses, the same as
+        # `example.tgt_code`
+        _, ref_code_tokens = self.transition_system.surface_code_cache.get(
+          example.tgt_ast)
         hyp_code_tokens = self.transition_system.tokenize_code(hyp.code)
 
         return ref_code_tokens == hyp_code_tokens
@@ -96,6 +85,8 @@ class ConcodeEvaluator(Evaluator):
 
             return bleu
         else:
+            surface_code_cache = self.transition_system.surface_code_cache
+            surface_code_cache.clear()
             tokenized_ref_snippets = []
             hyp_code_tokens = []
             best_hyp_code_tokens = []
@@ -153,6 +144,7 @@ class ConcodeEvaluator(Evaluator):
                                          tokenized_ref_snippets)]) / float(
                                            len(examples))
             oracle_exact_match = np.average(oracle_exact_match)
+            print(f"Rendered references: {surface_code_cache}", file=sys.stderr)
 
             return {'corpus_bleu': corpus_bleu,
                     'oracle_corpus_bleu': oracle_corpus_bleu,
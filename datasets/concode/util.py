@@ -23,9 +23,10 @@ def compare_ast(node1, node2):
         if type(node1) is not type(node2):
             return False
     if isinstance(node1, javalang.ast.Node):
-        for k, v1 in list(vars(node1).items()):
+        for k in node1.attrs:
             if k in ('lineno', 'col_offset', 'ctx', '_position'):
                 continue
+            v1 = getattr(node1, k)
             v2 = getattr(node2, k)
             if not compare_ast(v1, v2):
                 return False
@@ -140,17 +141,17 @@ def canonicalize_intent(intent):
 
 
 def replace_identifiers_in_ast(java_ast, identifier2slot):
-    for _, node in ast.walk_tree(java_ast):
-        if isinstance(node, ast.Node):
-            for k, v in list(vars(node).items()):
-                if k in ('lineno', 'col_offset', 'ctx'):
-                    continue
-                # Python 3
-                # if isinstance(v, str) or isinstance(v, unicode):
-                if isinstance(v, str):
-                    if v in identifier2slot:
-                        slot_name = identifier2slot[v]
-                        setattr(node, k, slot_name)
+    for node in ast.iter_tree(java_ast):
+        for k in node.attrs:
+            if k in ('lineno', 'col_offset', 'ctx'):
+                continue
+            v = getattr(node, k)
+            # Python 3
+            # if isinstance(v, str) or isinstance(v, unicode):
+            if isinstance(v, str):
+                if v in identifier2slot:
+                    slot_name = identifier2slot[v]
+                    setattr(node, k, slot_name)
 
 
 def is_enumerable_str(identifier_value):
@@ -1,4 +1,11 @@
 # coding=utf-8
+import collections
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
 
 
 class ExampleProcessor(object):
@@ -19,3 +26,168 @@ def get_example_processor_cls(dataset):
         return ConalaExampleProcessor
     else:
         raise RuntimeError()
+
+
+# function applied to the examples by the preprocessing workers, see `process_examples`
+_process_fn = None
+
+
+def _init_process_worker(process_fn):
+    global _process_fn
+    _process_fn = process_fn
+
+
+def _process_chunk(examples):
+    return [_process_fn(example_json) for example_json in examples]
+
+
+def _load_checkpoint_index(cache_dir):
+    """the checkpoint file of each key of the checkpoints in `cache_dir`, and the keys of each
+    checkpoint file, without loading their results"""
+    key_files = dict()
+    file_keys = dict()
+    for file_name in sorted(os.listdir(cache_dir)):
+        if file_name.endswith('.pkl'):
+            with open(os.path.join(cache_dir, file_name), 'rb') as f:
+                keys = pickle.load(f)
+            key_files.update((key, file_name) for key in keys)
+            file_keys[file_name] = set(keys)
+
+    return key_files, file_keys
+
+
+def _load_checkpoint_results(cache_dir, file_name):
+    with open(os.path.join(cache_dir, file_name), 'rb') as f:
+        # the keys come first
+        pickle.load(f)
+        return pickle.load(f)
+
+
+def _prune_checkpoints(cache_dir, file_keys, used_keys):
+    """delete the checkpoint files without any of `used_keys`, and rewrite the ones with
+    other keys with only `used_keys`"""
+    for file_name, keys in file_keys.items():
+        path = os.path.join(cache_dir, file_name)
+        if not keys & used_keys:
+            os.remove(path)
+        elif not keys <= used_keys:
+            results = _load_checkpoint_results(cache_dir, file_name)
+            _save_checkpoint(cache_dir, {key: result for key, result in results.items() if key in used_keys})
+            os.remove(path)
+
+
+def _save_checkpoint(cache_dir, results):
+    keys = sorted(results)
+    file_name = hashlib.sha1(''.join(keys).encode('utf-8')).hexdigest() + '.pkl'
+    tmp_path = os.path.join(cache_dir, file_name + f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        # the keys are read without the results to index the checkpoints
+        pickle.dump(keys, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, os.path.join(cache_dir, file_name))
+
+
+def process_examples(dataset, process_fn, num_workers=1, chunk_size=100, cache_dir=None, cache_key='',
+                     start_at=0, max_loaded_checkpoints=2):
+    """
+    apply `process_fn(example_json)` to the examples of `dataset` (an iterable of json
+    objects, e.g. `common.utils.iter_json_file`, read as the examples are processed) from the
+    `start_at`-th one, and yield the `(i, example_json, result)` tuples in the order of the
+    dataset.
+
+    The examples are split into chunks of `chunk_size` examples, processed by `num_workers`
+    processes. With a `cache_dir`, the results of each chunk are saved in a checkpoint file
+    as soon as it is processed, indexed by a hash of the example and of `cache_key`, which
+    must identify everything else the results depend on (grammar, options), so the results
+    must not depend on the position of the examples. A run then resumes from the checkpoints
+    of an interrupted one, and only sends to the workers the examples which changed since the
+    previous run. Only the keys of the checkpoints are read up front, the results of at most
+    `max_loaded_checkpoints` checkpoint files are loaded at a time, as the chunks need them.
+    Once all the examples are processed, the results of the examples which are not in the
+    dataset anymore are removed from the checkpoints.
+    """
+    key_files = dict()
+    checkpoint_file_keys = dict()
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        key_files, checkpoint_file_keys = _load_checkpoint_index(cache_dir)
+    # results of the last checkpoint files used, by file name
+    loaded_checkpoints = collections.OrderedDict()
+    # keys of the cached results used by this run
+    used_keys = set()
+
+    def _cached_result(key):
+        file_name = key_files[key]
+        results = loaded_checkpoints.get(file_name)
+        if results is None:
+            results = loaded_checkpoints[file_name] = _load_checkpoint_results(cache_dir, file_name)
+            if len(loaded_checkpoints) > max_loaded_checkpoints:
+                loaded_checkpoints.popitem(last=False)
+        else:
+            loaded_checkpoints.move_to_end(file_name)
+        used_keys.add(key)
+
+        return results[key]
+
+    # `cache_key` may be large (e.g. the productions of a grammar), it is hashed once
+    cache_key_digest = hashlib.sha1(json.dumps(cache_key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _example_key(example_json):
+        return hashlib.sha1(json.dumps([cache_key_digest, example_json], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _chunks():
+        examples = itertools.islice(enumerate(dataset), start_at, None)
+        while True:
+            chunk = [(i, example_json, _example_key(example_json) if cache_dir else None)
+                     for i, example_json in itertools.islice(examples, chunk_size)]
+            if not chunk:
+                return
+            yield chunk
+
+    def _uncached_examples(chunk):
+        return [example_json for i, example_json, key in chunk if key not in key_files]
+
+    def _process_chunks_in_pool(pool):
+        # at most 2 chunks per worker are pending, so that the dataset is read as it is processed
+        pending_chunks = collections.deque()
+        for chunk in _chunks():
+            pending_chunks.append((chunk, pool.apply_async(_process_chunk, (_uncached_examples(chunk),))))
+            if len(pending_chunks) >= 2 * num_workers:
+                chunk, results = pending_chunks.popleft()
+                yield chunk, results.get()
+        while pending_chunks:
+            chunk, results = pending_chunks.popleft()
+            yield chunk, results.get()
+
+    if num_workers > 1:
+        pool = multiprocessing.Pool(processes=num_workers, initializer=_init_process_worker,
+                                    initargs=(process_fn,))
+        processed_chunks = _process_chunks_in_pool(pool)
+    else:
+        pool = None
+        _init_process_worker(process_fn)
+        processed_chunks = ((chunk, _process_chunk(_uncached_examples(chunk))) for chunk in _chunks())
+
+    try:
+        for chunk, results in processed_chunks:
+            # the results of the examples sent to the workers, in the order of the chunk
+            results = iter(results)
+            new_results = dict()
+            for i, example_json, key in chunk:
+                if key in key_files:
+                    result = _cached_result(key)
+                else:
+                    result = next(results)
+                    if cache_dir:
+                        new_results[key] = result
+                yield i, example_json, result
+
+            if new_results:
+                _save_checkpoint(cache_dir, new_results)
+
+        # the examples before `start_at` are not looked up
+        if checkpoint_file_keys and start_at == 0:
+            _prune_checkpoints(cache_dir, checkpoint_file_keys, used_keys)
+    finally:
+        if pool:
+            pool.terminate()
@@ -4,7 +4,7 @@ from __future__ import print_function
 import sys
 import traceback
 from tqdm import tqdm
-from javalang.parse import parse_member_declaration
+from javalang.parse import parse_snippet
 from javalang.parser import JavaSyntaxError
 
 
@@ -19,43 +19,50 @@ def decode(examples, model, args, verbose=False, **kwargs):
 
     decode_results = []
     count = 0
-    for example in tqdm(examples, desc='Decoding', file=sys.stdout,
-                        total=len(examples)):
-        hyps = model.parse(example.src_sent, context=None,
-                           beam_size=args.beam_size)
-        decoded_hyps = []
-        for hyp_id, hyp in enumerate(hyps):
-            got_code = False
-            try:
-                code = model.transition_system.ast_to_surface_code(hyp.tree)
-                try:
-                    java_ast = parse_member_declaration(code)
-                except JavaSyntaxError as e:
-                    continue
-                hyp.code = code
-                got_code = True
-                decoded_hyps.append(hyp)
-            except Exception as e:
-                if verbose:
-                    print("Exception in converting tree to code:",
-                          file=sys.stdout)
-                    print('-' * 60, file=sys.stdout)
-                    print(f'Example: {example.idx}', file=sys.stdout)
-                    print(f'Intent: {" ".join(example.src_sent)}',
-                          file=sys.stdout)
-                    print('Target Code:', file=sys.stdout)
-                    print(example.tgt_code, file=sys.stdout)
-                    print(f'Hypothesis[{hyp_id}]:', file=sys.stdout)
-                    print(hyp.tree.to_string(), file=sys.stdout)
-                    if got_code:
-                        print()
-                        print(hyp.code)
-                    traceback.print_exc(file=sys.stdout)
-                    print('-' * 60, file=sys.stdout)
+    with tqdm(desc='Decoding', file=sys.stdout, total=len(examples)) as pbar:
+        for batch_start in range(0, len(examples), args.decode_batch_size):
+            batch_examples = examples[batch_start:
+                                      batch_start + args.decode_batch_size]
+            batch_hyps = model.parse_batch([e.src_sent for e in batch_examples],
+                                           beam_size=args.beam_size,
+                                           compact_hypothesis=args.compact_decode_hypothesis,
+                                           recombination=args.beam_recombination)
+            for example, hyps in zip(batch_examples, batch_hyps):
+                decoded_hyps = []
+                for hyp_id, hyp in enumerate(hyps):
+                    got_code = False
+                    try:
+                        code = model.transition_system.ast_to_surface_code(
+                          hyp.tree)
+                        try:
+                            java_ast = parse_snippet(code)
+                        except JavaSyntaxError as e:
+                            continue
+                        hyp.code = code
+                        got_code = True
+                        decoded_hyps.append(hyp)
+                    except Exception as e:
+                        if verbose:
+                            print("Exception in converting tree to code:",
+                                  file=sys.stdout)
+                            print('-' * 60, file=sys.stdout)
+                            print(f'Example: {example.idx}', file=sys.stdout)
+                            print(f'Intent: {" ".join(example.src_sent)}',
+                                  file=sys.stdout)
+                            print('Target Code:', file=sys.stdout)
+                            print(example.tgt_code, file=sys.stdout)
+                            print(f'Hypothesis[{hyp_id}]:', file=sys.stdout)
+                            print(hyp.tree.to_string(), file=sys.stdout)
+                            if got_code:
+                                print()
+                                print(hyp.code)
+                            traceback.print_exc(file=sys.stdout)
+                            print('-' * 60, file=sys.stdout)
 
-        count += 1
+                count += 1
 
-        decode_results.append(decoded_hyps)
+                decode_results.append(decoded_hyps)
+            pbar.update(len(batch_examples))
 
     if was_training:
         model.train()
@@ -13,7 +13,7 @@ import evaluation
 from asdl.asdl import ASDLGrammar
 from asdl.transition_system import TransitionSystem
 from common.utils import update_args, init_arg_parser
-from components.dataset import Dataset
+from components.dataset import Dataset, BatchCollator, ExampleCollator, PaddingCounter
 from components.reranker import *
 from components.standalone_parser import StandaloneParser
 from model import nn_utils
@@ -47,8 +47,7 @@ def train(args):
     root_production = None
     if args.root_production:
         root_production = args.root_production.split(',')
-    grammar = ASDLGrammar.from_text(open(args.asdl_file).read(),
-                                    root_production)
+    grammar = ASDLGrammar.from_file(args.asdl_file, root_production)
     transition_system = Registrable.by_name(args.transition_system)(grammar)
 
     vocab = pickle.load(open(args.vocab, 'rb'))
@@ -56,6 +55,7 @@ def train(args):
     if args.pretrain:
         print('Finetune with: ', args.pretrain, file=sys.stderr)
         model = parser_cls.load(model_path=args.pretrain, cuda=args.cuda)
+        grammar.check_ids(model.grammar)
     else:
         model = parser_cls(args, vocab, transition_system)
 
@@ -100,6 +100,15 @@ def train(args):
           file=sys.stderr)
     print('vocab: %s' % repr(vocab), file=sys.stderr)
 
+    # the training batches are built by the loader, in worker processes
+    # with --num_loader_workers
+    train_loader = train_set.data_loader(
+      batch_size=args.batch_size, shuffle=True,
+      collate_fn=BatchCollator(transition_system.grammar, vocab,
+                               copy=model.args.no_copy is False,
+                               max_action_num=args.decode_max_time_step),
+      num_workers=args.num_loader_workers, bucket_size=args.bucket_size)
+
     epoch = train_iter = 0
     report_loss = report_examples = report_sup_att_loss = 0.
     history_dev_scores = []
@@ -107,22 +116,20 @@ def train(args):
     while True:
         epoch += 1
         epoch_begin = time.time()
+        padding_counter = PaddingCounter()
 
-        for batch_examples in train_set.batch_iter(batch_size=args.batch_size,
-                                                   shuffle=True):
-            batch_examples = [
-              e for e in batch_examples
-              if len(e.tgt_actions) <= args.decode_max_time_step]
+        for batch in train_loader:
             train_iter += 1
+            padding_counter.add(batch.examples)
             optimizer.zero_grad()
 
-            ret_val = model.score(batch_examples)
+            ret_val = model.score(batch)
             loss = -ret_val[0]
 
             # print(loss.data)
             loss_val = torch.sum(loss).data.item()
             report_loss += loss_val
-            report_examples += len(batch_examples)
+            report_examples += len(batch)
             loss = torch.mean(loss)
 
             if args.sup_attention:
@@ -154,8 +161,9 @@ def train(args):
                 print(log_str, file=sys.stderr)
                 report_loss = report_examples = 0.
 
-        print('[Epoch %d] epoch elapsed %ds' % (
-          epoch, time.time() - epoch_begin),
+        print('[Epoch %d] epoch elapsed %ds, padding ratio %.3f' % (
+          epoch, time.time() - epoch_begin,
+          padding_counter.ratio),
               file=sys.stderr)
 
         if args.save_all_models:
@@ -250,7 +258,7 @@ def train_rerank_feature(args):
     dev_set = Dataset.from_bin_file(args.dev_file)
     vocab = pickle.load(open(args.vocab, 'rb'))
 
-    grammar = ASDLGrammar.from_text(open(args.asdl_file).read())
+    grammar = ASDLGrammar.from_file(args.asdl_file)
     transition_system = TransitionSystem.get_class_by_lang(
       args.transition_system)(grammar)
 
@@ -381,6 +389,11 @@ def train_rerank_feature(args):
           file=sys.stderr)
     print('vocab: %s' % repr(vocab), file=sys.stderr)
 
+    train_loader = train_set.data_loader(
+      batch_size=args.batch_size, shuffle=True,
+      collate_fn=ExampleCollator(max_action_num=args.decode_max_time_step),
+      num_workers=args.num_loader_workers, bucket_size=args.bucket_size)
+
     epoch = train_iter = 0
     report_loss = report_examples = 0.
     history_dev_scores = []
@@ -388,11 +401,10 @@ def train_rerank_feature(args):
     while True:
         epoch += 1
         epoch_begin = time.time()
+        padding_counter = PaddingCounter()
 
-        for batch_examples in train_set.batch_iter(batch_size=args.batch_size,
-                                                   shuffle=True):
-            batch_examples = [e for e in batch_examples
-                              if len(e.tgt_actions) <= args.decode_max_time_step]
+        for batch_examples in train_loader:
+            padding_counter.add(batch_examples)
 
             if train_paraphrase_model:
                 positive_examples_num = len(batch_examples)
@@ -445,7 +457,8 @@ def train_rerank_feature(args):
 
                 report_loss = report_examples = 0.
 
-        print('[Epoch %d] epoch elapsed %ds' % (epoch, time.time() - epoch_begin), file=sys.stderr)
+        print('[Epoch %d] epoch elapsed %ds, padding ratio %.3f' % (
+          epoch, time.time() - epoch_begin, padding_counter.ratio), file=sys.stderr)
 
         # perform validation
         print('[Epoch %d] begin validation' % epoch, file=sys.stderr)
@@ -1,9 +1,24 @@
+import operator
 import pickle
 
 import six
 import sys
 
 
+def children_getter(attrs):
+    """ returns a function returning the list of the values of the attributes
+    of a node, in the order of attrs
+    """
+    if len(attrs) == 0:
+        return lambda node: []
+    elif len(attrs) == 1:
+        getter = operator.attrgetter(attrs[0])
+        return lambda node: [getter(node)]
+    else:
+        getter = operator.attrgetter(*attrs)
+        return lambda node: list(getter(node))
+
+
 class MetaNode(type):
     def __new__(mcs, name, bases, dict):
         attrs = list(dict['attrs'])
@@ -13,13 +28,20 @@ class MetaNode(type):
             if hasattr(base, 'attrs'):
                 dict['attrs'].extend(base.attrs)
 
+        # the attributes are stored in slots rather than in a __dict__, the
+        # ones of the base classes are in their slots
+        dict['__slots__'] = tuple(dict.get('__slots__', ())) + tuple(
+            attr for attr in attrs if attr not in dict['attrs'])
+
         dict['attrs'].extend(attrs)
+        dict['get_children'] = staticmethod(children_getter(dict['attrs']))
 
         return type.__new__(mcs, name, bases, dict)
 
 
 @six.add_metaclass(MetaNode)
 class Node(object):
+    __slots__ = ('_position',)
     attrs = ()
 
     def __init__(self, **kwargs):
@@ -52,33 +74,105 @@ class Node(object):
         return walk_tree(self)
 
     def filter(self, pattern):
+        if isinstance(pattern, type):
+            yield from walk_tree(self, pattern)
+            return
+
         for path, node in self:
-            if ((isinstance(pattern, type) and isinstance(node, pattern)) or
-                (node == pattern)):
+            if node == pattern:
                 yield path, node
 
     @property
     def children(self):
-        return [getattr(self, attr_name) for attr_name in self.attrs]
+        return self.get_children(self)
 
     @property
     def position(self):
         if hasattr(self, "_position"):
             return self._position
 
-def walk_tree(root):
-    children = None
+    def __getstate__(self):
+        state = dict()
+        for attr_name in self.__class__.attrs + ['_position']:
+            if hasattr(self, attr_name):
+                state[attr_name] = getattr(self, attr_name)
+        return state
+
+    def __setstate__(self, state):
+        # also restores the nodes pickled with a __dict__, before the slots
+        for attr_name, value in state.items():
+            setattr(self, attr_name, value)
+
+def walk_tree(root, node_type=None):
+    """ Yields the (path, node) pairs of the nodes of the tree in depth first
+    order, path being the tuple of the nodes and lists from root to node.
+    With node_type, only the nodes of this type are yielded.
+
+    The tree is walked iteratively, and the nodes and lists with the same
+    parent share their path.
+
+    """
+
+    if isinstance(root, Node):
+        if node_type is None or isinstance(root, node_type):
+            yield (), root
+        children = root.children
+    else:
+        children = root
+
+    stack = [((root,), iter(children))]
+    while stack:
+        path, children = stack[-1]
+        for child in children:
+            if isinstance(child, Node):
+                if node_type is None or isinstance(child, node_type):
+                    yield path, child
+                stack.append((path + (child,), iter(child.children)))
+                break
+            elif isinstance(child, (list, tuple)):
+                stack.append((path + (child,), iter(child)))
+                break
+        else:
+            stack.pop()
+
+def iter_tree(root, node_type=None, path=None):
+    """ Yields the nodes of the tree in the order of walk_tree, without
+    building their paths. With node_type, only the nodes of this type are
+    yielded. A path list, if given, is kept up to date with the nodes and
+    lists from root to the last yielded node, which are the items of its path
+    in walk_tree; it is only valid until the next node is yielded.
+
+    """
+
+    if path is None:
+        path = list()
+    else:
+        del path[:]
 
     if isinstance(root, Node):
-        yield (), root
+        if node_type is None or isinstance(root, node_type):
+            yield root
         children = root.children
     else:
         children = root
 
-    for child in children:
-        if isinstance(child, (Node, list, tuple)):
-            for path, node in walk_tree(child):
-                yield (root,) + path, node
+    path.append(root)
+    stack = [iter(children)]
+    while stack:
+        for child in stack[-1]:
+            if isinstance(child, Node):
+                if node_type is None or isinstance(child, node_type):
+                    yield child
+                path.append(child)
+                stack.append(iter(child.children))
+                break
+            elif isinstance(child, (list, tuple)):
+                path.append(child)
+                stack.append(iter(child))
+                break
+        else:
+            stack.pop()
+            path.pop()
 
 def dump(ast, file):
     pickle.dump(ast, file)
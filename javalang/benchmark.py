@@ -0,0 +1,140 @@
+"""
+Benchmark of the tokenizers and of the parser on Java files and on the snippets of a
+Concode corpus, and of the parser with and without memoization on inputs which make it
+backtrack the most
+
+    python -m javalang.benchmark [--concode concode_train.json] [java files or directories...]
+
+The Concode corpus may be in the original format ("code" token lists) or converted by
+concode2conala.py ("snippet" strings), as a JSON array or JSONL.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from . import parser
+from . import tokenizer
+
+
+def load_java_files(paths):
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(glob.glob(os.path.join(path, '**', '*.java'), recursive=True))
+        else:
+            files = [path]
+        for file in files:
+            with open(file, encoding='utf-8', errors='replace') as f:
+                sources.append(f.read())
+
+    return sources
+
+
+def load_concode_snippets(path):
+    with open(path) as f:
+        try:
+            examples = json.load(f)
+        except ValueError:
+            f.seek(0)
+            examples = [json.loads(line) for line in f if line.strip()]
+
+    return [example['snippet'] if 'snippet' in example else ' '.join(example['code'])
+            for example in examples]
+
+
+def time_function(function, sources, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for source in sources:
+            function(source)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def benchmark_tokenizers(name, sources, repeat):
+    def tokenize(fast):
+        return lambda source: list(tokenizer.tokenize(source, ignore_errors=True, fast=fast))
+
+    size = sum(len(source) for source in sources)
+    reference_time = time_function(tokenize(False), sources, repeat)
+    fast_time = time_function(tokenize(True), sources, repeat)
+    print(f'{name}: {len(sources)} sources, {size / 1e6:.2f}M characters', file=sys.stderr)
+    print(f'  tokenizer  JavaTokenizer {reference_time:.3f}s  FastJavaTokenizer {fast_time:.3f}s  '
+          f'speedup x{reference_time / fast_time:.2f}', file=sys.stderr)
+
+
+def benchmark_parser(name, sources, rule, repeat):
+    token_lists = [list(tokenizer.tokenize(source, ignore_errors=True)) for source in sources]
+
+    def parse(memoize):
+        def _parse(tokens):
+            try:
+                getattr(parser.Parser(tokens, memoize=memoize), rule)()
+            except parser.JavaSyntaxError:
+                pass
+
+        return _parse
+
+    reference_time = time_function(parse(False), token_lists, repeat)
+    memoized_time = time_function(parse(True), token_lists, repeat)
+    print(f'  parser     {reference_time:.3f}s  memoized {memoized_time:.3f}s  '
+          f'speedup x{reference_time / memoized_time:.2f}', file=sys.stderr)
+
+
+# statements nested `depth` times, on which the parser backtracks the most
+WORST_CASES = {
+    'array index': lambda depth: 'x = ' + 'a[' * depth + '0' + ']' * depth + ';',
+    'array index statement': lambda depth: 'a[' * depth + '0' + ']' * depth + ' = 1;',
+    'parenthesized array index': lambda depth: 'x = ' + '(a[' * depth + '0' + '])' * depth + ';',
+    'method reference': lambda depth: 'x = ' + 'a[' * depth + '0' + ']' * depth + '::b;',
+}
+
+
+def benchmark_worst_cases(depths, max_time):
+    for name, statement in WORST_CASES.items():
+        print(f'{name}:', file=sys.stderr)
+        for memoize in (False, True):
+            times = []
+            for depth in depths:
+                code = 'class A { void f() { %s } }' % statement(depth)
+                tokens = list(tokenizer.tokenize(code))
+                elapsed = time_function(lambda tokens: parser.Parser(tokens, memoize=memoize).parse(), [tokens], 1)
+                times.append(f'{depth}: {elapsed:.4f}s')
+                if elapsed > max_time:
+                    break
+            print(f'  {"memoized" if memoize else "parser  "}  {"  ".join(times)}', file=sys.stderr)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='benchmark of the Java tokenizers')
+    arg_parser.add_argument('paths', type=str, nargs='*',
+                            default=[os.path.join(os.path.dirname(__file__), '..', 'asdl', 'lang', 'java', 'test')],
+                            help='Java files or directories of Java files')
+    arg_parser.add_argument('--concode', type=str, help='Concode corpus (JSON or JSONL)')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='Number of runs, the best one is reported')
+    arg_parser.add_argument('--depths', type=int, nargs='+', default=[2, 4, 6, 8, 10, 12, 14, 16],
+                            help='Nesting depths of the worst case inputs of the parser')
+    arg_parser.add_argument('--max_time', type=float, default=1.,
+                            help='Time after which the worst case inputs are not nested any deeper')
+    args = arg_parser.parse_args()
+
+    sources = load_java_files(args.paths)
+    benchmark_tokenizers('java files', sources, args.repeat)
+    benchmark_parser('java files', sources, 'parse', args.repeat)
+    if args.concode:
+        sources = load_concode_snippets(args.concode)
+        benchmark_tokenizers('concode', sources, args.repeat)
+        benchmark_parser('concode', sources, 'parse_member_declaration', args.repeat)
+
+    benchmark_worst_cases(args.depths, args.max_time)
+
+
+if __name__ == '__main__':
+    main()
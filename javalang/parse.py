@@ -54,21 +54,27 @@ def parse_type_signature(sig):
     return parser.parse_class_or_interface_declaration()
 
 
-def parse(s):
+def parse(s, memoize=False):
     tokens = tokenize(s)
-    parser = Parser(tokens)
+    parser = Parser(tokens, memoize=memoize)
     return parser.parse()
 
 
+def parse_snippet(s, memoize=False):
+    tokens = tokenize(s)
+    parser = Parser(tokens, memoize=memoize)
+    return parser.parse_snippet()
+
+
 def parse_method_or_field_declaraction(s):
     tokens = tokenize(s)
     parser = Parser(tokens)
     return parser.parse_method_or_field_declaraction()
 
 
-def parse_member_declaration(s):
+def parse_member_declaration(s, memoize=False):
     tokens = tokenize(s)
-    parser = Parser(tokens)
+    parser = Parser(tokens, memoize=memoize)
     return parser.parse_member_declaration()
 
 
@@ -1,3 +1,6 @@
+import copy
+import functools
+
 import six
 from typing import List, Set, Tuple
 
@@ -60,6 +63,66 @@ def parse_debug(method):
     else:
         return method
 
+def parse_memoize(method):
+    """ Memoize the result of a rule, or the syntax error it raised, at each
+    token position when the parser is created with memoize=True (packrat
+    parsing), so that the rules re-entered after a backtracking do not parse
+    the same tokens again.
+
+    The callers complete the results they get (positions, selectors, array
+    dimensions...) so the memoized results are copies, down to their lists of
+    children.
+
+    """
+
+    name = method.__name__
+
+    @functools.wraps(method)
+    def _method(self):
+        if self.memo is None:
+            return method(self)
+
+        tokens = self.tokens
+        key = (name, tokens.marker)
+        entry = self.memo.get(key)
+
+        if entry is None:
+            try:
+                result = method(self)
+            except JavaSyntaxError as e:
+                self.memo[key] = (tokens.marker, None, e)
+                raise
+
+            self.memo[key] = (tokens.marker, copy_result(result), None)
+            return result
+
+        marker, result, error = entry
+        tokens.marker = marker
+        if error is not None:
+            raise error
+
+        return copy_result(result)
+
+    return _method
+
+def copy_result(result):
+    if isinstance(result, list):
+        return list(result)
+
+    if isinstance(result, tree.Node):
+        node = result
+        result = object.__new__(type(node))
+        for attr in node.attrs:
+            value = getattr(node, attr)
+            if type(value) in (list, set):
+                value = type(value)(value)
+            setattr(result, attr, value)
+
+        if hasattr(node, '_position'):
+            result._position = node._position
+
+    return result
+
 # ------------------------------------------------------------------------------
 # ---- Parsing exception ----
 
@@ -92,11 +155,12 @@ class Parser(object):
                             set(('+', '-')),
                             set(('*', '/', '%')) ]
 
-    def __init__(self, tokens):
+    def __init__(self, tokens, memoize=False):
         self.tokens = util.LookAheadListIterator(tokens)
         self.tokens.set_default(EndOfInput(None))
 
         self.debug = False
+        self.memo = dict() if memoize else None
 
 # ------------------------------------------------------------------------------
 # ---- Debug control ----
@@ -110,6 +174,24 @@ class Parser(object):
     def parse(self):
         return self.parse_compilation_unit()
 
+    def parse_snippet(self):
+        """ Parses a compilation unit or, if the code can not be one, a member
+        declaration. The result is the one of parse, falling back on
+        parse_member_declaration on a syntax error, without tokenizing the
+        code again nor trying a compilation unit when the first tokens tell it
+        is not one.
+
+        """
+
+        if self.is_compilation_unit():
+            try:
+                with self.tokens:
+                    return self.parse_compilation_unit()
+            except JavaSyntaxError:
+                pass
+
+        return self.parse_member_declaration()
+
 # ------------------------------------------------------------------------------
 # ---- Helper methods ----
 
@@ -222,6 +304,28 @@ class Parser(object):
         return (isinstance(self.tokens.look(i), Annotation)
                 and self.tokens.look(i + 1).value == 'interface')
 
+    def is_compilation_unit(self):
+        """ Returns true if the tokens can be parsed as a compilation unit, which
+        starts with a package declaration, an import declaration or a type
+        declaration (or is empty)
+
+        """
+
+        token = self.tokens.look()
+        if isinstance(token, EndOfInput) or token.value in ('package', 'import', ';'):
+            return True
+
+        self.tokens.push_marker()
+        try:
+            self.parse_modifiers()
+            token = self.tokens.look()
+            return (token.value in ('package', 'class', 'enum', 'interface')
+                    or self.is_annotation_declaration())
+        except JavaSyntaxError:
+            return False
+        finally:
+            self.tokens.pop_marker(True)
+
 # ------------------------------------------------------------------------------
 # ---- Parsing methods ----
 
@@ -462,6 +566,7 @@ class Parser(object):
 # -- Types --
 
     @parse_debug
+    @parse_memoize
     def parse_type(self) -> tree.Type:
         java_type = None
         token = self.tokens.look()
@@ -1813,6 +1918,7 @@ class Parser(object):
 # -- Expressions --
 
     @parse_debug
+    @parse_memoize
     def parse_expression(self) -> tree.Primary:
         try:
             with self.tokens:
@@ -2022,6 +2128,7 @@ class Parser(object):
 # -- Primary expressions --
 
     @parse_debug
+    @parse_memoize
     def parse_primary(self) -> tree.Primary:
         token = self.tokens.look()
 
@@ -2126,6 +2233,7 @@ class Parser(object):
         return tree.ParenthesizedExpression(expression=expression)
 
     @parse_debug
+    @parse_memoize
     def parse_arguments(self):
         expressions = list()
 
@@ -0,0 +1,33 @@
+import pickle
+import unittest
+
+from .. import parse, tree
+
+
+class NodeTest(unittest.TestCase):
+
+    code = 'class A { int f(int[] a) { return a[0] + 1; } }'
+
+    def test_slots(self):
+        compilation_unit = parse.parse(self.code)
+        for _, node in compilation_unit:
+            self.assertFalse(hasattr(node, '__dict__'))
+            self.assertEqual(node.children, [getattr(node, attr) for attr in node.attrs])
+
+    def test_pickle(self):
+        compilation_unit = parse.parse(self.code)
+        unpickled = pickle.loads(pickle.dumps(compilation_unit))
+        self.assertEqual(repr(unpickled), repr(compilation_unit))
+        self.assertEqual(unpickled.types[0].position, compilation_unit.types[0].position)
+        self.assertIsNone(unpickled.position)
+
+    def test_unpickle_dict_state(self):
+        # nodes pickled when they had a __dict__
+        node = tree.MemberReference.__new__(tree.MemberReference)
+        node.__setstate__({'member': 'a', 'qualifier': '', 'selectors': [], '_position': (1, 2)})
+        self.assertEqual(node.member, 'a')
+        self.assertEqual(node.position, (1, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from .. import parse, parser, tree
+from .test_parser_memoize import dump_tree
+
+
+class ParseSnippetTest(unittest.TestCase):
+
+    def parse_with_fallback(self, code):
+        try:
+            return parse.parse(code)
+        except parser.JavaSyntaxError:
+            return parse.parse_member_declaration(code)
+
+    def assertSameAsFallback(self, code, node_type):
+        java_ast = parse.parse_snippet(code)
+        self.assertIsInstance(java_ast, node_type)
+        self.assertEqual(dump_tree(java_ast), dump_tree(self.parse_with_fallback(code)))
+
+    def test_compilation_unit(self):
+        self.assertSameAsFallback('', tree.CompilationUnit)
+        self.assertSameAsFallback('package a.b; import c.D; class A { int x; }', tree.CompilationUnit)
+        self.assertSameAsFallback('@Deprecated package a;', tree.CompilationUnit)
+        self.assertSameAsFallback('/** doc */ public final class A<T> extends B { }', tree.CompilationUnit)
+        self.assertSameAsFallback('@interface A { int x(); }', tree.CompilationUnit)
+
+    def test_member_declaration(self):
+        self.assertSameAsFallback('public static int f(int a) { return a; }', tree.MethodDeclaration)
+        self.assertSameAsFallback('@Override public String toString() { return "A"; }', tree.MethodDeclaration)
+        self.assertSameAsFallback('private int[] x = {1, 2};', tree.FieldDeclaration)
+        self.assertSameAsFallback('<T> T f() { return null; }', tree.MethodDeclaration)
+        self.assertSameAsFallback('A() { super(); }', tree.ConstructorDeclaration)
+
+    def test_compilation_unit_fallback(self):
+        # a class followed by a member is not a compilation unit, but the class
+        # is a member declaration
+        self.assertSameAsFallback('class A { } int x;', tree.ClassDeclaration)
+
+    def test_syntax_error(self):
+        with self.assertRaises(parser.JavaSyntaxError):
+            parse.parse_snippet('int f( { }')
+
+
+if __name__ == "__main__":
+    unittest.main()
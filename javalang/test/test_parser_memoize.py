@@ -0,0 +1,61 @@
+import glob
+import os
+import unittest
+
+from .. import parser, tokenizer
+from ..ast import Node
+
+
+def dump_tree(node):
+    """ returns a comparable representation of the given tree, with the
+        positions of its nodes.
+    """
+    if isinstance(node, Node):
+        return (type(node).__name__, node.position,
+                tuple(dump_tree(child) for child in node.children))
+    elif isinstance(node, (list, tuple)):
+        return tuple(dump_tree(child) for child in node)
+    elif isinstance(node, set):
+        return tuple(sorted(node))
+    return node
+
+
+class ParserMemoizeTest(unittest.TestCase):
+
+    def parse(self, code, memoize, rule='parse'):
+        tokens = list(tokenizer.tokenize(code, ignore_errors=True))
+        try:
+            return dump_tree(getattr(parser.Parser(tokens, memoize=memoize), rule)())
+        except parser.JavaSyntaxError as e:
+            return 'JavaSyntaxError', e.description, e.at.position
+
+    def assertSameTree(self, code, rule='parse'):
+        self.assertEqual(self.parse(code, True, rule), self.parse(code, False, rule))
+
+    def test_memoize_source_files(self):
+        test_dir = os.path.dirname(__file__)
+        files = glob.glob(os.path.join(test_dir, 'source', '**', '*.java'), recursive=True) \
+            + glob.glob(os.path.join(test_dir, '..', '..', 'asdl', 'lang', 'java', 'test', '**', '*.java'),
+                        recursive=True)
+        for file in files[:100]:
+            with open(file) as f:
+                code = f.read()
+            self.assertSameTree(code)
+            self.assertSameTree(code, 'parse_member_declaration')
+
+    def test_memoize_backtracking(self):
+        # the selectors and operators of the expressions parsed again after a
+        # backtracking must not be added twice
+        for statement in ['x = (a)[0]++;', '-(a).b(c)[0] = (A) (b)[1];', 'a.b(c).d(e);',
+                          'x = a[b[0]]::c;', 'A<B>[] a = (A<B>[]) b;', 'x = (a, b) -> a[b];',
+                          'x = a[0] 1;']:
+            self.assertSameTree('class A { void f() { %s } }' % statement)
+
+    def test_memoize_nested_expressions(self):
+        code = 'class A { void f() { x = %s0%s; } }' % ('(a[' * 50, '])' * 50)
+        tokens = list(tokenizer.tokenize(code))
+        parser.Parser(tokens, memoize=True).parse()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,5 @@
+import glob
+import os
 import unittest
 from .. import tokenizer
 
@@ -188,5 +190,37 @@ int k;
         self.assertEqual(token[0].position.column, 1)
         self.assertEqual(token[3].position.column, 1)
 
+    def assertSameTokens(self, code, ignore_errors=False):
+        tokens = list(tokenizer.JavaTokenizer(code, ignore_errors).tokenize())
+        fast_tokens = list(tokenizer.FastJavaTokenizer(code, ignore_errors).tokenize())
+        self.assertEqual([(type(token), token.value, token.position, token.javadoc) for token in fast_tokens],
+                         [(type(token), token.value, token.position, token.javadoc) for token in tokens])
+
+    def test_fast_tokenizer_snippets(self):
+        snippets = [
+            "int a = 0x1F + 017 + 0b101 + 1_000L + .5e-3f + 1. + 2.0d + 'c' + '\\u0041' + \"s\\\"t\";",
+            "a >>>= b >> c >>> d; x -> x::y; a...b; @interface A {}",
+            "/** doc */ public static final class A<T extends B<C>> { }",
+            "// line comment\nint a; /* block\n comment */ int b;",
+            "String s = \"\\t\\n\\r\\\\\"; char c = '\\'';",
+            "if (a) { return true; } else { return null; }",
+            "int \u00e9t\u00e9 = caf\u00e9;",
+        ]
+        for code in snippets:
+            self.assertSameTokens(code)
+
+        self.assertSameTokens("a # b \"unterminated", ignore_errors=True)
+        with self.assertRaises(tokenizer.LexerError):
+            list(tokenizer.FastJavaTokenizer("a # b").tokenize())
+
+    def test_fast_tokenizer_source_files(self):
+        test_dir = os.path.dirname(__file__)
+        files = glob.glob(os.path.join(test_dir, 'source', '**', '*.java'), recursive=True) \
+            + glob.glob(os.path.join(test_dir, '..', '..', 'asdl', 'lang', 'java', 'test', '**', '*.java'),
+                        recursive=True)
+        for file in files:
+            with open(file) as f:
+                self.assertSameTokens(f.read(), ignore_errors=True)
+
 if __name__=="__main__":
     unittest.main()
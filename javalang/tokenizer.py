@@ -498,69 +498,76 @@ class JavaTokenizer(object):
         self.pre_tokenize()
 
         while self.i < self.length:
-            token_type = None
-
-            c = self.data[self.i]
-            c_next = None
-            startswith = c
-
-            if self.i + 1 < self.length:
-                c_next = self.data[self.i + 1]
-                startswith = c + c_next
-
-            if c.isspace():
-                self.consume_whitespace()
-                continue
-
-            elif startswith in ("//", "/*"):
-                comment = self.read_comment()
-                if comment.startswith("/**"):
-                    self.javadoc = comment
-                continue
-
-            elif startswith == '..' and self.try_operator():
-                # Ensure we don't mistake a '...' operator as a sequence of
-                # three '.' separators. This is done as an optimization instead
-                # of moving try_operator higher in the chain because operators
-                # aren't as common and try_operator is expensive
-                token_type = Operator
+            token = self.read_token()
+            if token is not None:
+                yield token
+
+    def read_token(self):
+        """read the token at self.i, returns None after whitespace, comments and errors"""
+        token_type = None
+
+        c = self.data[self.i]
+        c_next = None
+        startswith = c
+
+        if self.i + 1 < self.length:
+            c_next = self.data[self.i + 1]
+            startswith = c + c_next
+
+        if c.isspace():
+            self.consume_whitespace()
+            return None
+
+        elif startswith in ("//", "/*"):
+            comment = self.read_comment()
+            if comment.startswith("/**"):
+                self.javadoc = comment
+            return None
+
+        elif startswith == '..' and self.try_operator():
+            # Ensure we don't mistake a '...' operator as a sequence of
+            # three '.' separators. This is done as an optimization instead
+            # of moving try_operator higher in the chain because operators
+            # aren't as common and try_operator is expensive
+            token_type = Operator
+
+        elif c == '@':
+            token_type = Annotation
+            self.j = self.i + 1
 
-            elif c == '@':
-                token_type = Annotation
-                self.j = self.i + 1
+        elif c == '.' and c_next and c_next.isdigit():
+            token_type = self.read_decimal_float_or_integer()
 
-            elif c == '.' and c_next and c_next.isdigit():
-                token_type = self.read_decimal_float_or_integer()
+        elif self.try_separator():
+            token_type = Separator
 
-            elif self.try_separator():
-                token_type = Separator
+        elif c in ("'", '"'):
+            token_type = String
+            self.read_string()
 
-            elif c in ("'", '"'):
-                token_type = String
-                self.read_string()
+        elif c in '0123456789':
+            token_type = self.read_integer_or_float(c, c_next)
 
-            elif c in '0123456789':
-                token_type = self.read_integer_or_float(c, c_next)
+        elif self.is_java_identifier_start(c):
+            token_type = self.read_identifier()
 
-            elif self.is_java_identifier_start(c):
-                token_type = self.read_identifier()
+        elif self.try_operator():
+            token_type = Operator
 
-            elif self.try_operator():
-                token_type = Operator
+        else:
+            self.error('Could not process token', c)
+            self.i = self.i + 1
+            return None
 
-            else:
-                self.error('Could not process token', c)
-                self.i = self.i + 1
-                continue
+        position = Position(self.current_line, self.i - self.start_of_line)
+        token = token_type(self.data[self.i:self.j], position, self.javadoc)
 
-            position = Position(self.current_line, self.i - self.start_of_line)
-            token = token_type(self.data[self.i:self.j], position, self.javadoc)
-            yield token
+        if self.javadoc:
+            self.javadoc = None
 
-            if self.javadoc:
-                self.javadoc = None
+        self.i = self.j
 
-            self.i = self.j
+        return token
 
     def error(self, message, char=None):
         # Provide additional information in the errors message
@@ -580,8 +587,102 @@ class JavaTokenizer(object):
         if not self.ignore_errors:
             raise error
 
-def tokenize(code, ignore_errors=False):
-    tokenizer = JavaTokenizer(code, ignore_errors)
+class FastJavaTokenizer(JavaTokenizer):
+    """
+    Produces the same tokens as JavaTokenizer, but matches the common ones (whitespace,
+    comments, ASCII identifiers and keywords, decimal integers, strings without octal
+    escapes, separators and operators) with a single compiled regular expression. The
+    other ones (other numbers, non-ASCII identifiers, errors...) are left to
+    JavaTokenizer.read_token.
+    """
+
+    TOKEN_REGEX = re.compile('|'.join([
+        r'(?P<whitespace>\s+)',
+        r'(?P<comment>//[^\n]*\n?|/\*[\s\S]*?\*/)',
+        r'(?P<ellipsis>\.\.\.)',
+        r'(?P<annotation>@)',
+        # unterminated comments and numbers starting with a dot
+        r'(?P<fallback>/\*|\.(?=[0-9]|[^\x00-\x7f]))',
+        r'(?P<separator>[(){}\[\];,.])',
+        r'(?P<string>"[^"\\]*(?:\\[btnfru"\'\\][^"\\]*)*"|\'[^\'\\]*(?:\\[btnfru"\'\\][^\'\\]*)*\')',
+        r'(?P<integer>0(?=[^\w.])|[1-9][0-9]*(?![\w.]))',
+        # identifiers followed by a non-ASCII character may go on with it
+        r'(?P<identifier>[A-Za-z_$][A-Za-z0-9_$]*(?![A-Za-z0-9_$]|[^\x00-\x7f]))',
+        r'(?P<operator>%s)' % '|'.join(re.escape(operator)
+                                       for operator in sorted(Operator.VALUES, key=len, reverse=True)),
+    ]))
+
+    TOKEN_TYPES = {'ellipsis': Operator,
+                   'annotation': Annotation,
+                   'separator': Separator,
+                   'string': String,
+                   'integer': DecimalInteger,
+                   'operator': Operator}
+
+    IDENTIFIER_TYPES = dict([(value, Keyword) for value in Keyword.VALUES] +
+                            [(value, Modifier) for value in Modifier.VALUES] +
+                            [(value, BasicType) for value in BasicType.VALUES] +
+                            [(value, Boolean) for value in Boolean.VALUES] +
+                            [('null', Null)])
+
+    def tokenize(self):
+        self.reset()
+
+        # Convert unicode escapes
+        self.pre_tokenize()
+
+        data = self.data
+        match_token = self.TOKEN_REGEX.match
+        token_types = self.TOKEN_TYPES
+        identifier_types = self.IDENTIFIER_TYPES
+
+        # the tokenizer state is kept in local variables, and synchronized with the
+        # attributes around the calls to read_token
+        i, j, length = self.i, self.j, self.length
+        current_line, start_of_line, javadoc = self.current_line, self.start_of_line, self.javadoc
+
+        while i < length:
+            match = match_token(data, i)
+            kind = match.lastgroup if match else None
+
+            if kind is None or kind == 'fallback':
+                self.i, self.j = i, j
+                self.current_line, self.start_of_line, self.javadoc = current_line, start_of_line, javadoc
+                token = self.read_token()
+                i, j = self.i, self.j
+                current_line, start_of_line, javadoc = self.current_line, self.start_of_line, self.javadoc
+                if token is not None:
+                    yield token
+                continue
+
+            end = match.end()
+
+            if kind == 'whitespace' or kind == 'comment':
+                line_end = data.rfind('\n', i, end)
+                if line_end != -1:
+                    start_of_line = line_end
+                    current_line += data.count('\n', i, end)
+                if kind == 'comment' and data.startswith('/**', i):
+                    javadoc = match.group()
+                i = end
+                continue
+
+            value = match.group()
+            if kind == 'identifier':
+                token_type = identifier_types.get(value, Identifier)
+            else:
+                token_type = token_types[kind]
+
+            yield token_type(value, Position(current_line, i - start_of_line), javadoc)
+
+            javadoc = None
+            i = j = end
+
+        self.i, self.j = i, j
+        self.current_line, self.start_of_line, self.javadoc = current_line, start_of_line, javadoc
+
+def tokenize(code, ignore_errors=False, fast=True):
+    tokenizer = (FastJavaTokenizer if fast else JavaTokenizer)(code, ignore_errors)
     return tokenizer.tokenize()
 
 def reformat_tokens(tokens):
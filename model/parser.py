@@ -17,7 +17,7 @@ from torch.nn.utils.rnn import pad_packed_sequence, pack_padded_sequence
 from asdl.hypothesis import Hypothesis, GenTokenAction
 from asdl.transition_system import ApplyRuleAction, ReduceAction, Action
 from common.registerable import Registrable
-from components.decode_hypothesis import DecodeHypothesis
+from components.decode_hypothesis import DecodeHypothesis, CompactDecodeHypothesis
 from components.action_info import ActionInfo
 from components.dataset import Batch
 from common.utils import update_args, init_arg_parser
@@ -68,8 +68,9 @@ class Parser(nn.Module):
 
         # Embedding layers
 
-        # Load the pre-trained BERT tokenizer
-        self.bert_tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
+        if args.encoder == 'bert':
+            # Load the pre-trained BERT tokenizer
+            self.bert_tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
 
         # source token embedding
         self.src_embed = nn.Embedding(len(vocab.source), args.embed_size)
@@ -181,6 +182,23 @@ class Parser(nn.Module):
         # dropout layer
         self.dropout = nn.Dropout(args.dropout)
 
+        # masks of the ApplyRule actions (productions) valid for each frontier type, used in beam search
+        # (type_num, grammar_size + 1), the last column is the Reduce action
+        frontier_type_production_mask = torch.cat([torch.from_numpy(self.grammar.type_production_mask),
+                                                   torch.zeros(len(self.grammar.types), 1, dtype=torch.bool)], dim=-1)
+        self.register_buffer('frontier_type_production_mask', frontier_type_production_mask, persistent=False)
+
+        # masks of the primitive tokens valid for each frontier type, used in beam search
+        # (type_num, primitive_vocab_size), the rows of the composite types are not used. <unk> stands
+        # for the copied source tokens which are not in the vocabulary, it is always valid
+        primitive_type_token_mask = torch.ones(len(self.grammar.types), len(vocab.primitive), dtype=torch.bool)
+        for primitive_type in self.grammar.primitive_types:
+            primitive_type_token_mask[self.grammar.type2id[primitive_type]] = torch.tensor(
+                [self.transition_system.is_valid_primitive_token(primitive_type, vocab.primitive.id2word[token_id])
+                 for token_id in range(len(vocab.primitive))])
+        primitive_type_token_mask[:, vocab.primitive.unk_id] = True
+        self.register_buffer('primitive_type_token_mask', primitive_type_token_mask, persistent=False)
+
         if args.cuda:
             self.new_long_tensor = torch.cuda.LongTensor
             self.new_tensor = torch.cuda.FloatTensor
@@ -208,7 +226,7 @@ class Parser(nn.Module):
             src_sents_var = src_sents_var * mask + (1 - mask) * self.vocab.source.unk_id
 
         src_token_embed = self.src_embed(src_sents_var)
-        # packed_src_token_embed = pack_padded_sequence(src_token_embed, src_sents_len)
+        packed_src_token_embed = pack_padded_sequence(src_token_embed, src_sents_len)
 
         # src_encodings: (tgt_query_len, batch_size, hidden_size)
         """
@@ -232,7 +250,7 @@ class Parser(nn.Module):
                   hidden states of shape `(src_len, batch, embed_dim)`.
                   Only populated if *return_all_hiddens* is True.
         """
-        src_encodings, (last_state, last_cell) = self.encoder(src_token_embed, src_sents_len)
+        src_encodings, (last_state, last_cell) = self.encoder(packed_src_token_embed)
         src_encodings, _ = pad_packed_sequence(src_encodings)
         # src_encodings: (batch_size, tgt_query_len, hidden_size)
         src_encodings = src_encodings.permute(1, 0, 2)
@@ -296,7 +314,7 @@ class Parser(nn.Module):
                   hidden states of shape `(src_len, batch, embed_dim)`.
                   Only populated if *return_all_hiddens* is True.
         """
-        src_encodings, (last_state, last_cell) = self.encoder(src_token_embed, src_sents_len)
+        src_encodings, (last_state, last_cell) = self.encoder(packed_src_token_embed)
         src_encodings, _ = pad_packed_sequence(src_encodings)
         # src_encodings: (batch_size, tgt_query_len, hidden_size)
         src_encodings = src_encodings.permute(1, 0, 2)
@@ -319,12 +337,20 @@ class Parser(nn.Module):
         """Given a list of examples, compute the log-likelihood of generating the target AST
 
         Args:
-            examples: a batch of examples
+            examples: a batch of examples, or their `Batch` (e.g. made by a `BatchCollator`)
             return_encode_state: return encoding states of input utterances
         output: score for each training example: Variable(batch_size)
         """
 
-        batch = Batch(examples, self.grammar, self.vocab, copy=self.args.no_copy is False, cuda=self.args.cuda)
+        if isinstance(examples, Batch):
+            batch = examples
+            if batch.grammar is None:
+                # received from a data loader worker
+                batch.attach(self.grammar, self.vocab)
+            if self.args.cuda and not batch.cuda:
+                batch.to_cuda()
+        else:
+            batch = Batch(examples, self.grammar, self.vocab, copy=self.args.no_copy is False, cuda=self.args.cuda)
 
         # src_encodings: (batch_size, src_sent_len, hidden_size * 2)
         # (last_state, last_cell, dec_init_vec): (batch_size, hidden_size)
@@ -479,7 +505,6 @@ class Parser(nn.Module):
         # (batch_size, query_len, hidden_size)
         src_encodings_att_linear = self.att_src_linear(src_encodings)
 
-        zero_action_embed = Variable(self.new_tensor(args.action_embed_size).zero_())
 
         att_vecs = []
         history_states = []
@@ -510,23 +535,11 @@ class Parser(nn.Module):
                     x[:, offset: offset + args.type_embed_size] = self.type_embed(Variable(self.new_long_tensor(
                         [self.grammar.type2id[self.grammar.root_type] for e in batch.examples])))
             else:
-                a_tm1_embeds = []
-                for example in batch.examples:
-                    # action t - 1
-                    if t < len(example.tgt_actions):
-                        a_tm1 = example.tgt_actions[t - 1]
-                        if isinstance(a_tm1.action, ApplyRuleAction):
-                            a_tm1_embed = self.production_embed.weight[self.grammar.prod2id[a_tm1.action.production]]
-                        elif isinstance(a_tm1.action, ReduceAction):
-                            a_tm1_embed = self.production_embed.weight[len(self.grammar)]
-                        else:
-                            a_tm1_embed = self.primitive_embed.weight[self.vocab.primitive[a_tm1.action.token]]
-                    else:
-                        a_tm1_embed = zero_action_embed
-
-                    a_tm1_embeds.append(a_tm1_embed)
-
-                a_tm1_embeds = torch.stack(a_tm1_embeds)
+                # action t - 1, zero for the examples with no action t
+                a_tm1_embeds = torch.where(batch.apply_rule_mask[t - 1].unsqueeze(1).bool(),
+                                           self.production_embed(batch.apply_rule_idx_matrix[t - 1]),
+                                           self.primitive_embed(batch.primitive_idx_matrix[t - 1]))
+                a_tm1_embeds = a_tm1_embeds * batch.action_mask[t].unsqueeze(1)
 
                 inputs = [a_tm1_embeds]
                 if args.no_input_feed is False:
@@ -542,15 +555,13 @@ class Parser(nn.Module):
                     inputs.append(parent_field_type_embed)
 
                 # append history states
-                actions_t = [e.tgt_actions[t] if t < len(e.tgt_actions) else None for e in batch.examples]
                 if args.no_parent_state is False:
+                    p_ts = batch.parent_t_matrix[t].tolist()
                     parent_states = torch.stack([history_states[p_t][0][batch_id]
-                                                 for batch_id, p_t in
-                                                 enumerate(a_t.parent_t if a_t else 0 for a_t in actions_t)])
+                                                 for batch_id, p_t in enumerate(p_ts)])
 
                     parent_cells = torch.stack([history_states[p_t][1][batch_id]
-                                                for batch_id, p_t in
-                                                enumerate(a_t.parent_t if a_t else 0 for a_t in actions_t)])
+                                                for batch_id, p_t in enumerate(p_ts)])
 
                     if args.lstm == 'parent_feed':
                         h_tm1 = (h_tm1[0], h_tm1[1], parent_states, parent_cells)
@@ -588,74 +599,208 @@ class Parser(nn.Module):
             return att_vecs, att_probs
         else: return att_vecs
 
-    def parse(self, src_sent, context=None, beam_size=5, debug=False):
+    def parse(self, src_sent, context=None, beam_size=5, debug=False, compact_hypothesis=False,
+              recombination=None):
         """Perform beam search to infer the target AST given a source utterance
 
         Args:
             src_sent: list of source utterance tokens
             context: other context used for prediction
             beam_size: beam size
+            compact_hypothesis: use `CompactDecodeHypothesis` during the search
+            recombination: merge the duplicate hypotheses during the search, see `parse_batch`
 
         Returns:
             A list of `DecodeHypothesis`, each representing an AST
         """
 
+        return self.parse_batch([src_sent], beam_size=beam_size, debug=debug,
+                                compact_hypothesis=compact_hypothesis, recombination=recombination)[0]
+
+    def parse_batch(self, src_sents, beam_size=5, debug=False, compact_hypothesis=False,
+                    recombination=None):
+        """Perform beam search for a batch of source utterances at once
+
+        The live hypotheses of all utterances are flattened into the rows of a
+        single tensor, so that each decoder `step` processes at most
+        (batch_size * beam_size) rows. Each utterance keeps its own list of
+        completed hypotheses and stops decoding once its beam is full.
+
+        Args:
+            src_sents: list of source utterances, each one a list of tokens
+            beam_size: beam size
+            compact_hypothesis: use `CompactDecodeHypothesis` during the search, which
+                only keeps the actions and the frontier of the live hypotheses and builds
+                the AST of the completed ones
+            recombination: None, or how to merge the scores of the live hypotheses with
+                the same `DecodeHypothesis.recombination_key`, 'max' or 'logsumexp'. The
+                best of them is kept with the merged score, and the completed hypotheses
+                with the same code are also merged into the best one, so the duplicates do
+                not take the beam slots. Needs the trees of the live hypotheses, so it is
+                not supported with `compact_hypothesis`
+
+        Returns:
+            A list with one entry per utterance, each entry a list of
+            `DecodeHypothesis` sorted by descending score
+        """
+        if recombination not in (None, 'max', 'logsumexp'):
+            raise ValueError(f'unknown recombination [{recombination}]')
+        if recombination and compact_hypothesis:
+            raise ValueError('recombination is not supported with compact hypotheses')
+
+        with torch.no_grad():
+            return self._parse_batch(src_sents, beam_size, debug, compact_hypothesis, recombination)
+
+    def _completed_hypothesis_key(self, hyp):
+        """the code of a completed hypothesis, or its fingerprint if it cannot be rendered"""
+        # rendered once per completed hypothesis, the keys only live as long as
+        # the `completed_hyp_ids` of a `parse_batch` call
+        try:
+            return self.transition_system.ast_to_surface_code(hyp.tree)
+        except Exception:
+            # the code generators raise all kinds of errors on the trees they cannot
+            # render, such hypotheses are discarded after decoding
+            return hyp.tree.fingerprint
+
+    def _add_completed_hypothesis(self, hyp, src_completed_hypotheses, src_completed_hyp_ids):
+        """
+        add a completed hypothesis of an utterance, or merge it into the one with the same code,
+        returns whether it takes a new slot of the beam
+        """
+        key = self._completed_hypothesis_key(hyp)
+        completed_hyp_id = src_completed_hyp_ids.get(key)
+        if completed_hyp_id is not None:
+            # the hypotheses completed at different time steps are normalized
+            # differently, keep the best one whatever the recombination
+            if hyp.score > src_completed_hypotheses[completed_hyp_id].score:
+                src_completed_hypotheses[completed_hyp_id] = hyp
+            return False
+
+        src_completed_hyp_ids[key] = len(src_completed_hypotheses)
+        src_completed_hypotheses.append(hyp)
+        return True
+
+    @staticmethod
+    def _add_live_hypothesis(hyp, src_new_hyps, recombination):
+        """
+        add a new live hypothesis of an utterance, or merge its score into the one with the same
+        `recombination_key`, returns whether it takes a new slot of the beam
+        """
+        key = hyp.recombination_key
+        src_new_hyp = src_new_hyps.get(key)
+        if src_new_hyp is not None:
+            # the candidates come by descending score, the first one is kept
+            if recombination == 'logsumexp':
+                src_new_hyp.score = torch.logaddexp(src_new_hyp.score, hyp.score)
+            return False
+
+        src_new_hyps[key] = hyp
+        return True
+
+    def _parse_batch(self, src_sents, beam_size, debug, compact_hypothesis, recombination):
         args = self.args
         primitive_vocab = self.vocab.primitive
         T = torch.cuda if args.cuda else torch
+        batch_size = len(src_sents)
 
-        src_sent_var = nn_utils.to_input_variable([src_sent], self.vocab.source, cuda=args.cuda, training=False)
+        # the encoder expects utterances sorted by descending length
+        sorted_ids = sorted(range(batch_size), key=lambda i: -len(src_sents[i]))
+        sorted_src_sents = [src_sents[i] for i in sorted_ids]
+        src_sents_var = nn_utils.to_input_variable(sorted_src_sents, self.vocab.source, cuda=args.cuda, training=False)
 
-        # Variable(1, src_sent_len, hidden_size * 2)
-        src_encodings, (last_state, last_cell) = self.encode(src_sent_var, [len(src_sent)])
-        # (1, src_sent_len, hidden_size)
+        # Variable(batch_size, src_sent_len, hidden_size * 2)
+        src_encodings, (last_state, last_cell) = self.encode(src_sents_var, [len(s) for s in sorted_src_sents])
+
+        # restore the original order of the utterances
+        restore_ids = [0] * batch_size
+        for sorted_pos, src_id in enumerate(sorted_ids):
+            restore_ids[src_id] = sorted_pos
+        restore_ids = self.new_long_tensor(restore_ids)
+        src_encodings = src_encodings[restore_ids]
+        last_state, last_cell = last_state[restore_ids], last_cell[restore_ids]
+
+        # (batch_size, src_sent_len, hidden_size)
         src_encodings_att_linear = self.att_src_linear(src_encodings)
+        # (batch_size, src_sent_len), padding positions are masked to one
+        src_token_mask = nn_utils.length_array_to_mask_tensor([len(s) for s in src_sents], cuda=args.cuda).bool()
 
         dec_init_vec = self.init_decoder_state(last_state, last_cell)
         if args.lstm == 'parent_feed':
             h_tm1 = dec_init_vec[0], dec_init_vec[1], \
-                    Variable(self.new_tensor(args.hidden_size).zero_()), \
-                    Variable(self.new_tensor(args.hidden_size).zero_())
+                    Variable(self.new_tensor(batch_size, args.hidden_size).zero_()), \
+                    Variable(self.new_tensor(batch_size, args.hidden_size).zero_())
         else:
             h_tm1 = dec_init_vec
 
         zero_action_embed = Variable(self.new_tensor(args.action_embed_size).zero_())
 
-        with torch.no_grad():
-            hyp_scores = Variable(self.new_tensor([0.]))
-
         # For computing copy probabilities, we marginalize over tokens with the same surface form
         # `aggregated_primitive_tokens` stores the position of occurrence of each source token
-        aggregated_primitive_tokens = OrderedDict()
-        for token_pos, token in enumerate(src_sent):
-            aggregated_primitive_tokens.setdefault(token, []).append(token_pos)
+        aggregated_primitive_tokens = []
+        for src_sent in src_sents:
+            src_aggregated_tokens = OrderedDict()
+            for token_pos, token in enumerate(src_sent):
+                src_aggregated_tokens.setdefault(token, []).append(token_pos)
+            aggregated_primitive_tokens.append(src_aggregated_tokens)
 
-        t = 0
-        hypotheses = [DecodeHypothesis()]
-        hyp_states = [[]]
-        completed_hypotheses = []
+        if args.no_copy is False:
+            # index tensors used to marginalize copy probabilities with `scatter_add`:
+            # `src_token_uniq_ids` maps each source position to the index of its surface form in
+            # `aggregated_primitive_tokens`, `uniq_token_vocab_ids` maps each surface form to its primitive token id
+            # and `uniq_token_oov_mask` marks the surface forms which are not in the primitive vocabulary
+            max_uniq_token_num = max(len(tokens) for tokens in aggregated_primitive_tokens)
+            src_token_uniq_ids = np.zeros((batch_size, src_encodings.size(1)), dtype='int64')
+            uniq_token_vocab_ids = np.zeros((batch_size, max_uniq_token_num), dtype='int64')
+            uniq_token_oov_mask = np.zeros((batch_size, max_uniq_token_num), dtype='bool')
+            uniq_tokens = []
+            for src_id, src_aggregated_tokens in enumerate(aggregated_primitive_tokens):
+                for uniq_id, (token, token_pos_list) in enumerate(src_aggregated_tokens.items()):
+                    src_token_uniq_ids[src_id, token_pos_list] = uniq_id
+                    uniq_token_vocab_ids[src_id, uniq_id] = primitive_vocab[token]
+                    uniq_token_oov_mask[src_id, uniq_id] = token not in primitive_vocab
+                uniq_tokens.append(list(src_aggregated_tokens.keys()))
+            src_token_uniq_ids = self.new_long_tensor(src_token_uniq_ids)
+            uniq_token_vocab_ids = self.new_long_tensor(uniq_token_vocab_ids)
+            uniq_token_oov_mask = torch.from_numpy(uniq_token_oov_mask).to(src_token_uniq_ids.device)
+
+        root_type_id = self.grammar.type2id[self.grammar.root_type]
+        reduce_id = len(self.grammar)
+        action_num = len(self.grammar) + 1 + len(primitive_vocab)
 
-        while len(completed_hypotheses) < beam_size and t < args.decode_max_time_step:
+        t = 0
+        # live hypotheses of all utterances, `hyp_src_ids` maps each of them to its utterance
+        hyp_cls = CompactDecodeHypothesis if compact_hypothesis else DecodeHypothesis
+        hypotheses = [hyp_cls() for _ in range(batch_size)]
+        hyp_src_ids = list(range(batch_size))
+        hyp_states = [[] for _ in range(batch_size)]
+        hyp_scores = Variable(self.new_tensor([0.] * batch_size))
+        completed_hypotheses = [[] for _ in range(batch_size)]
+        # for recombination, the index of the completed hypothesis with each code
+        completed_hyp_ids = [dict() for _ in range(batch_size)]
+
+        while hypotheses and t < args.decode_max_time_step:
             hyp_num = len(hypotheses)
 
+            hyp_src_ids_var = self.new_long_tensor(hyp_src_ids)
             # (hyp_num, src_sent_len, hidden_size * 2)
-            exp_src_encodings = src_encodings.expand(hyp_num, src_encodings.size(1), src_encodings.size(2))
+            exp_src_encodings = src_encodings[hyp_src_ids_var]
             # (hyp_num, src_sent_len, hidden_size)
-            exp_src_encodings_att_linear = src_encodings_att_linear.expand(hyp_num, src_encodings_att_linear.size(1), src_encodings_att_linear.size(2))
+            exp_src_encodings_att_linear = src_encodings_att_linear[hyp_src_ids_var]
+            # (hyp_num, src_sent_len)
+            exp_src_token_mask = src_token_mask[hyp_src_ids_var]
 
             if t == 0:
-                with torch.no_grad():
-                    x = Variable(self.new_tensor(1, self.decoder_lstm.input_size).zero_())
+                x = Variable(self.new_tensor(hyp_num, self.decoder_lstm.input_size).zero_())
                 if args.no_parent_field_type_embed is False:
                     offset = args.action_embed_size  # prev_action
                     offset += args.att_vec_size * (not args.no_input_feed)
                     offset += args.action_embed_size * (not args.no_parent_production_embed)
                     offset += args.field_embed_size * (not args.no_parent_field_embed)
 
-                    x[0, offset: offset + args.type_embed_size] = \
+                    x[:, offset: offset + args.type_embed_size] = \
                         self.type_embed.weight[self.grammar.type2id[self.grammar.root_type]]
             else:
-                actions_tm1 = [hyp.actions[-1] for hyp in hypotheses]
+                actions_tm1 = [hyp.last_action for hyp in hypotheses]
 
                 a_tm1_embeds = []
                 for a_tm1 in actions_tm1:
@@ -672,6 +817,10 @@ class Parser(nn.Module):
                         a_tm1_embeds.append(zero_action_embed)
                 a_tm1_embeds = torch.stack(a_tm1_embeds)
 
+                # ids of the frontier fields, and of their types
+                frontier_field_ids = [self.grammar.field2id[hyp.frontier_field.field] for hyp in hypotheses]
+                frontier_field_type_ids = self.grammar.field_type_ids[frontier_field_ids]
+
                 inputs = [a_tm1_embeds]
                 if args.no_input_feed is False:
                     inputs.append(att_tm1)
@@ -683,16 +832,13 @@ class Parser(nn.Module):
                     inputs.append(frontier_prod_embeds)
                 if args.no_parent_field_embed is False:
                     # frontier field
-                    frontier_fields = [hyp.frontier_field.field for hyp in hypotheses]
-                    frontier_field_embeds = self.field_embed(Variable(self.new_long_tensor([
-                        self.grammar.field2id[field] for field in frontier_fields])))
+                    frontier_field_embeds = self.field_embed(Variable(self.new_long_tensor(frontier_field_ids)))
 
                     inputs.append(frontier_field_embeds)
                 if args.no_parent_field_type_embed is False:
                     # frontier field type
-                    frontier_field_types = [hyp.frontier_field.type for hyp in hypotheses]
-                    frontier_field_type_embeds = self.type_embed(Variable(self.new_long_tensor([
-                        self.grammar.type2id[type] for type in frontier_field_types])))
+                    frontier_field_type_embeds = self.type_embed(Variable(self.new_long_tensor(
+                        frontier_field_type_ids)))
                     inputs.append(frontier_field_type_embeds)
 
                 # parent states
@@ -710,198 +856,198 @@ class Parser(nn.Module):
 
             (h_t, cell_t), att_t = self.step(x, h_tm1, exp_src_encodings,
                                              exp_src_encodings_att_linear,
-                                             src_token_mask=None)
+                                             src_token_mask=exp_src_token_mask)
 
-            # Variable(batch_size, grammar_size)
-            # apply_rule_log_prob = torch.log(F.softmax(self.production_readout(att_t), dim=-1))
+            # Variable(hyp_num, grammar_size)
             apply_rule_log_prob = F.log_softmax(self.production_readout(att_t), dim=-1)
 
-            # Variable(batch_size, primitive_vocab_size)
+            # Variable(hyp_num, primitive_vocab_size)
             gen_from_vocab_prob = F.softmax(self.tgt_token_readout(att_t), dim=-1)
 
             if args.no_copy:
                 primitive_prob = gen_from_vocab_prob
             else:
-                # Variable(batch_size, src_sent_len)
-                primitive_copy_prob = self.src_pointer_net(src_encodings, None, att_t.unsqueeze(0)).squeeze(0)
+                # Variable(hyp_num, src_sent_len)
+                primitive_copy_prob = self.src_pointer_net(exp_src_encodings, exp_src_token_mask,
+                                                           att_t.unsqueeze(0)).squeeze(0)
 
-                # Variable(batch_size, 2)
+                # Variable(hyp_num, 2)
                 primitive_predictor_prob = F.softmax(self.primitive_predictor(att_t), dim=-1)
 
-                # Variable(batch_size, primitive_vocab_size)
+                # Variable(hyp_num, primitive_vocab_size)
                 primitive_prob = primitive_predictor_prob[:, 0].unsqueeze(1) * gen_from_vocab_prob
 
-                # if src_unk_pos_list:
-                #     primitive_prob[:, primitive_vocab.unk_id] = 1.e-10
-
-            gentoken_prev_hyp_ids = []
-            gentoken_new_hyp_unks = []
-            applyrule_new_hyp_scores = []
-            applyrule_new_hyp_prod_ids = []
-            applyrule_prev_hyp_ids = []
-
+                # marginalize the copy probabilities over the positions of each surface form
+                # (hyp_num, max_uniq_token_num)
+                uniq_token_copy_prob = primitive_copy_prob.new_zeros(hyp_num, max_uniq_token_num).scatter_add_(
+                    1, src_token_uniq_ids[hyp_src_ids_var], primitive_copy_prob)
+                gated_copy_prob = primitive_predictor_prob[:, 1].unsqueeze(1) * uniq_token_copy_prob
+
+                exp_uniq_token_oov_mask = uniq_token_oov_mask[hyp_src_ids_var]
+                primitive_prob = primitive_prob.scatter_add(1, uniq_token_vocab_ids[hyp_src_ids_var],
+                                                            gated_copy_prob.masked_fill(exp_uniq_token_oov_mask, 0.))
+
+                # the probability of <unk> is the one of the most likely source token not in the vocabulary,
+                # which becomes the token generated by the hypothesis
+                unk_copy_prob, unk_uniq_ids = gated_copy_prob.masked_fill(~exp_uniq_token_oov_mask, -1.).max(dim=-1)
+                has_unk_copy = exp_uniq_token_oov_mask.any(dim=-1)
+                primitive_prob[:, primitive_vocab.unk_id] = torch.where(has_unk_copy, unk_copy_prob,
+                                                                        primitive_prob[:, primitive_vocab.unk_id])
+
+            # mask the actions which are not valid continuations of the hypotheses
+            frontier_type_ids = []
+            reduce_mask = []
+            gen_token_mask = []
             for hyp_id, hyp in enumerate(hypotheses):
-                # generate new continuations
                 action_types = self.transition_system.get_valid_continuation_types(hyp)
-
-                for action_type in action_types:
-                    if action_type == ApplyRuleAction:
-                        productions = self.transition_system.get_valid_continuating_productions(hyp)
-                        for production in productions:
-                            prod_id = self.grammar.prod2id[production]
-                            prod_score = apply_rule_log_prob[hyp_id, prod_id].data.item()
-                            new_hyp_score = hyp.score + prod_score
-
-                            applyrule_new_hyp_scores.append(new_hyp_score)
-                            applyrule_new_hyp_prod_ids.append(prod_id)
-                            applyrule_prev_hyp_ids.append(hyp_id)
-                    elif action_type == ReduceAction:
-                        action_score = apply_rule_log_prob[hyp_id, len(self.grammar)].data.item()
-                        new_hyp_score = hyp.score + action_score
-
-                        applyrule_new_hyp_scores.append(new_hyp_score)
-                        applyrule_new_hyp_prod_ids.append(len(self.grammar))
-                        applyrule_prev_hyp_ids.append(hyp_id)
-                    else:
-                        # GenToken action
-                        gentoken_prev_hyp_ids.append(hyp_id)
-                        hyp_copy_info = dict()  # of (token_pos, copy_prob)
-                        hyp_unk_copy_info = []
-
-                        if args.no_copy is False:
-                            for token, token_pos_list in aggregated_primitive_tokens.items():
-                                sum_copy_prob = torch.gather(primitive_copy_prob[hyp_id], 0, Variable(T.LongTensor(token_pos_list))).sum()
-                                gated_copy_prob = primitive_predictor_prob[hyp_id, 1] * sum_copy_prob
-
-                                if token in primitive_vocab:
-                                    token_id = primitive_vocab[token]
-                                    primitive_prob[hyp_id, token_id] = primitive_prob[hyp_id, token_id] + gated_copy_prob
-
-                                    hyp_copy_info[token] = (token_pos_list, gated_copy_prob.data.item())
-                                else:
-                                    hyp_unk_copy_info.append({'token': token, 'token_pos_list': token_pos_list,
-                                                              'copy_prob': gated_copy_prob.data.item()})
-
-                        if args.no_copy is False and len(hyp_unk_copy_info) > 0:
-                            unk_i = np.array([x['copy_prob'] for x in hyp_unk_copy_info]).argmax()
-                            token = hyp_unk_copy_info[unk_i]['token']
-                            primitive_prob[hyp_id, primitive_vocab.unk_id] = hyp_unk_copy_info[unk_i]['copy_prob']
-                            gentoken_new_hyp_unks.append(token)
-
-                            hyp_copy_info[token] = (hyp_unk_copy_info[unk_i]['token_pos_list'], hyp_unk_copy_info[unk_i]['copy_prob'])
-
-            new_hyp_scores = None
-            if applyrule_new_hyp_scores:
-                new_hyp_scores = Variable(self.new_tensor(applyrule_new_hyp_scores))
-            if gentoken_prev_hyp_ids:
-                primitive_log_prob = torch.log(primitive_prob)
-                gen_token_new_hyp_scores = (hyp_scores[gentoken_prev_hyp_ids].unsqueeze(1) + primitive_log_prob[gentoken_prev_hyp_ids, :]).view(-1)
-
-                if new_hyp_scores is None: new_hyp_scores = gen_token_new_hyp_scores
-                else: new_hyp_scores = torch.cat([new_hyp_scores, gen_token_new_hyp_scores])
-            top_new_hyp_scores, top_new_hyp_pos = torch.topk(new_hyp_scores,
-                                                             k=min(new_hyp_scores.size(0), beam_size - len(completed_hypotheses)))
+                if ApplyRuleAction in action_types:
+                    frontier_type_ids.append(frontier_field_type_ids[hyp_id] if t > 0 else root_type_id)
+                else:
+                    frontier_type_ids.append(-1)
+                reduce_mask.append(ReduceAction in action_types)
+                gen_token_mask.append(GenTokenAction in action_types)
+
+            frontier_type_ids = self.new_long_tensor(frontier_type_ids)
+            # (hyp_num, grammar_size + 1)
+            apply_rule_mask = self.frontier_type_production_mask[frontier_type_ids.clamp(min=0)]
+            apply_rule_mask &= (frontier_type_ids >= 0).unsqueeze(1)
+            apply_rule_mask[:, reduce_id] = self.new_tensor(reduce_mask).bool()
+            gen_token_mask = self.new_tensor(gen_token_mask).bool().unsqueeze(1)
+            if t > 0:
+                # (hyp_num, primitive_vocab_size), the tokens valid for the types of the primitive frontier fields
+                gen_token_mask = gen_token_mask & self.primitive_type_token_mask[
+                    self.new_long_tensor(frontier_field_type_ids.tolist())]
+
+            # (hyp_num, grammar_size + 1 + primitive_vocab_size)
+            new_hyp_scores = hyp_scores.unsqueeze(1) + torch.cat([
+                apply_rule_log_prob.masked_fill(~apply_rule_mask, -float('inf')),
+                torch.log(primitive_prob).masked_fill(~gen_token_mask, -float('inf'))], dim=-1)
+
+            # one top-k over the candidates of all utterances, padding each utterance to the same number of rows
+            src_ids = sorted(set(hyp_src_ids))
+            src_pos = {src_id: i for i, src_id in enumerate(src_ids)}
+            src_first_hyp_ids = {}
+            hyp_ranks = []
+            for hyp_id, src_id in enumerate(hyp_src_ids):
+                src_first_hyp_ids.setdefault(src_id, hyp_id)
+                hyp_ranks.append(hyp_id - src_first_hyp_ids[src_id])
+            max_hyp_num = max(hyp_ranks) + 1
+
+            src_new_hyp_scores = new_hyp_scores.new_full((len(src_ids), max_hyp_num, action_num), -float('inf'))
+            src_new_hyp_scores[self.new_long_tensor([src_pos[src_id] for src_id in hyp_src_ids]),
+                               self.new_long_tensor(hyp_ranks)] = new_hyp_scores
+            src_new_hyp_scores = src_new_hyp_scores.view(len(src_ids), -1)
+
+            top_k = max(beam_size - len(completed_hypotheses[src_id]) for src_id in src_ids)
+            if recombination:
+                # more candidates to fill the slots of the merged ones
+                top_k = min(2 * top_k, src_new_hyp_scores.size(1))
+            top_new_hyp_scores, top_new_hyp_pos = torch.topk(src_new_hyp_scores, k=top_k, dim=-1)
+            top_new_hyp_scores = top_new_hyp_scores.cpu()
+            top_new_hyp_pos = top_new_hyp_pos.cpu()
 
             live_hyp_ids = []
             new_hypotheses = []
-            for new_hyp_score, new_hyp_pos in zip(top_new_hyp_scores.data.cpu(), top_new_hyp_pos.data.cpu()):
-                action_info = ActionInfo()
-                if new_hyp_pos < len(applyrule_new_hyp_scores):
-                    # it's an ApplyRule or Reduce action
-                    prev_hyp_id = applyrule_prev_hyp_ids[new_hyp_pos]
+            new_hyp_src_ids = []
+            for i, src_id in enumerate(src_ids):
+                src_completed_hypotheses = completed_hypotheses[src_id]
+                src_aggregated_tokens = aggregated_primitive_tokens[src_id]
+                src_top_k = beam_size - len(src_completed_hypotheses)
+                src_new_hyp_num = 0
+                # for recombination, the new live hypothesis with each key
+                src_new_hyps = dict()
+
+                for new_hyp_score, new_hyp_pos in zip(top_new_hyp_scores[i], top_new_hyp_pos[i]):
+                    if src_new_hyp_num == src_top_k:
+                        break
+                    if new_hyp_score == -float('inf'):
+                        # fewer valid candidates than free slots in the beam
+                        break
+
+                    new_hyp_pos = new_hyp_pos.item()
+                    prev_hyp_id = src_first_hyp_ids[src_id] + new_hyp_pos // action_num
                     prev_hyp = hypotheses[prev_hyp_id]
-
-                    prod_id = applyrule_new_hyp_prod_ids[new_hyp_pos]
-                    # ApplyRule action
-                    if prod_id < len(self.grammar):
-                        production = self.grammar.id2prod[prod_id]
-                        action = ApplyRuleAction(production)
-                    # Reduce action
-                    else:
+                    action_id = new_hyp_pos % action_num
+
+                    action_info = ActionInfo()
+                    if action_id < reduce_id:
+                        # ApplyRule action
+                        action = ApplyRuleAction(self.grammar.id2prod[action_id])
+                    elif action_id == reduce_id:
+                        # Reduce action
                         action = ReduceAction()
-                else:
-                    # it's a GenToken action
-                    token_id = (new_hyp_pos - len(applyrule_new_hyp_scores)) % primitive_prob.size(1)
+                    else:
+                        # it's a GenToken action
+                        token_id = action_id - reduce_id - 1
 
-                    k = (new_hyp_pos - len(applyrule_new_hyp_scores)) // primitive_prob.size(1)
-                    # try:
-                    # copy_info = gentoken_copy_infos[k]
-                    prev_hyp_id = gentoken_prev_hyp_ids[k]
-                    prev_hyp = hypotheses[prev_hyp_id]
-                    # except:
-                    #     print('k=%d' % k, file=sys.stderr)
-                    #     print('primitive_prob.size(1)=%d' % primitive_prob.size(1), file=sys.stderr)
-                    #     print('len copy_info=%d' % len(gentoken_copy_infos), file=sys.stderr)
-                    #     print('prev_hyp_id=%s' % ', '.join(str(i) for i in gentoken_prev_hyp_ids), file=sys.stderr)
-                    #     print('len applyrule_new_hyp_scores=%d' % len(applyrule_new_hyp_scores), file=sys.stderr)
-                    #     print('len gentoken_prev_hyp_ids=%d' % len(gentoken_prev_hyp_ids), file=sys.stderr)
-                    #     print('top_new_hyp_pos=%s' % top_new_hyp_pos, file=sys.stderr)
-                    #     print('applyrule_new_hyp_scores=%s' % applyrule_new_hyp_scores, file=sys.stderr)
-                    #     print('new_hyp_scores=%s' % new_hyp_scores, file=sys.stderr)
-                    #     print('top_new_hyp_scores=%s' % top_new_hyp_scores, file=sys.stderr)
-                    #
-                    #     torch.save((applyrule_new_hyp_scores, primitive_prob), 'data.bin')
-                    #
-                    #     # exit(-1)
-                    #     raise ValueError()
-
-                    if token_id == primitive_vocab.unk_id:
-                        if gentoken_new_hyp_unks:
-                            token = gentoken_new_hyp_unks[k]
+                        if token_id == primitive_vocab.unk_id and args.no_copy is False and has_unk_copy[prev_hyp_id]:
+                            token = uniq_tokens[src_id][unk_uniq_ids[prev_hyp_id].item()]
                         else:
-                            token = primitive_vocab.id2word[primitive_vocab.unk_id]
-                    else:
-                        token = primitive_vocab.id2word[token_id.item()]
+                            token = primitive_vocab.id2word[token_id]
+
+                        assert(type(token) == str)
+                        action = GenTokenAction(token)
+
+                        if token in src_aggregated_tokens:
+                            action_info.copy_from_src = True
+                            action_info.src_token_position = src_aggregated_tokens[token]
+
+                        if debug:
+                            action_info.gen_copy_switch = 'n/a' if args.no_copy else primitive_predictor_prob[prev_hyp_id, :].log().cpu().data.numpy()
+                            action_info.in_vocab = token in primitive_vocab
+                            action_info.gen_token_prob = gen_from_vocab_prob[prev_hyp_id, token_id].log().cpu().data.item() \
+                                if token in primitive_vocab else 'n/a'
+                            action_info.copy_token_prob = torch.gather(primitive_copy_prob[prev_hyp_id],
+                                                                       0,
+                                                                       Variable(T.LongTensor(action_info.src_token_position))).sum().log().cpu().data.item() \
+                                if args.no_copy is False and action_info.copy_from_src else 'n/a'
+
+                    action_info.action = action
+                    action_info.t = t
+                    if t > 0:
+                        action_info.parent_t = prev_hyp.frontier_node.created_time
+                        action_info.frontier_prod = prev_hyp.frontier_node.production
+                        action_info.frontier_field = prev_hyp.frontier_field.field
 
-                    assert(type(token) == str)
-                    action = GenTokenAction(token)
+                    if debug:
+                        action_info.action_prob = new_hyp_score - prev_hyp.score
 
-                    if token in aggregated_primitive_tokens:
-                        action_info.copy_from_src = True
-                        action_info.src_token_position = aggregated_primitive_tokens[token]
+                    new_hyp = prev_hyp.clone_and_apply_action_info(action_info)
+                    new_hyp.score = new_hyp_score
 
-                    if debug:
-                        action_info.gen_copy_switch = 'n/a' if args.no_copy else primitive_predictor_prob[prev_hyp_id, :].log().cpu().data.numpy()
-                        action_info.in_vocab = token in primitive_vocab
-                        action_info.gen_token_prob = gen_from_vocab_prob[prev_hyp_id, token_id].log().cpu().data.item() \
-                            if token in primitive_vocab else 'n/a'
-                        action_info.copy_token_prob = torch.gather(primitive_copy_prob[prev_hyp_id],
-                                                                   0,
-                                                                   Variable(T.LongTensor(action_info.src_token_position))).sum().log().cpu().data.item() \
-                            if args.no_copy is False and action_info.copy_from_src else 'n/a'
-
-                action_info.action = action
-                action_info.t = t
-                if t > 0:
-                    action_info.parent_t = prev_hyp.frontier_node.created_time
-                    action_info.frontier_prod = prev_hyp.frontier_node.production
-                    action_info.frontier_field = prev_hyp.frontier_field.field
-
-                if debug:
-                    action_info.action_prob = new_hyp_score - prev_hyp.score
-
-                new_hyp = prev_hyp.clone_and_apply_action_info(action_info)
-                new_hyp.score = new_hyp_score
-
-                if new_hyp.completed:
-                    # add length normalization
-                    new_hyp.score /= (t+1)
-                    completed_hypotheses.append(new_hyp)
-                else:
-                    new_hypotheses.append(new_hyp)
-                    live_hyp_ids.append(prev_hyp_id)
+                    if new_hyp.completed:
+                        if compact_hypothesis:
+                            new_hyp = new_hyp.to_decode_hypothesis()
+
+                        # add length normalization
+                        new_hyp.score /= (t+1)
+                        if recombination:
+                            if not self._add_completed_hypothesis(new_hyp, src_completed_hypotheses,
+                                                                  completed_hyp_ids[src_id]):
+                                continue
+                        else:
+                            src_completed_hypotheses.append(new_hyp)
+                    else:
+                        if recombination and not self._add_live_hypothesis(new_hyp, src_new_hyps, recombination):
+                            continue
+                        new_hypotheses.append(new_hyp)
+                        new_hyp_src_ids.append(src_id)
+                        live_hyp_ids.append(prev_hyp_id)
+                    src_new_hyp_num += 1
 
             if live_hyp_ids:
                 hyp_states = [hyp_states[i] + [(h_t[i], cell_t[i])] for i in live_hyp_ids]
                 h_tm1 = (h_t[live_hyp_ids], cell_t[live_hyp_ids])
                 att_tm1 = att_t[live_hyp_ids]
                 hypotheses = new_hypotheses
+                hyp_src_ids = new_hyp_src_ids
                 hyp_scores = Variable(self.new_tensor([hyp.score for hyp in hypotheses]))
                 t += 1
             else:
                 break
 
-        completed_hypotheses.sort(key=lambda hyp: -hyp.score)
+        for src_completed_hypotheses in completed_hypotheses:
+            src_completed_hypotheses.sort(key=lambda hyp: -hyp.score)
 
         return completed_hypotheses
 
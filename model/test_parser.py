@@ -0,0 +1,124 @@
+# coding=utf-8
+
+import os
+
+import torch
+
+import javalang.parse
+from asdl.asdl import ASDLGrammar
+from asdl.hypothesis import GenTokenAction
+from asdl.lang.java.java_asdl_helper import java_ast_to_action_infos
+from asdl.lang.java.java_transition_system import JavaTransitionSystem
+from common.utils import init_arg_parser
+from components.decode_hypothesis import DecodeHypothesis
+from components.vocab import Vocab, VocabEntry
+from model.parser import Parser
+
+asdl_file = os.path.join(os.path.dirname(__file__), '..', 'asdl', 'lang', 'java', 'java_asdl.simplified.txt')
+grammar = ASDLGrammar.from_file(asdl_file, ('typedeclaration', 'MethodDeclaration'))
+transition_system = JavaTransitionSystem(grammar)
+
+
+def tiny_parser(*args):
+    """a small randomly initialized parser on the CPU"""
+    torch.manual_seed(0)
+    parser_args = init_arg_parser().parse_args(['--mode', 'test', '--embed_size', '8', '--action_embed_size', '8',
+                                                '--field_embed_size', '4', '--type_embed_size', '4',
+                                                '--hidden_size', '16', '--att_vec_size', '8',
+                                                '--decode_max_time_step', '30'] + list(args))
+    source = VocabEntry.from_corpus([['add', 'a', 'b', 'x', 'y']], 100, 0)
+    primitive = VocabEntry.from_corpus([['add', 'f', 'a', 'b', 'x', '1', '"b"', 'int', 'void', 'a b', '</primitive>']],
+                                       100, 0)
+    parser = Parser(parser_args, Vocab(source=source, primitive=primitive, code=primitive), transition_system)
+    parser.eval()
+
+    return parser
+
+
+def hypothesis(code, score):
+    hyp = DecodeHypothesis()
+    for action_info in java_ast_to_action_infos(javalang.parse.parse_member_declaration(code), grammar):
+        hyp = hyp.clone_and_apply_action_info(action_info)
+    hyp.score = torch.tensor(score)
+
+    return hyp
+
+
+def test_completed_hypotheses_with_the_same_code_are_merged():
+    parser = tiny_parser()
+    completed_hypotheses, completed_hyp_ids = [], dict()
+    hyps = [hypothesis('int f() { return 1; }', -2.), hypothesis('int f() { return 1; }', -1.),
+            hypothesis('int f() { return x; }', -3.)]
+    assert hyps[0].completed
+
+    assert [parser._add_completed_hypothesis(hyp, completed_hypotheses, completed_hyp_ids)
+            for hyp in hyps] == [True, False, True]
+    # with both recombinations, the best of the completed hypotheses is kept
+    assert completed_hypotheses == [hyps[1], hyps[2]]
+
+
+def test_live_hypotheses_with_the_same_key_are_merged():
+    for recombination, merged_score in (('max', torch.tensor(-1.)),
+                                        ('logsumexp', torch.logaddexp(torch.tensor(-1.), torch.tensor(-2.)))):
+        new_hyps = dict()
+        hyps = [hypothesis('int f() { return 1; }', -1.), hypothesis('int f() { return 1; }', -2.),
+                hypothesis('int f() { return x; }', -3.)]
+        assert hyps[0].recombination_key == hyps[1].recombination_key
+
+        assert [Parser._add_live_hypothesis(hyp, new_hyps, recombination) for hyp in hyps] == [True, False, True]
+        assert list(new_hyps.values()) == [hyps[0], hyps[2]]
+        assert torch.allclose(hyps[0].score, merged_score), recombination
+
+
+def test_unrenderable_completed_hypothesis_is_keyed_on_its_fingerprint():
+    class FailingTransitionSystem(JavaTransitionSystem):
+        def ast_to_surface_code(self, asdl_ast):
+            raise KeyError('Annotation')
+
+    parser = tiny_parser()
+    parser.transition_system = FailingTransitionSystem(grammar)
+    hyp = hypothesis('int f() { return 1; }', -1.)
+    assert parser._completed_hypothesis_key(hyp) == hyp.tree.fingerprint
+
+
+src_sents = [['add', 'a', 'b'], ['a', 'b'], ['b', 'add'], ['add'], ['x', 'y'], ['a']]
+
+
+def hypotheses_repr(hyps):
+    return [(repr(hyp.actions), round(float(hyp.score), 4)) for hyp in hyps]
+
+
+def test_parse_batch_is_parse_of_each_utterance():
+    parser = tiny_parser()
+    batch_hyps = parser.parse_batch(src_sents, beam_size=4)
+
+    assert [hypotheses_repr(hyps) for hyps in batch_hyps] == \
+           [hypotheses_repr(parser.parse(src_sent, beam_size=4)) for src_sent in src_sents]
+    assert any(batch_hyps)
+
+
+def test_compact_hypotheses_give_the_same_hypotheses():
+    parser = tiny_parser()
+    compact_hyps = parser.parse_batch(src_sents, beam_size=4, compact_hypothesis=True)
+
+    assert [hypotheses_repr(hyps) for hyps in compact_hyps] == \
+           [hypotheses_repr(hyps) for hyps in parser.parse_batch(src_sents, beam_size=4)]
+    for hyps in compact_hyps:
+        assert all(type(hyp) is DecodeHypothesis and hyp.completed for hyp in hyps)
+
+
+def test_generated_tokens_are_valid_for_their_field():
+    parser = tiny_parser()
+    identifier_type = next(t for t in grammar.primitive_types if t.name == 'identifier')
+    # the vocabulary has tokens which are not identifiers
+    assert not all(transition_system.is_valid_primitive_token(identifier_type, token)
+                   for token in parser.vocab.primitive.word2id)
+    gen_token_num = 0
+    for hyps in parser.parse_batch(src_sents, beam_size=4):
+        for hyp in hyps:
+            for action_info in hyp.action_infos:
+                if isinstance(action_info.action, GenTokenAction):
+                    gen_token_num += 1
+                    assert transition_system.is_valid_primitive_token(action_info.frontier_field.type,
+                                                                      action_info.action.token), action_info
+    assert gen_token_num